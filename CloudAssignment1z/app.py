@@ -1,12 +1,32 @@
-from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, flash, jsonify, send_from_directory, abort, Response, stream_with_context, g, has_request_context
 import csv
 import os
 import io
+import json
+import base64
+import threading
+import contextvars
+import time
+import urllib.parse
+import hashlib
+import inspect
+import itertools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from azure.storage.blob import BlobServiceClient
-from azure.data.tables import TableServiceClient, TableEntity
+from azure.data.tables import UpdateMode
 from azure.identity import DefaultAzureCredential
-from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceNotFoundError, ResourceModifiedError
+from azure.storage.blob import ContentSettings
+from storage import AzureStorage, LocalStorage
+from images import make_variants, IMMUTABLE_CACHE_CONTROL
+from cache import ResultCache
+from batching import iter_csv_rows, batches, write_batch
+from dedupe import BlobHashIndex, read_and_hash, upload_deduplicated
+from resilience import CallPolicy, CircuitBreaker, GuardedStorage, StorageUnavailable
+from telemetry import Telemetry, current_route, current_trace
+from jobs import JobStore, JobRunner, describe as describe_job
+from salary_stats import SalaryStats, PERCENTILES
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'cloud-picture-storage-secret')
@@ -14,54 +34,787 @@ app.secret_key = os.environ.get('SECRET_KEY', 'cloud-picture-storage-secret')
 # Azure Storage configuration - Uses Azure Managed Identity (no secrets needed!)
 STORAGE_ACCOUNT_NAME = os.environ.get('AZURE_STORAGE_ACCOUNT_NAME', 'storagebtn1609')
 
-# Initialize Azure clients using DefaultAzureCredential (no keys needed!)
-blob_service = None
-table_service = None
+# Size of the keep-alive connection pool shared by the blob and table clients
+AZURE_POOL_SIZE = int(os.environ.get('AZURE_POOL_SIZE', 20))
 
-def init_azure_services():
-    """Initialize Azure services with proper error handling"""
-    global blob_service, table_service
+# 'azure' (default) or 'local' to run entirely offline on SQLite + a blob directory
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'azure')
+LOCAL_STORAGE_DIR = os.environ.get('LOCAL_STORAGE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_storage'))
+# Median injected latency per local storage call, to approximate a real account
+LOCAL_STORAGE_LATENCY_MS = float(os.environ.get('LOCAL_STORAGE_LATENCY_MS', 0))
+# Fraction of local storage calls that fail with a transient error, for exercising retries
+LOCAL_STORAGE_FAILURE_RATE = float(os.environ.get('LOCAL_STORAGE_FAILURE_RATE', 0))
+
+# Every storage call made while handling a request shares this budget (seconds);
+# a single attempt never waits longer than STORAGE_ATTEMPT_TIMEOUT.
+STORAGE_REQUEST_BUDGET = float(os.environ.get('STORAGE_REQUEST_BUDGET', 10))
+STORAGE_ATTEMPT_TIMEOUT = float(os.environ.get('STORAGE_ATTEMPT_TIMEOUT', 4))
+STORAGE_MAX_ATTEMPTS = int(os.environ.get('STORAGE_MAX_ATTEMPTS', 3))
+# Consecutive transient failures before a service's circuit opens, and how long it stays open
+STORAGE_BREAKER_THRESHOLD = int(os.environ.get('STORAGE_BREAKER_THRESHOLD', 5))
+STORAGE_BREAKER_RESET = float(os.environ.get('STORAGE_BREAKER_RESET', 30))
+
+# Uploads are spooled here and imported by background jobs; progress is at /jobs/<id>
+INGEST_JOB_DIR = os.environ.get('INGEST_JOB_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest_jobs'))
+INGEST_WORKERS = int(os.environ.get('INGEST_WORKERS', 2))
+# How often each process looks for queued or orphaned jobs (seconds)
+INGEST_SCAN_INTERVAL = float(os.environ.get('INGEST_SCAN_INTERVAL', 5))
+# Finished and failed jobs are deleted once they are this old (seconds)
+INGEST_JOB_RETENTION = float(os.environ.get('INGEST_JOB_RETENTION', 7 * 24 * 3600))
+
+# /salary_stats is kept up to date as people change, and fully recomputed this often (seconds)
+SALARY_STATS_REFRESH = float(os.environ.get('SALARY_STATS_REFRESH', 900))
+
+# The storage backend is created lazily on first use (no keys needed - DefaultAzureCredential)
+# so importing the app and booting a gunicorn worker never waits on the network.
+_storage = None
+_storage_lock = threading.Lock()
+
+# None while the background readiness probe is running, then True/False
+azure_available = None
+
+# Per-route storage call counters and latency histograms, served at /metrics
+telemetry = Telemetry()
+# When set, one JSON line per request listing its storage calls is appended here
+STORAGE_TRACE_LOG = os.environ.get('STORAGE_TRACE_LOG')
+_trace_lock = threading.Lock()
+
+def write_trace(record):
+    with _trace_lock, open(STORAGE_TRACE_LOG, 'a', encoding='utf-8') as log:
+        log.write(json.dumps(record) + '\n')
+
+# The deadline of a request asgi.py serves itself, which has no Flask request context
+async_storage_deadline = contextvars.ContextVar('async_storage_deadline', default=None)
+
+def storage_deadline():
+    """Absolute time.monotonic() deadline for storage calls in the current request, if any"""
+    if has_request_context():
+        return g.get('storage_deadline')
+    return async_storage_deadline.get()
+
+def storage_policy(service):
+    return CallPolicy(
+        CircuitBreaker(service, failure_threshold=STORAGE_BREAKER_THRESHOLD, reset_timeout=STORAGE_BREAKER_RESET),
+        deadline=storage_deadline,
+        max_attempts=STORAGE_MAX_ATTEMPTS,
+        attempt_timeout=STORAGE_ATTEMPT_TIMEOUT,
+        observer=telemetry,
+    )
+
+# One policy per service for the whole process, shared with asgi.py's async backend
+# so both entry points see (and trip) the same circuit breakers
+table_policy = storage_policy('table')
+blob_policy = storage_policy('blob')
+
+def create_storage():
+    """Build the storage backend selected by STORAGE_BACKEND, guarded by deadlines and retries"""
+    if STORAGE_BACKEND == 'local':
+        backend = LocalStorage(LOCAL_STORAGE_DIR, latency_ms=LOCAL_STORAGE_LATENCY_MS,
+                               failure_rate=LOCAL_STORAGE_FAILURE_RATE)
+    else:
+        # This automatically uses Managed Identity when deployed to Azure, or Azure CLI when local.
+        # The SDK's own retries are off so CallPolicy alone decides how long a call may take.
+        backend = AzureStorage(STORAGE_ACCOUNT_NAME, DefaultAzureCredential(), pool_size=AZURE_POOL_SIZE,
+                               retry_total=0, connection_timeout=STORAGE_ATTEMPT_TIMEOUT,
+                               read_timeout=STORAGE_ATTEMPT_TIMEOUT)
+    return GuardedStorage(backend, table_policy=table_policy, blob_policy=blob_policy)
+
+def get_storage():
+    """Return the process-wide storage backend, creating it on first use"""
+    global _storage
+    
+    if _storage is None:
+        with _storage_lock:
+            if _storage is None:
+                try:
+                    _storage = create_storage()
+                except Exception as e:
+                    print(f"⚠️ Could not create {STORAGE_BACKEND} storage backend: {e}")
+                    return None
+    return _storage
+
+def probe_azure_services():
+    """Check that storage is reachable with a single cheap request"""
+    global azure_available
     
     try:
-        # This automatically uses Managed Identity when deployed to Azure, or Azure CLI when local
-        credential = DefaultAzureCredential()
-        blob_service = BlobServiceClient(
-            account_url=f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net", 
-            credential=credential
-        )
-        table_service = TableServiceClient(
-            endpoint=f"https://{STORAGE_ACCOUNT_NAME}.table.core.windows.net", 
-            credential=credential
-        )
-        
-        # Test the connection by trying to list containers (simple test)
-        try:
-            containers = list(blob_service.list_containers())
-            print(f"✅ Connected to Azure using credentials. Found {len(containers)} containers.")
-            return True
-        except Exception as e:
-            print(f"⚠️ Azure authentication test failed: {e}")
-            print(f"⚠️ Storage account: {STORAGE_ACCOUNT_NAME}")
-            print(f"⚠️ Credential type: {type(credential).__name__}")
-            raise e
-        
+        storage = get_storage()
+        if not storage:
+            raise RuntimeError("storage backend could not be created")
+        storage.probe()
+        print(f"✅ Connected to {STORAGE_BACKEND} storage ({STORAGE_ACCOUNT_NAME})")
+        azure_available = True
     except Exception as e:
         print(f"⚠️ Azure connection failed: {e}")
         print(f"⚠️ Storage account name: {STORAGE_ACCOUNT_NAME}")
         print(f"⚠️ Environment variables: PORT={os.environ.get('PORT', 'not set')}, SECRET_KEY={'set' if os.environ.get('SECRET_KEY') else 'not set'}")
-        blob_service = None
-        table_service = None
-        return False
+        azure_available = False
+    return azure_available
+
+@app.before_request
+def start_storage_budget():
+    g.storage_deadline = time.monotonic() + STORAGE_REQUEST_BUDGET
+
+@app.before_request
+def start_telemetry():
+    g.request_started = time.monotonic()
+    current_route.set(request.endpoint or 'unknown')
+    current_trace.set([] if STORAGE_TRACE_LOG else None)
+
+@app.after_request
+def record_telemetry(response):
+    route = request.endpoint or 'unknown'
+    telemetry.observe_request(route, response.status_code, time.monotonic() - g.request_started)
+    calls = current_trace.get()
+    if calls is not None:
+        record = {
+            'time': datetime.utcnow().isoformat() + 'Z', 'route': route, 'method': request.method,
+            'path': request.path, 'status': response.status_code, 'calls': calls,
+        }
+        started = g.request_started
+        def finish_trace():
+            # Streamed responses make more calls after this hook, so write once the body is sent
+            record['seconds'] = round(time.monotonic() - started, 6)
+            write_trace(record)
+        response.call_on_close(finish_trace)
+    return response
+
+@app.errorhandler(StorageUnavailable)
+def storage_unavailable(error):
+    return redirect(f'/?messages=❌ {error}')
+
+# Cache for search_name/search_salary results. Writes on this worker invalidate the
+# affected entries immediately; the TTL bounds staleness from writes on other workers.
+SEARCH_CACHE_SIZE = int(os.environ.get('SEARCH_CACHE_SIZE', 256))
+SEARCH_CACHE_TTL = float(os.environ.get('SEARCH_CACHE_TTL', 60))
+search_cache = ResultCache(maxsize=SEARCH_CACHE_SIZE, ttl=SEARCH_CACHE_TTL)
+
+# search_salary results are streamed a page at a time. Pages are built from whole
+# service pages, so a results page holds SALARY_PAGE_SIZE or more cards.
+SALARY_PAGE_SIZE = int(os.environ.get('SALARY_PAGE_SIZE', 50))
+SALARY_SCAN_PAGE_SIZE = int(os.environ.get('SALARY_SCAN_PAGE_SIZE', 200))
+
+# Which blob in the images container holds which content, so identical pictures aren't re-sent
+blob_index = BlobHashIndex()
+
+def warm_blob_index(blob_container):
+    """Index the container's existing blobs once; uploads still dedupe by name if this fails"""
+    try:
+        blob_index.warm(blob_container)
+    except Exception as e:
+        print(f"⚠️ Could not list images for deduplication: {e}")
+
+# Shared pool for uploading image variants in parallel
+_upload_pool = ThreadPoolExecutor(max_workers=6, thread_name_prefix='blob-upload')
+
+# Probe in the background so startup doesn't block on it; routes still work if it fails
+threading.Thread(target=probe_azure_services, name='azure-probe', daemon=True).start()
+
+# People live in the 'person' partition keyed by their normalized name, so every
+# lookup by name is a single point read instead of a partition scan.
+PERSON_PARTITION = 'person'
+# Rows written before RowKeys were normalized (or whose RowKey was generated)
+# get an entry here mapping the normalized name to the real RowKey.
+NAME_INDEX_PARTITION = 'name_index'
+# Fields /update_person can't change: they identify the row, and the RowKey is
+# derived from the Name, so changing either would hide the person from lookups
+IDENTITY_FIELDS = ['PartitionKey', 'RowKey', 'Name']
+
+# Properties each query path asks the service for, so nothing else is downloaded
+KEY_FIELDS = ['PartitionKey', 'RowKey']
+CARD_FIELDS = ['RowKey', 'Name', 'State', 'Salary', 'Picture', 'PictureThumb']
+DETAIL_FIELDS = CARD_FIELDS + ['Grade', 'Room', 'Phone', 'Keywords', 'PictureDetail']
+
+def to_plain(entity, fields):
+    """Copy the given fields out of a table entity as plain Python values.
+
+    Typed values come back from the SDK as EntityProperty objects; unwrapping
+    them once here means rendering code never has to check.
+    """
+    person = {}
+    for field in fields:
+        value = entity.get(field, '')
+        if hasattr(value, 'value'):
+            value = value.value
+        person[field] = '' if value is None else value
+    return person
+
+def display_value(value):
+    """Text shown for a field, with N/A for missing values"""
+    return str(value) if value not in ('', None) else 'N/A'
+
+def person_row_key(name):
+    """Normalize a person's name into the RowKey used for point lookups"""
+    # RowKeys may not contain /, backslash, #, ? or control characters
+    cleaned = "".join(c for c in str(name) if c not in '/\\#?' and c.isprintable())
+    return " ".join(cleaned.split()).lower()
+
+def load_name_index(table_client):
+    """The whole name index as {normalized name: RowKey of the legacy row}"""
+    return {
+        entry['RowKey']: entry['PersonRowKey']
+        for entry in table_client.query_entities(
+            f"PartitionKey eq '{NAME_INDEX_PARTITION}'", select=['RowKey', 'PersonRowKey']
+        )
+    }
+
+def person_entity_from_csv(row, count, name_index=None):
+    """Table entity for one row of an uploaded people CSV.
+
+    A person with a legacy row (see load_name_index) keeps that RowKey, so
+    uploading the same CSV again updates them instead of adding a second row.
+    """
+    row_key = person_row_key(row.get('Name', ''))
+    if row_key and name_index:
+        row_key = name_index.get(row_key, row_key)
+    return {
+        'PartitionKey': PERSON_PARTITION,
+        'RowKey': row_key or f'person_{count}',
+        'Name': row.get('Name', ''),
+        'State': row.get('State', ''),
+        'Salary': row.get('Salary', ''),
+        'Grade': row.get('Grade', ''),
+        'Room': row.get('Room', ''),
+        'Phone': row.get('Phone', ''),
+        'Picture': row.get('Picture', ''),
+        'Keywords': row.get('Keywords', '')
+    }
+
+class TableCall:
+    """One call on the people table, yielded by the *_steps generators below.
+
+    The storage logic of the routes asgi.py also serves is written once, as
+    generators that yield a TableCall for each storage call and are sent its
+    result (or have its error raised where they yielded). run_steps and
+    stream_steps make the calls here, blocking; asgi.py awaits them. A
+    'query_page' call returns one service page as (entities, next token).
+    """
+
+    def __init__(self, method, *args, **kwargs):
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+
+def query_page(table_client, query_filter, continuation_token=None, **kwargs):
+    """One service page of a query: (entities, continuation token of the next page or None)"""
+    pages = table_client.query_entities(query_filter, **kwargs).by_page(continuation_token=continuation_token)
+    page = list(next(pages, []))
+    return page, pages.continuation_token
+
+def call_table(table_client, call):
+    if call.method == 'query_page':
+        return query_page(table_client, *call.args, **call.kwargs)
+    return getattr(table_client, call.method)(*call.args, **call.kwargs)
+
+def stream_steps(table_client, steps):
+    """Run steps with blocking calls, yielding the str chunks they produce; returns what steps returns"""
+    result = error = None
+    while True:
+        try:
+            item = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result = error = None
+        if not isinstance(item, TableCall):
+            yield item
+            continue
+        try:
+            result = call_table(table_client, item)
+        except Exception as e:
+            error = e
+
+def run_steps(table_client, steps):
+    """Run steps that produce no output with blocking calls; returns what steps returns"""
+    try:
+        chunk = next(stream_steps(table_client, steps))
+    except StopIteration as done:
+        return done.value
+    raise TypeError(f"Unexpected output from steps: {chunk!r}")
+
+def find_person_steps(name, select=None):
+    """Point-read a person by name, following the name index for legacy rows.
+
+    Returns (entity, index_entry); both are None when the person does not exist.
+    index_entry is only set when the person was reached through the name index.
+    """
+    row_key = person_row_key(name)
+    if not row_key:
+        return None, None
+    
+    try:
+        return (yield TableCall('get_entity', partition_key=PERSON_PARTITION, row_key=row_key, select=select)), None
+    except ResourceNotFoundError:
+        pass
+    
+    try:
+        index_entry = yield TableCall('get_entity', partition_key=NAME_INDEX_PARTITION, row_key=row_key)
+        person = yield TableCall(
+            'get_entity',
+            partition_key=PERSON_PARTITION,
+            row_key=index_entry['PersonRowKey'],
+            select=select
+        )
+        return person, index_entry
+    except ResourceNotFoundError:
+        return None, None
+
+def find_person(table_client, name, select=None):
+    """find_person_steps with blocking calls"""
+    return run_steps(table_client, find_person_steps(name, select))
+
+def merge_person_steps(person, changes):
+    """Merge changed fields into a person, failing if it was modified since it was read"""
+    patch = {'PartitionKey': person['PartitionKey'], 'RowKey': person['RowKey']}
+    patch.update(changes)
+    yield TableCall(
+        'update_entity',
+        patch,
+        mode=UpdateMode.MERGE,
+        etag=person.metadata['etag'],
+        match_condition=MatchConditions.IfNotModified
+    )
+
+def merge_person(table_client, person, changes):
+    run_steps(table_client, merge_person_steps(person, changes))
+
+def person_picture_url(storage, person, variant_field):
+    """URL of a person's resized picture, falling back to the original upload"""
+    blob_name = person.get(variant_field) or person.get('Picture')
+    return storage.blob_url('images', blob_name) if blob_name else ""
+
+def find_people_by_name_steps(search_term, exact_match_only):
+    """Scan the people partition for names matching search_term.
+
+    Returns (matching_people, row_keys) in the shape search_cache expects.
+    """
+    matching_people = []
+
+    # Convert search term to lowercase for case-insensitive comparison
+    search_term_lower = search_term.lower()
+
+    # Get all people from the table for flexible searching, a service page at a time
+    token = None
+    while True:
+        page, token = yield TableCall('query_page', "PartitionKey eq 'person'", select=CARD_FIELDS,
+                                      continuation_token=token)
+        for entity in page:
+            person = to_plain(entity, CARD_FIELDS)
+            person_name = str(person['Name'])
+
+            # Skip entities with empty, null, or invalid names
+            if not person_name or person_name.lower().strip() in ['', 'n/a', 'null', 'none', 'na']:
+                continue
+
+            # Check for matches based on search type
+            if exact_match_only:
+                # Exact match (case-insensitive)
+                if search_term_lower == person_name.lower():
+                    matching_people.append(person)
+            else:
+                # Partial match (case-insensitive)
+                if search_term_lower in person_name.lower():
+                    matching_people.append(person)
+        if token is None:
+            break
+
+    return matching_people, [person['RowKey'] for person in matching_people]
+
+def salary_matches(person, comparison, target_salary):
+    """Whether a person (see to_plain) belongs in an under/over target_salary search"""
+    try:
+        # First, check if this person has a valid name
+        person_name = str(person.get('Name', ''))
+        
+        # Skip entities with empty, null, or invalid names
+        if not person_name or person_name.lower().strip() in ['', 'n/a', 'null', 'none', 'na']:
+            return False
+        
+        # Clean up the salary string
+        salary_str = str(person.get('Salary', '0')).replace('$', '').replace(',', '').strip()
+        
+        # Check if we have a valid numeric salary
+        if salary_str and salary_str.replace('.', '').replace('-', '').isdigit():
+            salary = float(salary_str)
+            
+            # Apply the comparison logic
+            if comparison == 'under':
+                return salary < target_salary
+            return salary > target_salary
+        
+        # For non-numeric salaries (N/A, empty, etc.), assume unknown salaries are "low"
+        return comparison == 'under'
+    
+    except (ValueError, AttributeError) as e:
+        print(f"Error processing salary for entity: {e}")
+        # Include people with invalid salary data in "under" searches only
+        return comparison == 'under'
+
+def salary_page_steps(comparison, target_salary, continuation_token=None):
+    """Scan one service page of the people partition; returns (matching_people, scanned, next_token).
+
+    next_token resumes the scan after that page, and is None after the last one.
+    """
+    page, next_token = yield TableCall(
+        'query_page', "PartitionKey eq 'person'", select=CARD_FIELDS, results_per_page=SALARY_SCAN_PAGE_SIZE,
+        continuation_token=continuation_token
+    )
+    people = [to_plain(entity, CARD_FIELDS) for entity in page]
+    matching_people = [person for person in people if salary_matches(person, comparison, target_salary)]
+    return matching_people, len(people), next_token
+
+def encode_cursor(continuation_token, shown):
+    """Opaque URL-safe page cursor from a table continuation token"""
+    data = json.dumps({'token': continuation_token, 'shown': shown}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+        return data['token'], int(data['shown'])
+    except Exception:
+        raise ValueError("Invalid page cursor")
+
+def person_card_html(storage, person):
+    """Clickable summary card linking to the person's detail page"""
+    picture_url = person_picture_url(storage, person, 'PictureThumb')
+    person_name = display_value(person.get('Name'))
+    # URL encode the name to handle special characters and spaces
+    encoded_name = urllib.parse.quote(person_name)
+    return f'''
+                <a href="/search_name?exact_name={encoded_name}" class="person-card">
+                    <h3>👤 {person_name}</h3>
+                    {f'<img src="{picture_url}" alt="{person_name}">' if picture_url else '<p>📷 No picture</p>'}
+                    <p><strong>State:</strong> {display_value(person.get('State'))}</p>
+                    <p><strong>Salary:</strong> ${display_value(person.get('Salary'))}</p>
+                    <p class="click-hint">Click to view details →</p>
+                </a>
+                '''
+
+def person_detail_html(storage, person, search_term):
+    """Detail page for one person (see to_plain with DETAIL_FIELDS), with edit and remove forms"""
+    picture_url = person_picture_url(storage, person, 'PictureDetail')
+    return f'''
+                <div style="font-family: Arial; max-width: 800px; margin: 50px auto; padding: 20px;">
+                    <h1>🔍 Search Results for: "{search_term}"</h1>
+                    <div style="border: 2px solid #4facfe; padding: 20px; border-radius: 10px; background: white;">
+                        <h2>👤 {display_value(person.get('Name'))}</h2>
+                        {f'<img src="{picture_url}" alt="{display_value(person.get("Name"))}" style="max-width: 200px; margin: 10px 0; border-radius: 8px;">' if picture_url else '<p>📷 No picture available</p>'}
+                        <p><strong>State:</strong> {display_value(person.get('State'))}</p>
+                        <p><strong>Salary:</strong> ${display_value(person.get('Salary'))}</p>
+                        <p><strong>Grade:</strong> {display_value(person.get('Grade'))}</p>
+                        <p><strong>Room:</strong> {display_value(person.get('Room'))}</p>
+                        <p><strong>Phone:</strong> {display_value(person.get('Phone'))}</p>
+                        <p><strong>Keywords:</strong> {display_value(person.get('Keywords'))}</p>
+                        
+                        <!-- Edit and Remove Actions -->
+                        <div style="margin-top: 25px; border-top: 1px solid #eee; padding-top: 20px;">
+                            <h3 style="color: #333; margin-bottom: 15px;">⚙️ Actions</h3>
+                            
+                            <!-- Quick Edit Form -->
+                            <div style="background: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 15px;">
+                                <h4 style="margin: 0 0 10px 0; color: #666;">✏️ Quick Edit</h4>
+                                <form action="/update_person" method="post" style="display: flex; gap: 10px; flex-wrap: wrap; align-items: end;">
+                                    <input type="hidden" name="name" value="{display_value(person.get('Name'))}">
+                                    <div>
+                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">Field:</label>
+                                        <select name="field" required style="padding: 8px; border: 1px solid #ddd; border-radius: 4px;">
+                                            <option value="State">State</option>
+                                            <option value="Salary">Salary</option>
+                                            <option value="Grade">Grade</option>
+                                            <option value="Room">Room</option>
+                                            <option value="Phone">Phone</option>
+                                            <option value="Keywords">Keywords</option>
+                                        </select>
+                                    </div>
+                                    <div>
+                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">New Value:</label>
+                                        <input type="text" name="value" required style="padding: 8px; border: 1px solid #ddd; border-radius: 4px; min-width: 150px;">
+                                    </div>
+                                    <button type="submit" style="padding: 8px 15px; background: #28a745; color: white; border: none; border-radius: 4px; cursor: pointer;">Update</button>
+                                </form>
+                            </div>
+                            
+                            <!-- Update Profile Picture -->
+                            <div style="background: #f0f9ff; padding: 15px; border-radius: 8px; margin-bottom: 15px; border: 1px solid #bfdbfe;">
+                                <h4 style="margin: 0 0 10px 0; color: #1e40af;">📸 Update Profile Picture</h4>
+                                <form action="/update_person_image" method="post" enctype="multipart/form-data" style="display: flex; gap: 10px; flex-wrap: wrap; align-items: end;">
+                                    <input type="hidden" name="name" value="{display_value(person.get('Name'))}">
+                                    <div>
+                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">Choose Image:</label>
+                                        <input type="file" name="image_file" accept="image/*" required 
+                                               style="padding: 8px; border: 1px solid #ddd; border-radius: 4px; background: white;">
+                                    </div>
+                                    <button type="submit" style="padding: 8px 15px; background: #3b82f6; color: white; border: none; border-radius: 4px; cursor: pointer;">Upload Image</button>
+                                </form>
+                                <small style="color: #666; font-size: 11px;">Supported formats: JPG, PNG, GIF. Image will be stored in Azure Blob Storage.</small>
+                            </div>
+                            
+                            <!-- Remove Person -->
+                            <div style="background: #fff5f5; padding: 15px; border-radius: 8px; border: 1px solid #fed7d7;">
+                                <h4 style="margin: 0 0 10px 0; color: #e53e3e;">🗑️ Remove Person</h4>
+                                <form action="/remove_person" method="post" style="display: flex; gap: 10px; align-items: center;">
+                                    <input type="hidden" name="name" value="{display_value(person.get('Name'))}">
+                                    <span style="color: #666; font-size: 14px;">This action cannot be undone.</span>
+                                    <button type="submit" onclick="return confirm('Are you sure you want to remove {display_value(person.get('Name'))}? This cannot be undone!')" 
+                                            style="padding: 8px 15px; background: #dc3545; color: white; border: none; border-radius: 4px; cursor: pointer;">Remove Person</button>
+                                </form>
+                            </div>
+                        </div>
+                    </div>
+                    <div style="margin-top: 20px; text-align: center;">
+                        <a href="/" style="display: inline-block; padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px; margin-right: 10px;">← Back to Home</a>
+                        <a href="javascript:history.back()" style="display: inline-block; padding: 10px 20px; background: #6c757d; color: white; text-decoration: none; border-radius: 5px;">← Back to Search</a>
+                    </div>
+                    
+                    <!-- Subtle Design Credit -->
+                    <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
+                        <a href="https://BenjaminNiccum.com" target="_blank" 
+                           style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
+                           onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
+                            Design by BNiccum
+                        </a>
+                    </div>
+                </div>
+                '''
+
+def people_list_html(storage, people, search_term):
+    """Page of clickable cards when a name search matches several people"""
+    cards = "".join(person_card_html(storage, person) for person in people)
+    return f'''
+                <div style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
+                    <h1>🔍 Multiple matches found for: "{search_term}"</h1>
+                    <p style="margin-bottom: 20px;">Found {len(people)} people matching your search:</p>
+                    
+                    <style>
+                        .person-card {{
+                            border: 1px solid #ddd;
+                            padding: 15px;
+                            border-radius: 8px;
+                            min-width: 250px;
+                            background: white;
+                            cursor: pointer;
+                            transition: all 0.3s ease;
+                            margin: 10px;
+                            display: inline-block;
+                            vertical-align: top;
+                            text-decoration: none;
+                            color: inherit;
+                            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+                        }}
+                        .person-card:hover {{
+                            transform: translateY(-5px);
+                            box-shadow: 0 8px 20px rgba(0,0,0,0.15);
+                            border-color: #4facfe;
+                            background: #f8fbff;
+                        }}
+                        .person-card h3 {{
+                            margin: 0 0 10px 0;
+                            color: #333;
+                        }}
+                        .person-card img {{
+                            max-width: 150px;
+                            border-radius: 5px;
+                            margin: 10px 0;
+                            display: block;
+                        }}
+                        .person-card p {{
+                            margin: 5px 0;
+                        }}
+                        .click-hint {{
+                            color: #4facfe;
+                            font-size: 12px;
+                            margin: 15px 0 0 0;
+                            font-weight: bold;
+                        }}
+                    </style>
+                    
+                    <div style="display: flex; flex-wrap: wrap; gap: 20px; margin: 20px 0;">
+                    {cards}
+                    </div>
+                    <a href="/" style="margin-top: 20px; display: inline-block; padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px;">← Back to Home</a>
+                    
+                    <!-- Subtle Design Credit -->
+                    <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
+                        <a href="https://BenjaminNiccum.com" target="_blank" 
+                           style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
+                           onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
+                            Design by BNiccum
+                        </a>
+                    </div>
+                </div>
+                '''
 
-# Try to initialize Azure services on startup, but don't fail if it doesn't work
-azure_available = init_azure_services()
+def parse_salary_search(args):
+    """Validate search_salary's query string.
+
+    Returns (salary_amount, comparison, target_salary, cursor, continuation_token, shown_before);
+    raises ValueError with the message to show the user.
+    """
+    # Handle both new and old parameter formats for backward compatibility
+    salary_amount = args.get('salary_amount') or args.get('max_salary')
+    comparison = args.get('comparison', 'under')  # Default to 'under' for backward compatibility
+    
+    if not salary_amount:
+        raise ValueError("Please enter a salary amount")
+    
+    # Validate the salary input first
+    try:
+        target_salary = float(salary_amount)
+    except ValueError:
+        raise ValueError("Please enter a valid salary number")
+    if target_salary <= 0:
+        raise ValueError("Please enter a positive salary number")
+    
+    # Validate comparison parameter
+    if comparison not in ['under', 'over']:
+        comparison = 'under'
+    
+    continuation_token, shown_before = None, 0
+    cursor = args.get('cursor', '')
+    if cursor:
+        try:
+            continuation_token, shown_before = decode_cursor(cursor)
+        except ValueError:
+            raise ValueError("Invalid results page - please search again")
+    return salary_amount, comparison, target_salary, cursor, continuation_token, shown_before
+
+def salary_header_html(comparison_text, target_salary):
+    """Start of a salary results page, up to where the cards are streamed"""
+    return f'''
+            <div style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
+                <h1>💰 People with salary {comparison_text} ${target_salary:,.0f}</h1>
+                <p style="margin-bottom: 20px;">People matching your criteria:</p>
+                
+                <style>
+                    .person-card {{
+                        border: 1px solid #ddd;
+                        padding: 15px;
+                        border-radius: 8px;
+                        min-width: 250px;
+                        background: white;
+                        cursor: pointer;
+                        transition: all 0.3s ease;
+                        margin: 10px;
+                        display: inline-block;
+                        vertical-align: top;
+                        text-decoration: none;
+                        color: inherit;
+                        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
+                    }}
+                    .person-card:hover {{
+                        transform: translateY(-5px);
+                        box-shadow: 0 8px 20px rgba(0,0,0,0.15);
+                        border-color: #4facfe;
+                        background: #f8fbff;
+                    }}
+                    .person-card h3 {{
+                        margin: 0 0 10px 0;
+                        color: #333;
+                    }}
+                    .person-card img {{
+                        max-width: 150px;
+                        border-radius: 5px;
+                        margin: 10px 0;
+                        display: block;
+                    }}
+                    .person-card p {{
+                        margin: 5px 0;
+                    }}
+                    .click-hint {{
+                        color: #4facfe;
+                        font-size: 12px;
+                        margin: 15px 0 0 0;
+                        font-weight: bold;
+                    }}
+                </style>
+                
+                <div style="display: flex; flex-wrap: wrap; gap: 20px; margin: 20px 0;">
+            '''
+
+def salary_footer_html(shown_before, shown, next_url=None):
+    """End of a salary results page, with a link to the next page when there is one"""
+    next_link = ''
+    if next_url:
+        next_link = f'''<a href="{next_url}" style="padding: 10px 20px; background: #28a745; color: white; text-decoration: none; border-radius: 5px; margin-left: 10px;">Next page →</a>'''
+    
+    return f'''</div>
+            <p style="margin-bottom: 20px;">Showing people {shown_before + 1}–{shown}{'' if next_url else ' (end of results)'}</p>
+            <a href="/" style="padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px;">← Back</a>
+            {next_link}
+            
+            <!-- Subtle Design Credit -->
+            <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
+                <a href="https://BenjaminNiccum.com" target="_blank" 
+                   style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
+                   onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
+                    Design by BNiccum
+                </a>
+            </div>
+            </div>'''
+
+@app.cli.command('build-name-index')
+def build_name_index():
+    """One-off scan that indexes people whose RowKey is not their normalized name.
+
+    A legacy row that an earlier upload already duplicated under the normalized
+    name is folded into that newer row (fields only the legacy row has, such as
+    picture variants, are kept) and deleted, instead of being indexed.
+    """
+    storage = get_storage()
+    if not storage:
+        print("❌ Azure Table Storage not available")
+        return
+    
+    table_client = storage.get_table_client('people')
+    people = {
+        entity['RowKey']: entity
+        for entity in table_client.query_entities(f"PartitionKey eq '{PERSON_PARTITION}'")
+    }
+    indexed, merged = 0, 0
+    for legacy_key, legacy in people.items():
+        row_key = person_row_key(legacy.get('Name', ''))
+        if not row_key or row_key == legacy_key:
+            continue
+        duplicate = people.get(row_key)
+        if duplicate is None:
+            table_client.upsert_entity({
+                'PartitionKey': NAME_INDEX_PARTITION,
+                'RowKey': row_key,
+                'PersonRowKey': legacy_key
+            })
+            indexed += 1
+            continue
+        missing = {field: value for field, value in legacy.items() if field not in duplicate}
+        if missing:
+            merge_person(table_client, duplicate, missing)
+        table_client.delete_entity(partition_key=PERSON_PARTITION, row_key=legacy_key)
+        try:
+            table_client.delete_entity(partition_key=NAME_INDEX_PARTITION, row_key=row_key)
+        except ResourceNotFoundError:
+            pass
+        merged += 1
+    print(f"✅ Indexed {indexed} people whose RowKey differs from their name, "
+          f"merged {merged} duplicate rows into their normalized row")
+
+@app.route('/local_blobs/<container>/<path:blob_name>')
+def local_blob(container, blob_name):
+    """Serve pictures when running on the local storage backend"""
+    storage = get_storage()
+    if STORAGE_BACKEND != 'local' or not storage:
+        abort(404)
+    return send_from_directory(os.path.join(storage.blob_root, container), blob_name)
 
 @app.route('/')
 def index():
     messages = request.args.get('messages', '')
     
     # Show Azure connection status
-    azure_status = "✅ Connected to Azure" if azure_available else "⚠️ Azure services not available"
+    if azure_available is None:
+        azure_status = "⏳ Checking Azure connection..."
+    else:
+        azure_status = "✅ Connected to Azure" if azure_available else "⚠️ Azure services not available"
     
     return f'''
 <!DOCTYPE html>
@@ -278,41 +1031,74 @@ def index():
 </html>
     '''
 
+def job_storage():
+    storage = get_storage()
+    if not storage:
+        raise StorageUnavailable("storage backend could not be created")
+    return storage
+
+def run_csv_job(progress):
+    """Import a spooled people CSV 100 rows per transaction, checkpointing after each"""
+    table_client = job_storage().get_table_client('people')
+    # One query, so every row with a legacy RowKey is written back to that row
+    name_index = load_name_index(table_client)
+    with open(progress.file_path(0), 'rb') as f:
+        # Rows before the checkpoint were written by an earlier run of this job
+        rows = itertools.islice(enumerate(iter_csv_rows(f)), progress.checkpoint, None)
+        entities = (person_entity_from_csv(row, number, name_index) for number, row in rows)
+        checkpoint = progress.checkpoint
+        for batch in batches(entities):
+            written = write_batch(table_client, batch, on_error=progress.error)
+            for entity in written:
+                salary_aggregates.set(entity['RowKey'], entity['State'], entity['Grade'], entity['Salary'])
+            checkpoint += len(batch)
+            progress.advance(len(batch), len(written), checkpoint)
+            # New or changed rows can match any cached search
+            search_cache.clear()
+
+def run_pictures_job(progress):
+    """Upload spooled pictures (skipping ones already stored), checkpointing after each"""
+    blob_container = job_storage().get_container_client('images')
+    warm_blob_index(blob_container)
+    outcomes = progress.job.setdefault('outcomes', {})
+    for number in range(progress.checkpoint, len(progress.job['files'])):
+        filename = progress.job['files'][number]
+        written = 0
+        try:
+            with open(progress.file_path(number), 'rb') as f:
+                data, md5 = read_and_hash(f)
+            outcome = upload_deduplicated(blob_container, blob_index, filename, data, md5)
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            written = 1
+        except StorageUnavailable:
+            raise
+        except Exception as e:
+            print(f"Error uploading {filename}: {e}")
+            progress.error(f"{filename}: {e}")
+        progress.advance(1, written, number + 1)
+
+ingest_jobs = JobStore(INGEST_JOB_DIR, retention_seconds=INGEST_JOB_RETENTION)
+ingest_runner = JobRunner(ingest_jobs, {'csv': run_csv_job, 'pictures': run_pictures_job},
+                          workers=INGEST_WORKERS, retry_on=(StorageUnavailable,))
+# Picks up jobs left unfinished by a restart, and new jobs once a worker is free
+ingest_runner.start_watching(interval=INGEST_SCAN_INTERVAL)
+
+def queue_job(kind, uploads, description):
+    job = ingest_jobs.create(kind, uploads)
+    ingest_runner.submit(job['id'])
+    return redirect(f"/?messages=⏳ Importing {description} in the background - progress at /jobs/{job['id']}")
+
 @app.route('/upload_csv', methods=['POST'])
 def upload_csv():
-    if not table_service:
+    storage = get_storage()
+    if not storage:
         return redirect('/?messages=❌ Azure Table Storage not available')
     
     try:
         file = request.files['csv_file']
         if file and file.filename.endswith('.csv'):
-            csv_content = file.read().decode('utf-8')
-            csv_reader = csv.DictReader(io.StringIO(csv_content))
-            
-            table_client = table_service.get_table_client('people')
-            
-            count = 0
-            for row in csv_reader:
-                entity = {
-                    'PartitionKey': 'person',
-                    'RowKey': row.get('Name', f'person_{count}'),
-                    'Name': row.get('Name', ''),
-                    'State': row.get('State', ''),
-                    'Salary': row.get('Salary', ''),
-                    'Grade': row.get('Grade', ''),
-                    'Room': row.get('Room', ''),
-                    'Phone': row.get('Phone', ''),
-                    'Picture': row.get('Picture', ''),
-                    'Keywords': row.get('Keywords', '')
-                }
-                
-                try:
-                    table_client.upsert_entity(entity)
-                    count += 1
-                except Exception as e:
-                    print(f"Error uploading entity: {e}")
-            
-            return redirect(f'/?messages=✅ Successfully uploaded {count} people to Azure!')
+            # Spooled to disk and imported by a background job, so big files don't hold up a worker
+            return queue_job('csv', [(file.filename, file)], file.filename)
         else:
             return redirect('/?messages=❌ Please select a valid CSV file')
     except Exception as e:
@@ -320,34 +1106,51 @@ def upload_csv():
 
 @app.route('/upload_pictures', methods=['POST'])
 def upload_pictures():
-    if not blob_service:
+    storage = get_storage()
+    if not storage:
         return redirect('/?messages=❌ Azure Blob Storage not available')
     
     try:
-        files = request.files.getlist('picture_files')
-        blob_container = blob_service.get_container_client('images')
-        
-        count = 0
-        for file in files:
-            if file and file.filename:
-                try:
-                    blob_container.upload_blob(
-                        name=file.filename,
-                        data=file.read(),
-                        overwrite=True
-                    )
-                    count += 1
-                except Exception as e:
-                    print(f"Error uploading {file.filename}: {e}")
-        
-        return redirect(f'/?messages=✅ Uploaded {count} pictures to Azure!')
+        files = [(file.filename, file) for file in request.files.getlist('picture_files') if file and file.filename]
+        if not files:
+            return redirect('/?messages=❌ Please select pictures to upload')
+        return queue_job('pictures', files, f"{len(files)} pictures")
     except Exception as e:
         return redirect(f'/?messages=❌ Error uploading pictures: {str(e)}')
 
-@app.route('/search_name')
-def search_name():
-    name = request.args.get('name', '').strip()
-    exact_name = request.args.get('exact_name', '').strip()
+@app.route('/jobs')
+def list_jobs():
+    """Every ingest job, newest first"""
+    return jsonify([describe_job(job) for job in ingest_jobs.list()])
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    """Progress of one ingest job: rows done and written, errors and rows per second"""
+    try:
+        return jsonify(describe_job(ingest_jobs.load(job_id)))
+    except KeyError:
+        return jsonify({'error': 'no such job'}), 404
+
+@app.route('/metrics')
+def metrics():
+    """Storage calls, transactions, entities, bytes and latency per route, in Prometheus text format"""
+    return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/cache_stats')
+def cache_stats():
+    """Hit/miss counters for the search result cache, for tuning its size and TTL"""
+    return jsonify(search_cache.stats())
+
+def run_people_steps(make_steps, params):
+    """Run a route's steps (make_steps(storage, params)) against the people table with blocking calls"""
+    storage = get_storage()
+    table_client = storage.get_table_client('people') if storage else None
+    return run_steps(table_client, make_steps(storage, params))
+
+def search_name_steps(storage, args):
+    """/search_name as steps (see TableCall): the person's page, a list to choose from, or a redirect"""
+    name = args.get('name', '').strip()
+    exact_name = args.get('exact_name', '').strip()
     
     # If exact_name is provided, do exact matching only
     if exact_name:
@@ -359,233 +1162,49 @@ def search_name():
     else:
         return redirect('/?messages=❌ Please enter a name')
     
-    if not table_service:
-        return redirect('/?messages=❌ Could not access Azure table - please ensure you are authenticated')
-    
-    try:
-        table_client = table_service.get_table_client('people')
-        
-        # Search for people with flexible name matching
-        try:
-            # Get all people from the table for flexible searching
-            all_entities = table_client.query_entities("PartitionKey eq 'person'")
-            matching_people = []
-            
-            # Convert search term to lowercase for case-insensitive comparison
-            search_term_lower = search_term.lower()
-            
-            for entity in all_entities:
-                # Get the actual name value (handle EntityProperty objects)
-                name_raw = entity.get('Name', '')
-                if hasattr(name_raw, 'value'):
-                    person_name = str(name_raw.value)
-                else:
-                    person_name = str(name_raw)
-                
-                # Skip entities with empty, null, or invalid names
-                if not person_name or person_name.lower().strip() in ['', 'n/a', 'null', 'none', 'na']:
-                    continue
-                
-                # Check for matches based on search type
-                if exact_match_only:
-                    # Exact match (case-insensitive)
-                    if search_term_lower == person_name.lower():
-                        matching_people.append(entity)
-                else:
-                    # Partial match (case-insensitive)
-                    if search_term_lower in person_name.lower():
-                        matching_people.append(entity)
-            
-        except Exception as table_error:
-            print(f"Table query error in search_name: {table_error}")
-            return redirect('/?messages=❌ Could not access Azure table - please ensure you are authenticated')
-        
-        if matching_people:
-            # Helper function to handle EntityProperty objects
-            def get_display_value(value):
-                if hasattr(value, 'value'):
-                    return str(value.value)
-                return str(value) if value else 'N/A'
-            
-            # If only one match, show detailed view
-            if len(matching_people) == 1:
-                person = matching_people[0]
-                picture_url = ""
-                if person.get('Picture'):
-                    picture_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/images/{person['Picture']}"
-                
-                return f'''
-                <div style="font-family: Arial; max-width: 800px; margin: 50px auto; padding: 20px;">
-                    <h1>🔍 Search Results for: "{search_term}"</h1>
-                    <div style="border: 2px solid #4facfe; padding: 20px; border-radius: 10px; background: white;">
-                        <h2>👤 {get_display_value(person.get('Name', 'N/A'))}</h2>
-                        {f'<img src="{picture_url}" alt="{get_display_value(person.get("Name", ""))}" style="max-width: 200px; margin: 10px 0; border-radius: 8px;">' if picture_url else '<p>📷 No picture available</p>'}
-                        <p><strong>State:</strong> {get_display_value(person.get('State', 'N/A'))}</p>
-                        <p><strong>Salary:</strong> ${get_display_value(person.get('Salary', 'N/A'))}</p>
-                        <p><strong>Grade:</strong> {get_display_value(person.get('Grade', 'N/A'))}</p>
-                        <p><strong>Room:</strong> {get_display_value(person.get('Room', 'N/A'))}</p>
-                        <p><strong>Phone:</strong> {get_display_value(person.get('Phone', 'N/A'))}</p>
-                        <p><strong>Keywords:</strong> {get_display_value(person.get('Keywords', 'N/A'))}</p>
-                        
-                        <!-- Edit and Remove Actions -->
-                        <div style="margin-top: 25px; border-top: 1px solid #eee; padding-top: 20px;">
-                            <h3 style="color: #333; margin-bottom: 15px;">⚙️ Actions</h3>
-                            
-                            <!-- Quick Edit Form -->
-                            <div style="background: #f8f9fa; padding: 15px; border-radius: 8px; margin-bottom: 15px;">
-                                <h4 style="margin: 0 0 10px 0; color: #666;">✏️ Quick Edit</h4>
-                                <form action="/update_person" method="post" style="display: flex; gap: 10px; flex-wrap: wrap; align-items: end;">
-                                    <input type="hidden" name="name" value="{get_display_value(person.get('Name', 'N/A'))}">
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">Field:</label>
-                                        <select name="field" required style="padding: 8px; border: 1px solid #ddd; border-radius: 4px;">
-                                            <option value="State">State</option>
-                                            <option value="Salary">Salary</option>
-                                            <option value="Grade">Grade</option>
-                                            <option value="Room">Room</option>
-                                            <option value="Phone">Phone</option>
-                                            <option value="Keywords">Keywords</option>
-                                        </select>
-                                    </div>
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">New Value:</label>
-                                        <input type="text" name="value" required style="padding: 8px; border: 1px solid #ddd; border-radius: 4px; min-width: 150px;">
-                                    </div>
-                                    <button type="submit" style="padding: 8px 15px; background: #28a745; color: white; border: none; border-radius: 4px; cursor: pointer;">Update</button>
-                                </form>
-                            </div>
-                            
-                            <!-- Update Profile Picture -->
-                            <div style="background: #f0f9ff; padding: 15px; border-radius: 8px; margin-bottom: 15px; border: 1px solid #bfdbfe;">
-                                <h4 style="margin: 0 0 10px 0; color: #1e40af;">📸 Update Profile Picture</h4>
-                                <form action="/update_person_image" method="post" enctype="multipart/form-data" style="display: flex; gap: 10px; flex-wrap: wrap; align-items: end;">
-                                    <input type="hidden" name="name" value="{get_display_value(person.get('Name', 'N/A'))}">
-                                    <div>
-                                        <label style="display: block; font-size: 12px; color: #666; margin-bottom: 5px;">Choose Image:</label>
-                                        <input type="file" name="image_file" accept="image/*" required 
-                                               style="padding: 8px; border: 1px solid #ddd; border-radius: 4px; background: white;">
-                                    </div>
-                                    <button type="submit" style="padding: 8px 15px; background: #3b82f6; color: white; border: none; border-radius: 4px; cursor: pointer;">Upload Image</button>
-                                </form>
-                                <small style="color: #666; font-size: 11px;">Supported formats: JPG, PNG, GIF. Image will be stored in Azure Blob Storage.</small>
-                            </div>
-                            
-                            <!-- Remove Person -->
-                            <div style="background: #fff5f5; padding: 15px; border-radius: 8px; border: 1px solid #fed7d7;">
-                                <h4 style="margin: 0 0 10px 0; color: #e53e3e;">🗑️ Remove Person</h4>
-                                <form action="/remove_person" method="post" style="display: flex; gap: 10px; align-items: center;">
-                                    <input type="hidden" name="name" value="{get_display_value(person.get('Name', 'N/A'))}">
-                                    <span style="color: #666; font-size: 14px;">This action cannot be undone.</span>
-                                    <button type="submit" onclick="return confirm('Are you sure you want to remove {get_display_value(person.get('Name', 'N/A'))}? This cannot be undone!')" 
-                                            style="padding: 8px 15px; background: #dc3545; color: white; border: none; border-radius: 4px; cursor: pointer;">Remove Person</button>
-                                </form>
-                            </div>
-                        </div>
-                    </div>
-                    <div style="margin-top: 20px; text-align: center;">
-                        <a href="/" style="display: inline-block; padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px; margin-right: 10px;">← Back to Home</a>
-                        <a href="javascript:history.back()" style="display: inline-block; padding: 10px 20px; background: #6c757d; color: white; text-decoration: none; border-radius: 5px;">← Back to Search</a>
-                    </div>
-                    
-                    <!-- Subtle Design Credit -->
-                    <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
-                        <a href="https://BenjaminNiccum.com" target="_blank" 
-                           style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
-                           onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
-                            Design by BNiccum
-                        </a>
-                    </div>
-                </div>
-                '''
+    if not storage:
+        return redirect('/?messages=❌ Could not access Azure table - please ensure you are authenticated')
+    
+    try:
+        # Search for people with flexible name matching
+        try:
+            matching_people = None
+            if exact_match_only:
+                # Exact names are a point read on the normalized RowKey
+                person, _ = yield from find_person_steps(search_term, select=DETAIL_FIELDS)
+                if person:
+                    matching_people = [to_plain(person, DETAIL_FIELDS)]
+            
+            if matching_people is None:
+                # Identical searches are served from the result cache until a write invalidates them
+                cache_key = ('name', search_term.lower(), exact_match_only)
+                hit, matching_people, generation = search_cache.lookup(cache_key)
+                if not hit:
+                    matching_people, row_keys = yield from find_people_by_name_steps(search_term, exact_match_only)
+                    search_cache.store(cache_key, matching_people, row_keys, generation)
+            
+        except StorageUnavailable as e:
+            return redirect(f'/?messages=❌ {e}')
+        except Exception as table_error:
+            print(f"Table query error in search_name: {table_error}")
+            return redirect('/?messages=❌ Could not access Azure table - please ensure you are authenticated')
+        
+        if matching_people:
+            # If only one match, show detailed view
+            if len(matching_people) == 1:
+                person = matching_people[0]
+                if 'Keywords' not in person:
+                    # Search results only carry card fields; read the rest for this one person
+                    person = to_plain(
+                        (yield TableCall('get_entity', partition_key=PERSON_PARTITION, row_key=person['RowKey'],
+                                         select=DETAIL_FIELDS)),
+                        DETAIL_FIELDS
+                    )
+                return person_detail_html(storage, person, search_term)
             
             # If multiple matches, show a list to choose from
             else:
-                result_html = f'''
-                <div style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
-                    <h1>🔍 Multiple matches found for: "{search_term}"</h1>
-                    <p style="margin-bottom: 20px;">Found {len(matching_people)} people matching your search:</p>
-                    
-                    <style>
-                        .person-card {{
-                            border: 1px solid #ddd;
-                            padding: 15px;
-                            border-radius: 8px;
-                            min-width: 250px;
-                            background: white;
-                            cursor: pointer;
-                            transition: all 0.3s ease;
-                            margin: 10px;
-                            display: inline-block;
-                            vertical-align: top;
-                            text-decoration: none;
-                            color: inherit;
-                            box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                        }}
-                        .person-card:hover {{
-                            transform: translateY(-5px);
-                            box-shadow: 0 8px 20px rgba(0,0,0,0.15);
-                            border-color: #4facfe;
-                            background: #f8fbff;
-                        }}
-                        .person-card h3 {{
-                            margin: 0 0 10px 0;
-                            color: #333;
-                        }}
-                        .person-card img {{
-                            max-width: 150px;
-                            border-radius: 5px;
-                            margin: 10px 0;
-                            display: block;
-                        }}
-                        .person-card p {{
-                            margin: 5px 0;
-                        }}
-                        .click-hint {{
-                            color: #4facfe;
-                            font-size: 12px;
-                            margin: 15px 0 0 0;
-                            font-weight: bold;
-                        }}
-                    </style>
-                    
-                    <div style="display: flex; flex-wrap: wrap; gap: 20px; margin: 20px 0;">
-                '''
-                
-                for person in matching_people:
-                    picture_url = ""
-                    if person.get('Picture'):
-                        picture_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/images/{person['Picture']}"
-                    
-                    # Create a clickable card for each person
-                    person_name = get_display_value(person.get('Name', 'N/A'))
-                    # URL encode the name to handle special characters and spaces
-                    import urllib.parse
-                    encoded_name = urllib.parse.quote(person_name)
-                    result_html += f'''
-                    <a href="/search_name?exact_name={encoded_name}" class="person-card">
-                        <h3>👤 {person_name}</h3>
-                        {f'<img src="{picture_url}" alt="{person_name}">' if picture_url else '<p>📷 No picture</p>'}
-                        <p><strong>State:</strong> {get_display_value(person.get('State', 'N/A'))}</p>
-                        <p><strong>Salary:</strong> ${get_display_value(person.get('Salary', 'N/A'))}</p>
-                        <p class="click-hint">Click to view details →</p>
-                    </a>
-                    '''
-                
-                result_html += '''
-                    </div>
-                    <a href="/" style="margin-top: 20px; display: inline-block; padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px;">← Back to Home</a>
-                    
-                    <!-- Subtle Design Credit -->
-                    <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
-                        <a href="https://BenjaminNiccum.com" target="_blank" 
-                           style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
-                           onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
-                            Design by BNiccum
-                        </a>
-                    </div>
-                </div>
-                '''
-                return result_html
+                return people_list_html(storage, matching_people, search_term)
         else:
             return redirect(f'/?messages=❌ No people found matching "{search_term}". Try a shorter search term or check spelling.')
     
@@ -593,187 +1212,51 @@ def search_name():
         print(f"Search name error: {e}")
         return redirect('/?messages=❌ Search error - Azure services not available in local mode')
 
-@app.route('/search_salary')
-def search_salary():
-    # Handle both new and old parameter formats for backward compatibility
-    salary_amount = request.args.get('salary_amount') or request.args.get('max_salary')
-    comparison = request.args.get('comparison', 'under')  # Default to 'under' for backward compatibility
-    
-    if not salary_amount:
-        return redirect('/?messages=❌ Please enter a salary amount')
-    
-    # Validate the salary input first
+@app.route('/search_name')
+def search_name():
+    return run_people_steps(search_name_steps, request.args)
+
+def search_salary_steps(storage, args):
+    """/search_salary as steps (see TableCall): a redirect, or the steps that stream the results page"""
     try:
-        target_salary = float(salary_amount)
-        if target_salary <= 0:
-            return redirect('/?messages=❌ Please enter a positive salary number')
-    except ValueError:
-        return redirect('/?messages=❌ Please enter a valid salary number')
-    
-    # Validate comparison parameter
-    if comparison not in ['under', 'over']:
-        comparison = 'under'
+        salary_amount, comparison, target_salary, cursor, continuation_token, shown_before = parse_salary_search(args)
+    except ValueError as e:
+        return redirect(f'/?messages=❌ {e}')
     
-    if not table_service:
+    if not storage:
         return redirect('/?messages=❌ Could not access Azure table - please ensure you are authenticated')
     
+    # Create appropriate heading based on comparison
+    comparison_text = "less than" if comparison == "under" else "greater than"
+    comparison_symbol = "<" if comparison == "under" else ">"
+    
     try:
-        table_client = table_service.get_table_client('people')
-        
-        # Test if we can actually access the table
-        try:
-            entities = table_client.query_entities("PartitionKey eq 'person'")
-            entities_list = list(entities)  # Convert to list to check if query works
-        except Exception as table_error:
-            print(f"Table query error: {table_error}")
-            return redirect('/?messages=❌ Could not access Azure table - please ensure you are properly authenticated and have uploaded data')
+        cache_key = ('salary', comparison, target_salary, cursor)
+        hit, cached_page, cache_generation = search_cache.lookup(cache_key)
         
-        matching_people = []
-        
-        for entity in entities_list:
+        # Scan until the first matches turn up before sending anything, so empty
+        # searches and storage errors can still redirect with a message
+        first_matches, next_token, scanned = [], continuation_token, 0
+        if hit:
+            first_matches, next_token = cached_page
+        else:
             try:
-                # First, check if this person has a valid name
-                name_raw = entity.get('Name', '')
-                if hasattr(name_raw, 'value'):
-                    person_name = str(name_raw.value)
-                else:
-                    person_name = str(name_raw)
-                
-                # Skip entities with empty, null, or invalid names
-                if not person_name or person_name.lower().strip() in ['', 'n/a', 'null', 'none', 'na']:
-                    continue
-                
-                # Handle EntityProperty objects from Azure Table Storage
-                salary_raw = entity.get('Salary', '0')
-                # Convert EntityProperty to string if needed
-                if hasattr(salary_raw, 'value'):
-                    salary_str = str(salary_raw.value)
-                else:
-                    salary_str = str(salary_raw)
-                
-                # Clean up the salary string
-                salary_str = salary_str.replace('$', '').replace(',', '').strip()
-                
-                # Check if we have a valid numeric salary
-                if salary_str and salary_str.replace('.', '').replace('-', '').isdigit():
-                    salary = float(salary_str)
-                    
-                    # Apply the comparison logic
-                    if comparison == 'under' and salary < target_salary:
-                        matching_people.append(entity)
-                    elif comparison == 'over' and salary > target_salary:
-                        matching_people.append(entity)
-                else:
-                    # For non-numeric salaries, include them based on comparison type
-                    # (could be N/A, empty, etc.)
-                    if comparison == 'under':
-                        matching_people.append(entity)  # Assume unknown salaries are "low"
-                        
-            except (ValueError, AttributeError) as e:
-                print(f"Error processing salary for entity: {e}")
-                # Include people with invalid salary data in "under" searches only
-                if comparison == 'under':
-                    matching_people.append(entity)
-        
-        # Create appropriate heading based on comparison
-        comparison_text = "less than" if comparison == "under" else "greater than"
-        comparison_symbol = "<" if comparison == "under" else ">"
+                while True:
+                    first_matches, page_scanned, next_token = yield from salary_page_steps(
+                        comparison, target_salary, next_token
+                    )
+                    scanned += page_scanned
+                    if first_matches or next_token is None:
+                        break
+            except StorageUnavailable as e:
+                return redirect(f'/?messages=❌ {e}')
+            except Exception as table_error:
+                print(f"Table query error: {table_error}")
+                return redirect('/?messages=❌ Could not access Azure table - please ensure you are properly authenticated and have uploaded data')
         
-        if matching_people:
-            result_html = f'''
-            <div style="font-family: Arial; max-width: 1000px; margin: 50px auto; padding: 20px;">
-                <h1>💰 People with salary {comparison_text} ${target_salary:,.0f}</h1>
-                <p style="margin-bottom: 20px;">Found {len(matching_people)} people matching your criteria:</p>
-                
-                <style>
-                    .person-card {{
-                        border: 1px solid #ddd;
-                        padding: 15px;
-                        border-radius: 8px;
-                        min-width: 250px;
-                        background: white;
-                        cursor: pointer;
-                        transition: all 0.3s ease;
-                        margin: 10px;
-                        display: inline-block;
-                        vertical-align: top;
-                        text-decoration: none;
-                        color: inherit;
-                        box-shadow: 0 2px 4px rgba(0,0,0,0.1);
-                    }}
-                    .person-card:hover {{
-                        transform: translateY(-5px);
-                        box-shadow: 0 8px 20px rgba(0,0,0,0.15);
-                        border-color: #4facfe;
-                        background: #f8fbff;
-                    }}
-                    .person-card h3 {{
-                        margin: 0 0 10px 0;
-                        color: #333;
-                    }}
-                    .person-card img {{
-                        max-width: 150px;
-                        border-radius: 5px;
-                        margin: 10px 0;
-                        display: block;
-                    }}
-                    .person-card p {{
-                        margin: 5px 0;
-                    }}
-                    .click-hint {{
-                        color: #4facfe;
-                        font-size: 12px;
-                        margin: 15px 0 0 0;
-                        font-weight: bold;
-                    }}
-                </style>
-                
-                <div style="display: flex; flex-wrap: wrap; gap: 20px; margin: 20px 0;">
-            '''
-            
-            for person in matching_people:
-                picture_url = ""
-                if person.get('Picture'):
-                    picture_url = f"https://{STORAGE_ACCOUNT_NAME}.blob.core.windows.net/images/{person['Picture']}"
-                
-                # Handle EntityProperty objects for display
-                def get_display_value(value):
-                    if hasattr(value, 'value'):
-                        return str(value.value)
-                    return str(value) if value else 'N/A'
-                
-                # Create a clickable card for each person
-                person_name = get_display_value(person.get('Name', 'N/A'))
-                # URL encode the name to handle special characters and spaces
-                import urllib.parse
-                encoded_name = urllib.parse.quote(person_name)
-                
-                result_html += f'''
-                <a href="/search_name?exact_name={encoded_name}" class="person-card">
-                    <h3>👤 {person_name}</h3>
-                    {f'<img src="{picture_url}" alt="{person_name}">' if picture_url else '<p>📷 No picture</p>'}
-                    <p><strong>State:</strong> {get_display_value(person.get('State', 'N/A'))}</p>
-                    <p><strong>Salary:</strong> ${get_display_value(person.get('Salary', 'N/A'))}</p>
-                    <p class="click-hint">Click to view details →</p>
-                </a>
-                '''
-            
-            result_html += '''</div>
-            <a href="/" style="padding: 10px 20px; background: #4facfe; color: white; text-decoration: none; border-radius: 5px;">← Back</a>
-            
-            <!-- Subtle Design Credit -->
-            <div style="text-align: center; margin-top: 30px; padding: 15px; border-top: 1px solid #f0f0f0;">
-                <a href="https://BenjaminNiccum.com" target="_blank" 
-                   style="color: #999; font-size: 11px; text-decoration: none; opacity: 0.7; transition: opacity 0.3s ease;"
-                   onmouseover="this.style.opacity='1'" onmouseout="this.style.opacity='0.7'">
-                    Design by BNiccum
-                </a>
-            </div>
-            </div>'''
-            return result_html
-        else:
+        if not first_matches:
             # If no data found, it might be because there's no data in the table
-            if not entities_list:
+            if not scanned and not cursor:
                 return redirect('/?messages=❌ No data found in the database. Please upload CSV data first.')
             else:
                 return redirect(f'/?messages=❌ No people found with salary {comparison_symbol} ${target_salary:,.0f}')
@@ -783,63 +1266,334 @@ def search_salary():
         # Provide more specific error information for debugging
         error_msg = f"Error searching by salary: {str(e)[:200]}"
         return redirect(f'/?messages=❌ {error_msg}')
+    
+    def results():
+        yield salary_header_html(comparison_text, target_salary)
+        
+        page_people = list(first_matches)
+        token = next_token
+        yield "".join(person_card_html(storage, person) for person in first_matches)
+        
+        # Keep reading service pages, streaming each page's cards as it arrives,
+        # until this results page is full or the table is exhausted
+        if not hit:
+            try:
+                while token is not None and len(page_people) < SALARY_PAGE_SIZE:
+                    matches, _, token = yield from salary_page_steps(comparison, target_salary, token)
+                    page_people.extend(matches)
+                    if matches:
+                        yield "".join(person_card_html(storage, person) for person in matches)
+            except Exception as e:
+                print(f"Search salary error while streaming: {e}")
+                yield '</div><p style="color: #dc3545;">❌ Some results could not be loaded - please try again.</p><div>'
+                token = None
+            else:
+                search_cache.store(
+                    cache_key, (page_people, token),
+                    [person['RowKey'] for person in page_people], cache_generation
+                )
+        
+        shown = shown_before + len(page_people)
+        next_url = None
+        if token is not None:
+            next_url = '/search_salary?' + urllib.parse.urlencode({
+                'comparison': comparison, 'salary_amount': salary_amount, 'cursor': encode_cursor(token, shown)
+            })
+        yield salary_footer_html(shown_before, shown, next_url)
+    
+    return results()
 
-@app.route('/update_person', methods=['POST'])
-def update_person():
-    name = request.form.get('name', '').strip()
-    field = request.form.get('field', '').strip()
-    value = request.form.get('value', '').strip()
+@app.route('/search_salary')
+def search_salary():
+    storage = get_storage()
+    table_client = storage.get_table_client('people') if storage else None
+    results = run_steps(table_client, search_salary_steps(storage, request.args))
+    if not inspect.isgenerator(results):
+        return results  # A redirect with a message
+    
+    def generate():
+        # Headers are sent by now, so later pages only get the per-attempt timeout
+        g.storage_deadline = None
+        yield from stream_steps(table_client, results)
+    
+    return Response(stream_with_context(generate()), mimetype='text/html')
+
+# Columns /export can return; RowKey always comes first so a client can resume after it
+EXPORT_FIELDS = ['Name', 'State', 'Salary', 'Grade', 'Room', 'Phone', 'Keywords', 'Picture', 'PictureDetail', 'PictureThumb']
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', 1000))
+
+def salary_in_range(person, min_salary, max_salary):
+    """Whether a person's numeric salary lies within the optional bounds"""
+    if min_salary is None and max_salary is None:
+        return True
+    salary_str = str(person.get('Salary', '')).replace('$', '').replace(',', '').strip()
+    try:
+        salary = float(salary_str)
+    except ValueError:
+        return False
+    return (min_salary is None or salary >= min_salary) and (max_salary is None or salary <= max_salary)
+
+def export_rows(table_client, fields, state=None, grade=None, min_salary=None, max_salary=None, after=None):
+    """Yield one page of people (see to_plain) at a time, in RowKey order, after the RowKey `after`"""
+    query = f"PartitionKey eq '{PERSON_PARTITION}'"
+    parameters = {}
+    if after:
+        query += " and RowKey gt @after"
+        parameters['after'] = after
+    # State and Grade are compared by the service; salaries are strings, so ranges are checked here
+    if state:
+        query += " and State eq @state"
+        parameters['state'] = state
+    if grade:
+        query += " and Grade eq @grade"
+        parameters['grade'] = grade
+    select = ['RowKey'] + fields
+    if (min_salary is not None or max_salary is not None) and 'Salary' not in select:
+        select.append('Salary')
+    pages = table_client.query_entities(
+        query, parameters=parameters, select=select, results_per_page=EXPORT_PAGE_SIZE
+    ).by_page()
+    for page in pages:
+        people = (to_plain(entity, select) for entity in page)
+        yield [person for person in people if salary_in_range(person, min_salary, max_salary)]
+
+@app.route('/export')
+def export():
+    """Stream the people table as CSV (default) or newline-delimited JSON.
+
+    Query parameters: format=csv|ndjson, fields=Name,State,... (projection),
+    state, grade, min_salary, max_salary (filters) and after=<RowKey> to resume
+    an interrupted export after the last row received. Rows come in RowKey
+    order and only one service page is held in memory at a time.
+    
+    If storage fails partway, the body ends with a marker instead of looking
+    complete: an NDJSON {"error": ..., "resume_after": <RowKey>} line, or a CSV
+    row starting with "#export-incomplete" followed by the error and the
+    RowKey to resume after. The response is then aborted without its final
+    chunk.
+    """
+    export_format = request.args.get('format', 'csv')
+    if export_format not in ('csv', 'ndjson'):
+        return jsonify({'error': 'format must be csv or ndjson'}), 400
+    
+    fields = [field.strip() for field in request.args.get('fields', '').split(',') if field.strip()] or EXPORT_FIELDS
+    unknown = [field for field in fields if field not in EXPORT_FIELDS]
+    if unknown:
+        return jsonify({'error': f"unknown fields: {', '.join(unknown)}", 'fields': EXPORT_FIELDS}), 400
+    fields = [field for field in fields if field != 'RowKey']
+    
+    try:
+        min_salary = float(request.args['min_salary']) if request.args.get('min_salary') else None
+        max_salary = float(request.args['max_salary']) if request.args.get('max_salary') else None
+    except ValueError:
+        return jsonify({'error': 'min_salary and max_salary must be numbers'}), 400
+    after = request.args.get('after', '').strip() or None
+    
+    storage = get_storage()
+    if not storage:
+        return jsonify({'error': 'Azure Table Storage not available'}), 503
+    table_client = storage.get_table_client('people')
+    pages = export_rows(table_client, fields, request.args.get('state'), request.args.get('grade'),
+                        min_salary, max_salary, after)
+    columns = ['RowKey'] + fields
+    
+    def generate():
+        # An export can outlast any request budget; each page still gets the per-attempt timeout
+        g.storage_deadline = None
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if export_format == 'csv' and not after:
+            writer.writerow(columns)
+        last_row_key = after
+        try:
+            for people in pages:
+                if people:
+                    last_row_key = people[-1]['RowKey']
+                if export_format == 'csv':
+                    writer.writerows([person[column] for column in columns] for person in people)
+                else:
+                    for person in people:
+                        buffer.write(json.dumps({column: person[column] for column in columns}, ensure_ascii=False, default=str))
+                        buffer.write('\n')
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        except Exception as e:
+            # Headers are gone, so say so in the body; the client resumes with after=<last RowKey>
+            print(f"Export stopped: {e}")
+            buffer.seek(0)
+            buffer.truncate()
+            if export_format == 'csv':
+                writer.writerow(['#export-incomplete', str(e), last_row_key or ''])
+            else:
+                buffer.write(json.dumps({'error': str(e), 'resume_after': last_row_key}, ensure_ascii=False) + '\n')
+            yield buffer.getvalue()
+            # Re-raised so the server drops the connection rather than ending the body cleanly
+            raise
+    
+    extension = 'csv' if export_format == 'csv' else 'ndjson'
+    mimetype = 'text/csv' if export_format == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(generate()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename=people.{extension}'}
+    )
+
+# Salary statistics by State and Grade, maintained as people are imported, updated
+# and removed, and recomputed from a full scan every SALARY_STATS_REFRESH seconds
+# to pick up changes made by other workers
+SALARY_STATS_FIELDS = ['State', 'Grade', 'Salary']
+salary_aggregates = SalaryStats()
+_salary_refresher = None
+_salary_refresher_lock = threading.Lock()
+
+def recompute_salary_stats():
+    """Rebuild salary_aggregates from one scan of the people partition"""
+    storage = get_storage()
+    if not storage:
+        raise StorageUnavailable("storage backend could not be created")
+    table_client = storage.get_table_client('people')
+    people = table_client.query_entities(
+        f"PartitionKey eq '{PERSON_PARTITION}'",
+        select=['RowKey'] + SALARY_STATS_FIELDS, results_per_page=EXPORT_PAGE_SIZE
+    )
+    salary_aggregates.rebuild(
+        (person['RowKey'], person.get('State'), person.get('Grade'), person.get('Salary')) for person in people
+    )
+
+def refresh_salary_stats():
+    while True:
+        started = time.monotonic()
+        try:
+            recompute_salary_stats()
+            print(f"✅ Salary statistics recomputed in {time.monotonic() - started:.1f}s")
+        except Exception as e:
+            print(f"⚠️ Could not recompute salary statistics: {e}")
+        time.sleep(SALARY_STATS_REFRESH if salary_aggregates.rebuilt_at else min(30, SALARY_STATS_REFRESH))
+
+def start_salary_stats_refresher():
+    """Start the periodic recompute on first use, so workers that never serve stats never scan"""
+    global _salary_refresher
+    with _salary_refresher_lock:
+        if _salary_refresher is None:
+            _salary_refresher = threading.Thread(target=refresh_salary_stats, name='salary-stats', daemon=True)
+            _salary_refresher.start()
+
+@app.route('/salary_stats')
+def salary_stats():
+    """Salary count, mean, standard deviation, percentiles and histogram per group.
+
+    Query parameters: group_by=State,Grade (the default; also State, Grade or
+    none), state and grade to filter, and percentiles=50,90,99. Histogram bins
+    are $10,000 wide and percentiles are within 1% of the true value.
+    """
+    start_salary_stats_refresher()
+    if salary_aggregates.rebuilt_at is None:
+        response = jsonify({'error': 'salary statistics are being computed - try again shortly'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    fields = {'state': 'State', 'grade': 'Grade'}
+    group_by = [part.strip().lower() for part in request.args.get('group_by', 'State,Grade').split(',') if part.strip()]
+    if group_by == ['none']:
+        group_by = []
+    unknown = [part for part in group_by if part not in fields]
+    if unknown:
+        return jsonify({'error': f"group_by must be State, Grade, State,Grade or none, not {', '.join(unknown)}"}), 400
+    try:
+        percentiles = [float(p) for p in request.args.get('percentiles', '').split(',') if p.strip()] or PERCENTILES
+    except ValueError:
+        return jsonify({'error': 'percentiles must be numbers between 0 and 100'}), 400
+    if not all(0 <= p <= 100 for p in percentiles):
+        return jsonify({'error': 'percentiles must be numbers between 0 and 100'}), 400
+    
+    stats = salary_aggregates.summary(
+        group_by=tuple(dict.fromkeys(fields[part] for part in group_by)),
+        state=request.args.get('state'), grade=request.args.get('grade'), percentiles=percentiles
+    )
+    stats['recomputed_at'] = datetime.utcfromtimestamp(salary_aggregates.rebuilt_at).isoformat() + 'Z'
+    return jsonify(stats)
+
+def update_person_steps(storage, form):
+    """/update_person as steps (see TableCall): a redirect with the outcome"""
+    name = form.get('name', '').strip()
+    field = form.get('field', '').strip()
+    value = form.get('value', '').strip()
     
     if not all([name, field, value]):
         return redirect('/?messages=❌ Please fill all fields')
     
-    if not table_service:
+    if not storage:
         return redirect('/?messages=❌ Azure Table Storage not available')
     
+    if field in IDENTITY_FIELDS:
+        return redirect(f'/?messages=❌ {field} cannot be updated - remove the person and upload them again instead')
+    
     try:
-        table_client = table_service.get_table_client('people')
-        entities = table_client.query_entities(f"PartitionKey eq 'person' and Name eq '{name}'")
-        person = None
-        for entity in entities:
-            person = entity
-            break
+        person, _ = yield from find_person_steps(name, select=['PartitionKey', 'RowKey'] + SALARY_STATS_FIELDS)
         
         if person:
-            person[field] = value
-            table_client.upsert_entity(person)
+            yield from merge_person_steps(person, {field: value})
+            search_cache.invalidate_rows([person['RowKey']])
+            if field in SALARY_STATS_FIELDS:
+                person = {**person, field: value}
+                salary_aggregates.set(person['RowKey'], person.get('State'), person.get('Grade'), person.get('Salary'))
+            if field == 'Salary':
+                # The new salary may move this person into salary searches they weren't in
+                search_cache.invalidate_where(lambda key: key[0] == 'salary')
             return redirect(f'/?messages=✅ Updated {field} for {name}!')
         else:
             return redirect(f'/?messages=❌ {name} not found')
     
+    except ResourceModifiedError:
+        return redirect(f'/?messages=❌ {name} was changed by someone else - please try again')
     except Exception as e:
         return redirect(f'/?messages=❌ Update error: {str(e)}')
 
-@app.route('/remove_person', methods=['POST'])
-def remove_person():
-    name = request.form.get('name', '').strip()
+@app.route('/update_person', methods=['POST'])
+def update_person():
+    return run_people_steps(update_person_steps, request.form)
+
+def remove_person_steps(storage, form):
+    """/remove_person as steps (see TableCall): a redirect with the outcome"""
+    name = form.get('name', '').strip()
     if not name:
         return redirect('/?messages=❌ Please enter a name')
     
-    if not table_service:
+    if not storage:
         return redirect('/?messages=❌ Azure Table Storage not available')
     
     try:
-        table_client = table_service.get_table_client('people')
-        entities = table_client.query_entities(f"PartitionKey eq 'person' and Name eq '{name}'")
+        person, index_entry = yield from find_person_steps(name, select=['PartitionKey', 'RowKey'])
         deleted = False
-        for entity in entities:
-            table_client.delete_entity(partition_key='person', row_key=entity['RowKey'])
+        if person:
+            yield TableCall(
+                'delete_entity',
+                partition_key=PERSON_PARTITION,
+                row_key=person['RowKey'],
+                etag=person.metadata['etag'],
+                match_condition=MatchConditions.IfNotModified
+            )
+            if index_entry:
+                yield TableCall('delete_entity', partition_key=NAME_INDEX_PARTITION, row_key=index_entry['RowKey'])
+            search_cache.invalidate_rows([person['RowKey']])
+            salary_aggregates.remove(person['RowKey'])
             deleted = True
-            break
         
         if deleted:
             return redirect(f'/?messages=✅ Removed {name}!')
         else:
             return redirect(f'/?messages=❌ {name} not found')
     
+    except ResourceModifiedError:
+        return redirect(f'/?messages=❌ {name} was changed by someone else - please try again')
     except Exception as e:
         return redirect(f'/?messages=❌ Error: {str(e)}')
 
+@app.route('/remove_person', methods=['POST'])
+def remove_person():
+    return run_people_steps(remove_person_steps, request.form)
+
 @app.route('/update_person_image', methods=['POST'])
 def update_person_image():
     name = request.form.get('name', '').strip()
@@ -851,7 +1605,8 @@ def update_person_image():
     if not image_file or not image_file.filename:
         return redirect('/?messages=❌ Please select an image file')
     
-    if not (blob_service and table_service):
+    storage = get_storage()
+    if not storage:
         return redirect('/?messages=❌ Azure services not available')
     
     try:
@@ -859,39 +1614,57 @@ def update_person_image():
         file_extension = image_file.filename.split('.')[-1] if '.' in image_file.filename else 'jpg'
         # Use person's name as the filename (sanitized)
         safe_name = "".join(c for c in name if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        new_filename = f"{safe_name.replace(' ', '_').lower()}.{file_extension}"
+        base_name = safe_name.replace(' ', '_').lower()
         
-        # Upload the image to Azure Blob Storage
-        blob_container = blob_service.get_container_client('images')
+        # Find the person first so we don't upload pictures nobody will reference
+        table_client = storage.get_table_client('people')
+        person, _ = find_person(table_client, name, select=['PartitionKey', 'RowKey'])
+        if not person:
+            return redirect(f'/?messages=❌ Person "{name}" not found in database')
         
         try:
-            # Upload the new image (overwrite if exists)
-            blob_container.upload_blob(
-                name=new_filename,
-                data=image_file.read(),
-                overwrite=True
+            variants = make_variants(image_file.read(), base_name, file_extension)
+        except ValueError as image_error:
+            return redirect(f'/?messages=❌ Could not read image: {str(image_error)}')
+        
+        # Upload the card thumbnail, detail image and original to Azure Blob Storage in parallel
+        blob_container = storage.get_container_client('images')
+        warm_blob_index(blob_container)
+        
+        def upload_variant(blob_name, data, content_type):
+            # Variant names carry a content hash, so re-uploading the same picture sends nothing
+            upload_deduplicated(
+                blob_container, blob_index, blob_name, data, hashlib.md5(data).digest(),
+                content_settings=ContentSettings(
+                    content_type=content_type,
+                    cache_control=IMMUTABLE_CACHE_CONTROL
+                )
             )
-            print(f"✅ Uploaded image: {new_filename}")
+        
+        try:
+            # Each upload runs in a copy of this request's context so its calls count against this route
+            uploads = [
+                _upload_pool.submit(contextvars.copy_context().run, upload_variant, *variant)
+                for variant in variants.values()
+            ]
+            for upload in uploads:
+                upload.result()
+            print(f"✅ Uploaded image variants: {', '.join(v[0] for v in variants.values())}")
         except Exception as blob_error:
             print(f"Blob upload error: {blob_error}")
             return redirect(f'/?messages=❌ Failed to upload image: {str(blob_error)}')
         
-        # Update the person's Picture field in Azure Table Storage
-        table_client = table_service.get_table_client('people')
-        entities = table_client.query_entities(f"PartitionKey eq 'person' and Name eq '{name}'")
-        person = None
-        for entity in entities:
-            person = entity
-            break
-        
-        if person:
-            # Update the Picture field with the new filename
-            person['Picture'] = new_filename
-            table_client.upsert_entity(person)
-            return redirect(f'/?messages=✅ Image updated successfully for {name}!')
-        else:
-            return redirect(f'/?messages=❌ Person "{name}" not found in database')
+        # Point the person's picture fields at the new blobs
+        merge_person(table_client, person, {
+            'Picture': variants['original'][0],
+            'PictureDetail': variants['detail'][0],
+            'PictureThumb': variants['thumb'][0]
+        })
+        search_cache.invalidate_rows([person['RowKey']])
+        return redirect(f'/?messages=✅ Image updated successfully for {name}!')
     
+    except ResourceModifiedError:
+        return redirect(f'/?messages=❌ {name} was changed by someone else - please try again')
     except Exception as e:
         print(f"Update image error: {e}")
         return redirect(f'/?messages=❌ Error updating image: {str(e)}')
@@ -0,0 +1,341 @@
+"""ASGI entry point that serves the app on asyncio with the Azure SDK's aio clients.
+
+    uvicorn asgi:app --host 0.0.0.0 --port 8000
+
+The storage-bound routes (search_name, search_salary, update_person,
+remove_person) run as coroutines, so a single process keeps hundreds of slow
+storage calls in flight instead of one per worker thread. Everything else
+(the home page, uploads, which only queue a background job,
+update_person_image, export, jobs, salary_stats, local blobs, cache_stats) is
+passed to the Flask app on a worker thread, and its responses are forwarded
+as they are produced.
+
+The coroutine routes run the same code as app.py's (its *_steps generators,
+see app.TableCall), awaiting each storage call instead of blocking on it.
+Their calls go through the same CallPolicy objects, so retries, hedging, the
+request budget and the circuit breakers behave as in the Flask app, and both
+share the search result cache and the salary statistics.
+"""
+import asyncio
+import inspect
+import io
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from werkzeug.wrappers import Request
+from werkzeug.utils import redirect
+
+from app import (
+    app as flask_app, TableCall, search_name_steps, search_salary_steps, update_person_steps, remove_person_steps,
+    telemetry, table_policy, async_storage_deadline, write_trace, STORAGE_TRACE_LOG,
+    STORAGE_BACKEND, STORAGE_ACCOUNT_NAME, LOCAL_STORAGE_DIR, LOCAL_STORAGE_LATENCY_MS,
+    LOCAL_STORAGE_FAILURE_RATE, STORAGE_REQUEST_BUDGET, STORAGE_ATTEMPT_TIMEOUT,
+)
+from async_storage import AsyncAzureStorage, AsyncLocalStorage, GuardedAsyncStorage
+from resilience import StorageUnavailable
+from telemetry import current_route, current_trace
+
+# Connections kept open to Azure by this process; one event loop uses far more than a thread
+ASYNC_POOL_SIZE = int(os.environ.get('ASYNC_POOL_SIZE', 100))
+
+# Request bodies bigger than this are spooled to a temporary file instead of held in memory
+BODY_SPOOL_SIZE = int(os.environ.get('BODY_SPOOL_SIZE', 1024 * 1024))
+
+_storage = None
+
+def create_async_storage():
+    """Build the async counterpart of the backend selected by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'local':
+        backend = AsyncLocalStorage(LOCAL_STORAGE_DIR, latency_ms=LOCAL_STORAGE_LATENCY_MS,
+                                    failure_rate=LOCAL_STORAGE_FAILURE_RATE)
+    else:
+        from azure.identity.aio import DefaultAzureCredential
+        # As in app.create_storage, CallPolicy alone retries
+        backend = AsyncAzureStorage(STORAGE_ACCOUNT_NAME, DefaultAzureCredential(), pool_size=ASYNC_POOL_SIZE,
+                                    retry_total=0, connection_timeout=STORAGE_ATTEMPT_TIMEOUT,
+                                    read_timeout=STORAGE_ATTEMPT_TIMEOUT)
+    # The Flask app's policies: same breakers, and calls land in the same /metrics registry
+    return GuardedAsyncStorage(backend, table_policy=table_policy)
+
+def get_async_storage():
+    """Return the process-wide async backend, creating it on first use (always on the event loop)"""
+    global _storage
+
+    if _storage is None:
+        try:
+            _storage = create_async_storage()
+        except Exception as e:
+            print(f"⚠️ Could not create async {STORAGE_BACKEND} storage backend: {e}")
+            return None
+    return _storage
+
+# --- Running app.py's steps with awaited storage calls --------------------------
+
+async def query_page(table_client, query_filter, continuation_token=None, **kwargs):
+    """One service page of a query: (entities, continuation token of the next page or None)"""
+    pages = table_client.query_entities(query_filter, **kwargs).by_page(continuation_token=continuation_token)
+    try:
+        page = [entity async for entity in await pages.__anext__()]
+    except StopAsyncIteration:
+        page = []
+    return page, pages.continuation_token
+
+async def call_table(table_client, call):
+    if call.method == 'query_page':
+        return await query_page(table_client, *call.args, **call.kwargs)
+    return await getattr(table_client, call.method)(*call.args, **call.kwargs)
+
+async def run_steps(table_client, steps):
+    """app.run_steps, awaiting each call; returns what steps returns"""
+    result = error = None
+    while True:
+        try:
+            call = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration as done:
+            return done.value
+        result = error = None
+        if not isinstance(call, TableCall):
+            raise TypeError(f"Unexpected output from steps: {call!r}")
+        try:
+            result = await call_table(table_client, call)
+        except Exception as e:
+            error = e
+
+async def stream_steps(table_client, steps):
+    """app.stream_steps, awaiting each call: yields the str chunks steps produce"""
+    result = error = None
+    while True:
+        try:
+            item = steps.throw(error) if error is not None else steps.send(result)
+        except StopIteration:
+            return
+        result = error = None
+        if not isinstance(item, TableCall):
+            yield item
+            continue
+        try:
+            result = await call_table(table_client, item)
+        except Exception as e:
+            error = e
+
+# --- Routes ---------------------------------------------------------------------
+
+class StreamingResponse:
+    """HTML response whose body comes from an async generator of str chunks"""
+
+    def __init__(self, chunks, mimetype='text/html'):
+        self.chunks = chunks
+        self.mimetype = mimetype
+
+async def search_name(request, storage):
+    return await run_steps(storage.get_table_client('people'), search_name_steps(storage, request.args))
+
+async def search_salary(request, storage):
+    table_client = storage.get_table_client('people')
+    results = await run_steps(table_client, search_salary_steps(storage, request.args))
+    if not inspect.isgenerator(results):
+        return results  # A redirect with a message
+
+    async def generate():
+        # As in app.search_salary, later pages only get the per-attempt timeout
+        async_storage_deadline.set(None)
+        async for chunk in stream_steps(table_client, results):
+            yield chunk
+
+    return StreamingResponse(generate())
+
+async def update_person(request, storage):
+    return await run_steps(storage.get_table_client('people'), update_person_steps(storage, request.form))
+
+async def remove_person(request, storage):
+    return await run_steps(storage.get_table_client('people'), remove_person_steps(storage, request.form))
+
+ROUTES = {
+    ('GET', '/search_name'): search_name,
+    ('GET', '/search_salary'): search_salary,
+    ('POST', '/update_person'): update_person,
+    ('POST', '/remove_person'): remove_person,
+}
+
+# --- ASGI plumbing --------------------------------------------------------------
+
+def wsgi_environ(scope, body, length):
+    """WSGI environ for an ASGI HTTP scope, so werkzeug (and Flask) can parse the request"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['raw_path'].decode('latin-1').split('?', 1)[0] if scope.get('raw_path') else scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': io.StringIO(),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+        'CONTENT_LENGTH': str(length),
+    }
+    for name, value in scope.get('headers', []):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key != 'CONTENT_LENGTH':
+            key = f'HTTP_{key}'
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+async def read_body(receive):
+    """Collect the request body; returns (file, length). Large bodies are spooled to disk"""
+    body = tempfile.SpooledTemporaryFile(max_size=BODY_SPOOL_SIZE)
+    length = 0
+    while True:
+        message = await receive()
+        chunk = message.get('body', b'')
+        body.write(chunk)
+        length += len(chunk)
+        if not message.get('more_body'):
+            body.seek(0)
+            return body, length
+
+def call_flask(environ, loop, queue, stop):
+    """Run the Flask app for one request on a worker thread.
+
+    Puts (status, headers) and then each body chunk on the asyncio queue, so
+    streamed responses like /export are forwarded as they are produced, then
+    None. An error raised while producing the body is put on the queue before
+    the None. Stops early once `stop` is set (the client went away).
+    """
+    def put(item):
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    def start_response(status, headers, exc_info=None):
+        put((int(status.split(' ', 1)[0]), headers))
+
+    try:
+        result = flask_app.wsgi_app(environ, start_response)
+        try:
+            for chunk in result:
+                if stop.is_set():
+                    break
+                if chunk:
+                    put(chunk)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+    except Exception as e:
+        put(e)
+    finally:
+        put(None)
+
+async def forward_to_flask(environ, send):
+    loop = asyncio.get_running_loop()
+    # A small queue keeps a slow client from making the worker buffer the whole body
+    queue = asyncio.Queue(maxsize=8)
+    stop = threading.Event()
+    worker = loop.run_in_executor(None, call_flask, environ, loop, queue, stop)
+    try:
+        started = await queue.get()
+        if started is None or isinstance(started, Exception):
+            return await send_response(send, 500, [('Content-Type', 'text/plain')], b'Internal Server Error')
+        status, headers = started
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+        while (chunk := await queue.get()) is not None:
+            if isinstance(chunk, Exception):
+                # Without the final empty body the server aborts the response, so it can't pass as complete
+                raise chunk
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        stop.set()
+        # Let the worker finish putting whatever it was producing
+        while not worker.done():
+            try:
+                await asyncio.wait_for(queue.get(), timeout=0.1)
+            except asyncio.TimeoutError:
+                pass
+
+async def send_response(send, status, headers, body):
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]})
+    await send({'type': 'http.response.body', 'body': body})
+
+async def handle(request, handler):
+    """Run a route under the request's storage budget (see app.start_storage_budget)"""
+    storage = get_async_storage()
+    if not storage:
+        return redirect('/?messages=❌ Azure Table Storage not available')
+    # Each request runs in its own task, so this only sets this request's deadline
+    async_storage_deadline.set(time.monotonic() + STORAGE_REQUEST_BUDGET)
+    try:
+        return await handler(request, storage)
+    except StorageUnavailable as e:
+        return redirect(f'/?messages=❌ {e}')
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            get_async_storage()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if _storage is not None:
+                await _storage.close()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body, length = await read_body(receive)
+    with body:
+        await serve(scope, send, wsgi_environ(scope, body, length))
+
+async def serve(scope, send, environ):
+    handler = ROUTES.get((scope['method'], scope['path']))
+    if handler is None:
+        return await forward_to_flask(environ, send)
+
+    # Each request runs in its own task, so these only label this request's storage calls
+    started = time.monotonic()
+    route = handler.__name__
+    current_route.set(route)
+    calls = [] if STORAGE_TRACE_LOG else None
+    current_trace.set(calls)
+    response = await handle(Request(environ), handler)
+    status = response.status_code if not isinstance(response, (StreamingResponse, str)) else 200
+    telemetry.observe_request(route, status, time.monotonic() - started)
+    try:
+        await send_handler_response(send, environ, response)
+    finally:
+        if calls is not None:
+            write_trace({
+                'time': datetime.utcnow().isoformat() + 'Z', 'route': route, 'method': scope['method'],
+                'path': scope['path'], 'status': status, 'calls': calls,
+                'seconds': round(time.monotonic() - started, 6),
+            })
+
+async def send_handler_response(send, environ, response):
+    if isinstance(response, StreamingResponse):
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', f'{response.mimetype}; charset=utf-8'.encode('latin-1'))]})
+        async for chunk in response.chunks:
+            await send({'type': 'http.response.body', 'body': chunk.encode('utf-8'), 'more_body': True})
+        return await send({'type': 'http.response.body', 'body': b''})
+    if isinstance(response, str):
+        return await send_response(send, 200, [('Content-Type', 'text/html; charset=utf-8')], response.encode('utf-8'))
+    # werkzeug redirect; get_wsgi_headers turns the Location IRI into a valid URI
+    headers = response.get_wsgi_headers(environ)
+    return await send_response(send, response.status_code, headers.to_wsgi_list(), response.get_data())
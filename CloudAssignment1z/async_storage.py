@@ -0,0 +1,284 @@
+"""Asyncio table storage backends for the ASGI entry point (asgi.py).
+
+Both expose the table half of storage.py's surface, with coroutine methods.
+asgi.py sends every route that touches blobs to the Flask app, so there are
+no async blob clients.
+
+  AsyncAzureStorage  - the SDK's aio Table client
+  AsyncLocalStorage  - the offline SQLite backend. Its injected latency is
+                       awaited instead of slept, so one event loop can keep many
+                       slow calls in flight, as it would against Azure. The
+                       SQLite work itself runs on a worker thread
+                       (asyncio.to_thread) so it never blocks the loop.
+
+GuardedAsyncStorage wraps either one so every call goes through a CallPolicy
+(see resilience.py), with the same deadlines, retries, hedged reads, circuit
+breaker and telemetry as GuardedStorage gives the threaded app.
+"""
+import asyncio
+
+from storage import LatencyModel, LocalStorage
+from telemetry import entity_bytes
+
+
+class AsyncAzureStorage:
+    """Azure Table storage through azure.data.tables.aio"""
+
+    def __init__(self, account_name, credential, pool_size=100, **client_kwargs):
+        # aiohttp is only needed for this backend, so the offline mode runs without it
+        import aiohttp
+        from azure.core.pipeline.transport import AioHttpTransport
+        from azure.data.tables.aio import TableServiceClient
+
+        self.account_name = account_name
+        self.credential = credential
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=pool_size))
+        transport = AioHttpTransport(session=self._session, session_owner=False)
+        self.table_service = TableServiceClient(
+            endpoint=f"https://{account_name}.table.core.windows.net",
+            credential=credential,
+            transport=transport,
+            **client_kwargs
+        )
+
+    def get_table_client(self, table_name):
+        return self.table_service.get_table_client(table_name)
+
+    def blob_url(self, container, blob_name):
+        return f"https://{self.account_name}.blob.core.windows.net/{container}/{blob_name}"
+
+    async def close(self):
+        await self.table_service.close()
+        await self._session.close()
+        await self.credential.close()
+
+
+class AsyncLocalStorage:
+    """LocalStorage behind coroutine methods, for offline runs and load tests"""
+
+    def __init__(self, root, latency_ms=0.0, latency_sigma=0.5, failure_rate=0.0, url_prefix='/local_blobs'):
+        # The wrapped backend runs without latency; it's awaited here instead
+        self.local = LocalStorage(root, url_prefix=url_prefix)
+        self.latency = LatencyModel(latency_ms, latency_sigma, failure_rate)
+        self.blob_root = self.local.blob_root
+
+    async def simulate(self):
+        delay = self.latency.delay()
+        if delay:
+            await asyncio.sleep(delay)
+        self.latency.maybe_fail()
+
+    def get_table_client(self, table_name):
+        return AsyncLocalTableClient(self, self.local.get_table_client(table_name))
+
+    def blob_url(self, container, blob_name):
+        return self.local.blob_url(container, blob_name)
+
+    async def close(self):
+        pass
+
+
+class AsyncLocalPage:
+    """One page of entities, iterated with async for like the SDK's pages"""
+
+    def __init__(self, entities):
+        self._entities = iter(entities)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._entities)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class AsyncLocalPageIterator:
+    """Mimics AsyncItemPaged.by_page(): continuation_token is None after the last page"""
+
+    def __init__(self, storage, pages):
+        self._storage = storage
+        self._pages = pages
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+    def __aiter__(self):
+        return self
+
+    def _next_page(self):
+        try:
+            return list(next(self._pages))
+        except StopIteration:
+            return None
+
+    async def __anext__(self):
+        await self._storage.simulate()
+        page = await asyncio.to_thread(self._next_page)
+        if page is None:
+            raise StopAsyncIteration
+        return AsyncLocalPage(page)
+
+
+class AsyncLocalPaged:
+    """Mimics azure.core.async_paging.AsyncItemPaged"""
+
+    def __init__(self, storage, paged):
+        self._storage = storage
+        self._paged = paged
+
+    def by_page(self, continuation_token=None):
+        return AsyncLocalPageIterator(self._storage, self._paged.by_page(continuation_token=continuation_token))
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for entity in page:
+                yield entity
+
+
+class AsyncLocalTableClient:
+    """The subset of azure.data.tables.aio.TableClient the app uses"""
+
+    def __init__(self, storage, table_client):
+        self._storage = storage
+        self._table = table_client
+
+    def query_entities(self, query_filter, **kwargs):
+        return AsyncLocalPaged(self._storage, self._table.query_entities(query_filter, **kwargs))
+
+    def list_entities(self, **kwargs):
+        return AsyncLocalPaged(self._storage, self._table.list_entities(**kwargs))
+
+    async def get_entity(self, *args, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.get_entity, *args, **kwargs)
+
+    async def create_entity(self, *args, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.create_entity, *args, **kwargs)
+
+    async def upsert_entity(self, *args, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.upsert_entity, *args, **kwargs)
+
+    async def update_entity(self, *args, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.update_entity, *args, **kwargs)
+
+    async def delete_entity(self, *args, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.delete_entity, *args, **kwargs)
+
+    async def submit_transaction(self, operations, **kwargs):
+        await self._storage.simulate()
+        return await asyncio.to_thread(self._table.submit_transaction, operations, **kwargs)
+
+
+def _measure_page(result):
+    page, _ = result
+    return len(page), sum(entity_bytes(entity) for entity in page)
+
+
+class GuardedAsyncStorage:
+    """Async backend wrapper whose table calls go through the table policy (and its circuit breaker)"""
+
+    def __init__(self, inner, table_policy):
+        self.inner = inner
+        self.table_policy = table_policy
+
+    def get_table_client(self, table_name):
+        return GuardedAsyncTableClient(self.inner.get_table_client(table_name), self.table_policy)
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+
+class GuardedAsyncPageIterator:
+    """by_page() iterator that fetches each page as its own guarded call (see resilience.GuardedPageIterator)"""
+
+    def __init__(self, paged, continuation_token):
+        self._paged = paged
+        self.continuation_token = continuation_token
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        token = self.continuation_token
+
+        async def fetch():
+            pages = self._paged.make_query().by_page(continuation_token=token)
+            try:
+                # Pages are fetched lazily, so read the whole page inside the attempt
+                page = [entity async for entity in await pages.__anext__()]
+            except StopAsyncIteration:
+                page = []
+            return page, pages.continuation_token
+
+        page, self.continuation_token = await self._paged.policy.call_async(
+            fetch, hedge=True, operation='query_page', measure=_measure_page
+        )
+        self._done = self.continuation_token is None
+        return AsyncLocalPage(page)
+
+
+class GuardedAsyncPaged:
+    def __init__(self, policy, make_query):
+        self.policy = policy
+        self.make_query = make_query
+
+    def by_page(self, continuation_token=None):
+        return GuardedAsyncPageIterator(self, continuation_token)
+
+    async def __aiter__(self):
+        async for page in self.by_page():
+            async for entity in page:
+                yield entity
+
+
+class GuardedAsyncTableClient:
+    def __init__(self, inner, policy):
+        self._inner = inner
+        self._policy = policy
+
+    def query_entities(self, query_filter, **kwargs):
+        return GuardedAsyncPaged(self._policy, lambda: self._inner.query_entities(query_filter, **kwargs))
+
+    def list_entities(self, **kwargs):
+        return GuardedAsyncPaged(self._policy, lambda: self._inner.list_entities(**kwargs))
+
+    async def get_entity(self, *args, **kwargs):
+        return await self._policy.call_async(lambda: self._inner.get_entity(*args, **kwargs), hedge=True,
+                                             operation='get_entity', measure=lambda entity: (1, entity_bytes(entity)))
+
+    async def upsert_entity(self, entity, **kwargs):
+        return await self._policy.call_async(lambda: self._inner.upsert_entity(entity, **kwargs),
+                                             operation='upsert_entity', measure=lambda _: (1, entity_bytes(entity)))
+
+    async def delete_entity(self, *args, **kwargs):
+        return await self._policy.call_async(lambda: self._inner.delete_entity(*args, **kwargs),
+                                             operation='delete_entity')
+
+    # As in GuardedTableClient, creates and conditional updates are never retried
+
+    async def create_entity(self, entity, **kwargs):
+        return await self._policy.call_async(lambda: self._inner.create_entity(entity, **kwargs), idempotent=False,
+                                             operation='create_entity', measure=lambda _: (1, entity_bytes(entity)))
+
+    async def update_entity(self, entity, **kwargs):
+        return await self._policy.call_async(lambda: self._inner.update_entity(entity, **kwargs), idempotent=False,
+                                             operation='update_entity', measure=lambda _: (1, entity_bytes(entity)))
+
+    async def submit_transaction(self, operations, **kwargs):
+        operations = list(operations)
+        idempotent = all(operation[0] == 'upsert' for operation in operations)
+        return await self._policy.call_async(
+            lambda: self._inner.submit_transaction(operations, **kwargs), idempotent=idempotent,
+            operation='submit_transaction',
+            measure=lambda _: (len(operations), sum(entity_bytes(operation[1]) for operation in operations))
+        )
@@ -0,0 +1,83 @@
+"""Streaming CSV parsing and batched table writes for bulk uploads.
+
+iter_csv_rows decodes an upload as it is read, so only one buffer of text
+and one row are held at a time instead of the whole file. upsert_in_batches
+groups entities into entity group transactions of up to 100 operations (the
+service limit), so a 10,000 row roster costs about 100 round trips instead of
+10,000. Memory stays bounded by one batch no matter how large the file is.
+
+A transaction is all-or-nothing. If one fails, its rows are retried one at a
+time, so a single bad row only loses that row.
+"""
+import csv
+import io
+
+from resilience import StorageUnavailable
+
+BATCH_SIZE = 100  # Most operations Table Storage accepts in one transaction
+
+
+class _Readable(io.RawIOBase):
+    """Adapts any object with read(n) to what io.TextIOWrapper expects"""
+
+    def __init__(self, stream):
+        self._stream = stream
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._stream.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+def iter_csv_rows(stream, encoding='utf-8-sig'):
+    """DictReader over a binary stream, decoded incrementally (a leading BOM is dropped)"""
+    text = io.TextIOWrapper(io.BufferedReader(_Readable(stream)), encoding=encoding, newline='')
+    return csv.DictReader(text)
+
+
+def batches(entities, size=BATCH_SIZE):
+    """Group entities into lists that can go in one transaction.
+
+    A batch holds one PartitionKey and each RowKey at most once, so a batch is
+    closed early when the partition changes or a row repeats. The repeated row
+    then lands in a later batch and still wins, as it would with single upserts.
+    """
+    batch, keys = [], set()
+    for entity in entities:
+        key = (entity['PartitionKey'], entity['RowKey'])
+        if batch and (len(batch) >= size or key in keys or key[0] != batch[0]['PartitionKey']):
+            yield batch
+            batch, keys = [], set()
+        batch.append(entity)
+        keys.add(key)
+    if batch:
+        yield batch
+
+
+def write_batch(table_client, batch, on_error=None):
+    """Upsert one batch in a transaction, or row by row if that fails; returns the entities written"""
+    try:
+        table_client.submit_transaction([('upsert', entity) for entity in batch])
+        return batch
+    except StorageUnavailable:
+        raise  # Row-by-row writes would fail the same way
+    except Exception as e:
+        print(f"Batch of {len(batch)} failed, writing rows one at a time: {e}")
+    written = []
+    for entity in batch:
+        try:
+            table_client.upsert_entity(entity)
+            written.append(entity)
+        except Exception as e:
+            print(f"Error uploading entity: {e}")
+            if on_error:
+                on_error(f"{entity['RowKey']}: {e}")
+    return written
+
+
+def upsert_in_batches(table_client, entities, size=BATCH_SIZE):
+    """Upsert entities in transactions; returns how many were written"""
+    return sum(len(write_batch(table_client, batch)) for batch in batches(entities, size))
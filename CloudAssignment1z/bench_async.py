@@ -0,0 +1,153 @@
+"""Load test: the Flask app on a fixed pool of worker threads vs asgi.py on one event loop.
+
+Both modes run in-process against the same offline SQLite table with the same
+long-tailed latency injected into every storage call. Each of --clients
+simulated users sends requests back to back, using the request mix from
+bench_throughput.py. The threaded mode can only work on --workers requests at
+a time, like a gunicorn deployment with that many sync workers. The async mode
+has a single thread.
+
+    python bench_async.py --people 2000 --clients 200 --requests 2000 --workers 8 --latency-ms 50
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+
+def report(mode, latencies, elapsed):
+    from bench_throughput import percentile
+    everything = [value for values in latencies.values() for value in values]
+    print(f"\n{mode}: {len(everything)} requests in {elapsed:.2f}s = {len(everything) / elapsed:.1f} req/s")
+    print(f"{'route':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for label in sorted(latencies):
+        values = latencies[label]
+        print(f"{label:<22}{len(values):>7}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}{statistics.mean(values) * 1000:>10.1f}")
+
+
+def run_threaded(app_module, names, args):
+    """--clients threads queue their requests for --workers threads, like sync workers behind a listen queue"""
+    from bench_throughput import make_requests
+    workers = ThreadPoolExecutor(max_workers=args.workers)
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    remaining = [args.requests]
+
+    def serve(method, path, form):
+        response = getattr(app_module.app.test_client(), method)(path, data=form)
+        response.get_data()
+        return response
+
+    def client():
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            label, method, path, form = make_requests(names)
+            start = time.perf_counter()
+            response = workers.submit(serve, method, path, form).result()
+            elapsed = time.perf_counter() - start
+            if response.status_code >= 500:
+                print(f"{label}: HTTP {response.status_code}", file=sys.stderr)
+            with lock:
+                latencies[label].append(elapsed)
+
+    threads = [threading.Thread(target=client) for _ in range(args.clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report(f"threaded ({args.workers} workers)", latencies, time.perf_counter() - start)
+    workers.shutdown()
+
+
+async def asgi_request(asgi_app, method, path, form=None):
+    """Send one request to an ASGI app in-process; returns (status, body)"""
+    path, _, query = path.partition('?')
+    body = urllib.parse.urlencode(form).encode('ascii') if form else b''
+    scope = {
+        'type': 'http', 'method': method.upper(), 'path': path, 'raw_path': path.encode('ascii'),
+        'query_string': query.encode('ascii'), 'headers': [
+            (b'content-type', b'application/x-www-form-urlencoded'),
+            (b'content-length', str(len(body)).encode('ascii')),
+        ],
+        'http_version': '1.1', 'scheme': 'http', 'server': ('localhost', 80), 'client': ('127.0.0.1', 0),
+    }
+    chunks, status = [], [None]
+
+    async def receive():
+        return {'type': 'http.request', 'body': body, 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            status[0] = message['status']
+        else:
+            chunks.append(message.get('body', b''))
+
+    await asgi_app(scope, receive, send)
+    return status[0], b''.join(chunks)
+
+
+async def run_async(asgi_module, names, args):
+    from bench_throughput import make_requests
+    latencies = defaultdict(list)
+    remaining = [args.requests]
+
+    async def client():
+        while remaining[0] > 0:
+            remaining[0] -= 1
+            label, method, path, form = make_requests(names)
+            start = time.perf_counter()
+            status, _ = await asgi_request(asgi_module.app, method, path, form)
+            latencies[label].append(time.perf_counter() - start)
+            if status >= 500:
+                print(f"{label}: HTTP {status}", file=sys.stderr)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(args.clients)))
+    report("asyncio (1 thread)", latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=200, help='concurrent simulated users')
+    parser.add_argument('--requests', type=int, default=2000, help='total requests per mode')
+    parser.add_argument('--workers', type=int, default=8, help='worker threads in the threaded mode')
+    parser.add_argument('--latency-ms', type=float, default=50.0, help='median injected latency per storage call')
+    args = parser.parse_args()
+
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='bench-async-')
+    os.environ['LOCAL_STORAGE_LATENCY_MS'] = '0'
+    # Queued requests shouldn't hit the per-request storage budget
+    os.environ.setdefault('STORAGE_REQUEST_BUDGET', '600')
+    os.environ.setdefault('SEARCH_CACHE_SIZE', '0')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    import asgi as asgi_module
+    from bench_throughput import seed
+
+    names = seed(app_module, args.people)
+    print(f"{args.people} people, {args.clients} clients, {args.latency_ms:g} ms median injected latency")
+
+    app_module.get_storage().latency.median_ms = args.latency_ms
+    run_threaded(app_module, names, args)
+
+    asgi_module.get_async_storage().latency.median_ms = args.latency_ms
+    asyncio.run(run_async(asgi_module, names, args))
+
+
+if __name__ == '__main__':
+    main()
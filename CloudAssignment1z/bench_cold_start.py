@@ -0,0 +1,71 @@
+"""Cold-start benchmark: time from `import app` to the first served request.
+
+The Azure SDK is stubbed so the numbers measure only our own startup work:
+the credential never talks to Entra ID and the readiness probe's request
+sleeps for PROBE_LATENCY instead of going to the network. A slow probe should
+not show up in the cold-start time because it runs in the background.
+
+    python bench_cold_start.py [runs]
+"""
+import os
+import statistics
+import subprocess
+import sys
+
+PROBE_LATENCY = 2.0
+
+CHILD = '''
+import time
+start = time.perf_counter()
+
+import azure.identity
+import azure.storage.blob
+
+class StubCredential:
+    def __init__(self, *args, **kwargs):
+        pass
+    def get_token(self, *scopes, **kwargs):
+        raise RuntimeError("stub credential")
+
+def slow_exists(self, **kwargs):
+    time.sleep(%(probe_latency)s)
+    return True
+
+azure.identity.DefaultAzureCredential = StubCredential
+azure.storage.blob.ContainerClient.exists = slow_exists
+
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get('/')
+served = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(f"COLD_START {imported - start:.4f} {served - start:.4f}")
+'''
+
+
+def run_once():
+    stdout = subprocess.run(
+        [sys.executable, '-c', CHILD % {'probe_latency': PROBE_LATENCY}],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    # The app logs to stdout too (the background probe may finish after the request), so find our line
+    result = next(line for line in stdout.splitlines() if line.startswith('COLD_START '))
+    imported, served = (float(value) for value in result.split()[1:])
+    return imported, served
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = [run_once() for _ in range(runs)]
+    imports = [r[0] for r in results]
+    firsts = [r[1] for r in results]
+    print(f"runs: {runs} (readiness probe stubbed at {PROBE_LATENCY:.1f}s)")
+    print(f"import app:           median {statistics.median(imports) * 1000:8.1f} ms  max {max(imports) * 1000:8.1f} ms")
+    print(f"first request served: median {statistics.median(firsts) * 1000:8.1f} ms  max {max(firsts) * 1000:8.1f} ms")
+
+
+if __name__ == '__main__':
+    main()
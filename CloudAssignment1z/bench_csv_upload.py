@@ -0,0 +1,82 @@
+"""Peak memory and storage calls of a CSV upload: read-everything vs streamed and batched.
+
+Generates a people CSV of --rows rows on disk and loads it into an offline
+SQLite table twice:
+
+  * whole:    file.read().decode(), csv.DictReader(io.StringIO(...)), one upsert per row
+  * streamed: iter_csv_rows over the file, upsert_in_batches (100 rows per transaction)
+
+Peak memory is measured with tracemalloc while each upload runs.
+
+    python bench_csv_upload.py --rows 50000
+"""
+import argparse
+import csv
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+
+def write_csv(path, rows):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Name', 'State', 'Salary', 'Grade', 'Room', 'Phone', 'Picture', 'Keywords'])
+        for i in range(rows):
+            writer.writerow([f'Person {i}', 'TX', 40000 + i % 90000, i % 100, 100 + i % 400,
+                             f'555-{i % 10000:04d}', f'person{i}.jpg', 'likes long keyword lists, tea, chess'])
+
+
+def upload_whole(app_module, table_client, stream):
+    csv_reader = csv.DictReader(io.StringIO(stream.read().decode('utf-8')))
+    count = 0
+    for row in csv_reader:
+        table_client.upsert_entity(app_module.person_entity_from_csv(row, count))
+        count += 1
+    return count
+
+
+def upload_streamed(app_module, table_client, stream):
+    from batching import iter_csv_rows, upsert_in_batches
+    entities = (app_module.person_entity_from_csv(row, number) for number, row in enumerate(iter_csv_rows(stream)))
+    return upsert_in_batches(table_client, entities)
+
+
+def measure(label, upload, app_module, path):
+    table_client = app_module.get_storage().get_table_client('people')
+    calls_before = dict(app_module.telemetry._transactions)
+    tracemalloc.start()
+    start = time.perf_counter()
+    with open(path, 'rb') as stream:
+        count = upload(app_module, table_client, stream)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    calls = sum(app_module.telemetry._transactions.values()) - sum(calls_before.values())
+    print(f"{label:<10}{count:>10}{elapsed:>10.2f}{peak / 1024 / 1024:>12.1f}{calls:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=50000)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='bench-csv-')
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = directory
+    os.environ['LOCAL_STORAGE_LATENCY_MS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    path = os.path.join(directory, 'people.csv')
+    write_csv(path, args.rows)
+    print(f"{args.rows} rows, {os.path.getsize(path) / 1024 / 1024:.1f} MB CSV")
+    print(f"{'mode':<10}{'rows':>10}{'seconds':>10}{'peak MB':>12}{'requests':>12}")
+    measure('whole', upload_whole, app_module, path)
+    measure('streamed', upload_streamed, app_module, path)
+
+
+if __name__ == '__main__':
+    main()
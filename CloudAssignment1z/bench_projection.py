@@ -0,0 +1,111 @@
+"""Measure what column projection saves on a 50k-person table.
+
+Builds a stand-in `people` table on the local SQLite backend, then scans it the
+way search_salary does: once fetching every property (the old query) and once
+with select=CARD_FIELDS / KEY_FIELDS. Reports the JSON payload the service
+would have sent and the client CPU time to deserialize it (json + the SDK's
+entity conversion) and convert it for rendering.
+
+    python bench_projection.py [people]
+"""
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+os.environ.setdefault('STORAGE_BACKEND', 'local')
+os.environ.setdefault('LOCAL_STORAGE_DIR', tempfile.mkdtemp(prefix='bench-projection-'))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import app as app_module  # noqa: E402
+from azure.data.tables._deserialize import _convert_to_entity  # noqa: E402
+
+STATES = ['CT', 'NY', 'CA', 'TX', 'FL', 'WA', 'OR', 'MA', 'CO', 'GA']
+WORDS = ('python data cloud engineer analyst security developer manager '
+         'machine learning architect mobile frontend backend database').split()
+
+
+def seed(table_client, people):
+    batch = []
+    for i in range(people):
+        name = f"Person{i:06d}"
+        batch.append(('upsert', {
+            'PartitionKey': app_module.PERSON_PARTITION,
+            'RowKey': app_module.person_row_key(name),
+            'Name': name,
+            'State': random.choice(STATES),
+            'Salary': str(random.randint(30000, 150000)),
+            'Grade': random.choice('ABCDEF'),
+            'Room': str(random.randint(100, 999)),
+            'Phone': f"555-555-{i % 10000:04d}",
+            'Picture': f"{name.lower()}.jpg",
+            'Keywords': ' '.join(random.choice(WORDS) for _ in range(25)),
+        }))
+        if len(batch) == 100:
+            table_client.submit_transaction(batch)
+            batch = []
+    if batch:
+        table_client.submit_transaction(batch)
+
+
+def old_unwrap(entity):
+    """The per-field hasattr(value, 'value') unwrapping the routes used to do"""
+    values = {}
+    for key, value in entity.items():
+        values[key] = str(value.value) if hasattr(value, 'value') else str(value)
+    return values
+
+
+def wire_pages(table_client, select):
+    """Response bodies the Table service would send for the scan, one per 1000 entities"""
+    query = "PartitionKey eq 'person'"
+    pages = table_client.query_entities(query, select=select, results_per_page=1000).by_page()
+    for page in pages:
+        entries = []
+        for entity in page:
+            entry = dict(entity, **{'odata.etag': entity.metadata['etag']})
+            if select is None:
+                # Unprojected queries also return the system Timestamp property
+                entry['Timestamp'] = entity.metadata['timestamp']
+            entries.append(entry)
+        yield json.dumps({'value': entries})
+
+
+def scan(table_client, select, convert):
+    """Return (entities, payload bytes, client CPU seconds) for one full scan"""
+    bodies = list(wire_pages(table_client, select))
+    start = time.process_time()
+    count = 0
+    for body in bodies:
+        # What the SDK does with each response, followed by the app's own conversion
+        for entry in json.loads(body)['value']:
+            convert(_convert_to_entity(entry))
+            count += 1
+    cpu = time.process_time() - start
+    return count, sum(len(body.encode('utf-8')) for body in bodies), cpu
+
+
+def main():
+    people = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    table_client = app_module.get_storage().get_table_client('people')
+    print(f"Seeding {people} people...")
+    seed(table_client, people)
+
+    runs = [
+        ('all properties (before)', None, old_unwrap),
+        ('CARD_FIELDS', app_module.CARD_FIELDS, lambda e: app_module.to_plain(e, app_module.CARD_FIELDS)),
+        ('KEY_FIELDS', app_module.KEY_FIELDS, lambda e: app_module.to_plain(e, app_module.KEY_FIELDS)),
+    ]
+    baseline = None
+    print(f"{'query':<26}{'entities':>10}{'payload MB':>12}{'vs before':>11}{'cpu s':>9}{'vs before':>11}")
+    for label, select, convert in runs:
+        count, payload, cpu = scan(table_client, select, convert)
+        baseline = baseline or (payload, cpu)
+        print(f"{label:<26}{count:>10}{payload / 1e6:>12.2f}{payload / baseline[0]:>10.0%}"
+              f"{cpu:>9.2f}{cpu / baseline[1]:>10.0%}")
+
+
+if __name__ == '__main__':
+    main()
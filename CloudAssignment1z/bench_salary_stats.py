@@ -0,0 +1,74 @@
+"""/salary_stats from maintained aggregates vs a full scan per request.
+
+Seeds an offline SQLite table with --people people, then times:
+
+  * scan:     one full query of State, Grade and Salary and exact statistics
+              computed from it (what answering from search_salary-style scans costs)
+  * sketches: SalaryStats.summary over the maintained aggregates
+  * update:   SalaryStats.set for one changed row
+
+and reports the largest percentile error of the sketches against the exact values.
+
+    python bench_salary_stats.py --people 20000 --latency-ms 5
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=20000)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='median injected latency per storage call')
+    args = parser.parse_args()
+
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='bench-stats-')
+    os.environ['LOCAL_STORAGE_LATENCY_MS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    from bench_throughput import seed
+    from salary_stats import parse_salary
+
+    seed(app_module, args.people)
+    storage = app_module.get_storage()
+    storage.latency.median_ms = args.latency_ms
+    table_client = storage.get_table_client('people')
+
+    start = time.perf_counter()
+    salaries = {}
+    for person in table_client.query_entities(f"PartitionKey eq '{app_module.PERSON_PARTITION}'",
+                                              select=['State', 'Grade', 'Salary'], results_per_page=1000):
+        salaries.setdefault(person['State'], []).append(parse_salary(person['Salary']))
+    exact = {state: statistics.quantiles(values, n=100) for state, values in salaries.items()}
+    scan = time.perf_counter() - start
+
+    app_module.recompute_salary_stats()
+    start = time.perf_counter()
+    summary = app_module.salary_aggregates.summary(group_by=('State',))
+    sketches = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for i in range(1000):
+        app_module.salary_aggregates.set('person000000', 'TX', 'A', 50000 + i)
+    update = (time.perf_counter() - start) / 1000
+
+    worst = 0.0
+    for group in summary['groups']:
+        true = exact[group['State']]
+        for p in (50, 90, 99):
+            estimate = group['percentiles'][f'p{p}']
+            worst = max(worst, abs(estimate - true[p - 1]) / true[p - 1])
+
+    print(f"{args.people} people, {args.latency_ms:g} ms median injected latency")
+    print(f"full scan per request:  {scan * 1000:10.1f} ms")
+    print(f"maintained aggregates:  {sketches * 1000:10.3f} ms")
+    print(f"incremental update:     {update * 1e6:10.1f} us")
+    print(f"worst percentile error: {worst * 100:10.2f} %")
+
+
+if __name__ == '__main__':
+    main()
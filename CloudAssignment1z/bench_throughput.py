@@ -0,0 +1,122 @@
+"""Throughput benchmark for the app on the offline storage backend.
+
+Seeds a local SQLite table with synthetic people, then drives the search and
+update routes from several threads through Flask's test client and reports
+requests/second and latency percentiles per route. No network is used; set
+--latency-ms to approximate a real storage account's per-call latency.
+
+    python bench_throughput.py --people 2000 --threads 8 --requests 200 --latency-ms 5
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+STATES = ['CT', 'NY', 'CA', 'TX', 'FL', 'WA', 'OR', 'MA', 'CO', 'GA']
+GRADES = ['A', 'B', 'C', 'D', 'E', 'F']
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def seed(app_module, people):
+    storage = app_module.get_storage()
+    table_client = storage.get_table_client('people')
+    names = []
+    for i in range(people):
+        name = f"Person{i:06d}"
+        names.append(name)
+        table_client.upsert_entity({
+            'PartitionKey': app_module.PERSON_PARTITION,
+            'RowKey': app_module.person_row_key(name),
+            'Name': name,
+            'State': random.choice(STATES),
+            'Salary': str(random.randint(30000, 150000)),
+            'Grade': random.choice(GRADES),
+            'Room': str(random.randint(100, 999)),
+            'Phone': f"555-{i:04d}",
+            'Picture': '',
+            'Keywords': 'synthetic benchmark person',
+        })
+    return names
+
+
+def make_requests(names):
+    """Weighted mix of route calls as (label, method, path, form) tuples"""
+    name = random.choice(names)
+    roll = random.random()
+    if roll < 0.4:
+        return ('search_name exact', 'get', f'/search_name?exact_name={name}', None)
+    if roll < 0.6:
+        return ('search_name partial', 'get', f'/search_name?name={name[:-2]}', None)
+    if roll < 0.8:
+        return ('search_salary', 'get', f'/search_salary?comparison=over&salary_amount={random.randint(140000, 149000)}', None)
+    return ('update_person', 'post', '/update_person', {'name': name, 'field': 'Room', 'value': str(random.randint(100, 999))})
+
+
+def worker(client, names, count, latencies, lock):
+    for _ in range(count):
+        label, method, path, form = make_requests(names)
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data=form)
+        # search_salary streams its page; the timing must include producing the body
+        response.get_data()
+        response.close()
+        elapsed = time.perf_counter() - start
+        if response.status_code >= 500:
+            print(f"{label}: HTTP {response.status_code}", file=sys.stderr)
+        with lock:
+            latencies[label].append(elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--people', type=int, default=2000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='median injected latency per storage call')
+    args = parser.parse_args()
+
+    os.environ['STORAGE_BACKEND'] = 'local'
+    os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='bench-storage-')
+    os.environ['LOCAL_STORAGE_LATENCY_MS'] = '0'
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    names = seed(app_module, args.people)
+    app_module.get_storage().latency.median_ms = args.latency_ms
+
+    latencies = defaultdict(list)
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(app_module.app.test_client(), names, args.requests, latencies, lock))
+        for _ in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{args.people} people, {args.threads} threads, {args.latency_ms:g} ms injected latency")
+    print(f"{total} requests in {elapsed:.2f}s = {total / elapsed:.1f} req/s")
+    print(f"{'route':<22}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}")
+    for label in sorted(latencies):
+        values = latencies[label]
+        print(f"{label:<22}{len(values):>7}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}{statistics.mean(values) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
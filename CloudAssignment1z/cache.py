@@ -0,0 +1,110 @@
+"""Bounded TTL + LRU cache for search results.
+
+Entries remember which RowKeys they contain, so a write to one person drops
+only the cached searches that person appears in instead of the whole cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Thread-safe LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=256, ttl=60.0, clock=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()   # key -> (expires_at, value, row_keys)
+        self._keys_by_row = {}          # row_key -> set of cache keys containing it
+        # Bumped on every invalidation so loads that raced with a write aren't stored
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _drop(self, key):
+        _, _, row_keys = self._entries.pop(key)
+        for row_key in row_keys:
+            keys = self._keys_by_row.get(row_key)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_row[row_key]
+
+    def lookup(self, key):
+        """Return (hit, value, generation); pass generation back to store() after a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1], self._generation
+            if entry is not None:
+                self._drop(key)
+            self.misses += 1
+            return False, None, self._generation
+
+    def store(self, key, value, row_keys, generation):
+        """Cache value unless something was invalidated since lookup() returned generation"""
+        with self._lock:
+            if generation != self._generation:
+                return
+            if key in self._entries:
+                self._drop(key)
+            row_keys = frozenset(row_keys)
+            self._entries[key] = (self._clock() + self.ttl, value, row_keys)
+            for row_key in row_keys:
+                self._keys_by_row.setdefault(row_key, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() -> (value, row_keys) on a miss"""
+        hit, value, generation = self.lookup(key)
+        if hit:
+            return value
+        value, row_keys = loader()
+        self.store(key, value, row_keys, generation)
+        return value
+
+    def invalidate_rows(self, row_keys):
+        """Drop every entry that contains one of the given RowKeys"""
+        with self._lock:
+            self._generation += 1
+            for row_key in row_keys:
+                for key in list(self._keys_by_row.get(row_key, ())):
+                    self._drop(key)
+                    self.invalidations += 1
+
+    def invalidate_where(self, predicate):
+        """Drop every entry whose key matches predicate(key)"""
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries if predicate(key)]:
+                self._drop(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+            self._keys_by_row.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl_seconds': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
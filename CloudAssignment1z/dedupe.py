@@ -0,0 +1,121 @@
+"""Content-hash deduplication for blob uploads.
+
+Uploads are hashed (MD5, the hash Blob Storage keeps as Content-MD5) as they
+are read. Before sending any bytes:
+
+  * if the target blob already holds that content, the upload is skipped
+  * if another blob holds it, the target is created with a server-side copy
+  * otherwise the bytes are uploaded, with Content-MD5 set so later uploads
+    can be compared against it
+
+BlobHashIndex remembers which blob holds which content. It is filled from one
+listing of the container and from every upload this process makes.
+"""
+import hashlib
+import threading
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import ContentSettings
+
+HASH_CHUNK_SIZE = 64 * 1024
+
+SKIPPED = 'skipped'
+ALIASED = 'aliased'
+UPLOADED = 'uploaded'
+
+
+def read_and_hash(stream, chunk_size=HASH_CHUNK_SIZE):
+    """Read a file-like object to the end in chunks; returns (data, md5 digest)"""
+    md5 = hashlib.md5()
+    chunks = []
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        md5.update(chunk)
+        chunks.append(chunk)
+    return b''.join(chunks), md5.digest()
+
+
+class BlobHashIndex:
+    """Thread-safe map between blob names and their content MD5"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._md5_by_name = {}
+        self._names_by_md5 = {}
+        self.warmed = False
+
+    def record(self, name, md5):
+        if not md5:
+            return
+        md5 = bytes(md5)
+        with self._lock:
+            self._forget(name)
+            self._md5_by_name[name] = md5
+            self._names_by_md5.setdefault(md5, set()).add(name)
+
+    def _forget(self, name):
+        md5 = self._md5_by_name.pop(name, None)
+        if md5 is not None:
+            names = self._names_by_md5[md5]
+            names.discard(name)
+            if not names:
+                del self._names_by_md5[md5]
+
+    def forget(self, name):
+        with self._lock:
+            self._forget(name)
+
+    def find(self, md5, exclude=None):
+        """Name of some other blob believed to hold this content, or None"""
+        with self._lock:
+            for name in self._names_by_md5.get(bytes(md5), ()):
+                if name != exclude:
+                    return name
+        return None
+
+    def warm(self, container_client):
+        """Index every blob in the container once (a listing returns each blob's Content-MD5)"""
+        if self.warmed:
+            return
+        for blob in container_client.list_blobs():
+            self.record(blob.name, blob.content_settings.content_md5)
+        self.warmed = True
+
+
+def _with_md5(content_settings, md5):
+    return ContentSettings(
+        content_type=content_settings.content_type if content_settings else None,
+        cache_control=content_settings.cache_control if content_settings else None,
+        content_md5=bytearray(md5),
+    )
+
+
+def upload_deduplicated(container_client, index, name, data, md5, content_settings=None):
+    """Store data as blob `name` unless that content is already stored; returns SKIPPED, ALIASED or UPLOADED"""
+    blob_client = container_client.get_blob_client(name)
+    try:
+        stored_md5 = blob_client.get_blob_properties().content_settings.content_md5
+        if stored_md5 and bytes(stored_md5) == md5:
+            index.record(name, md5)
+            return SKIPPED
+    except ResourceNotFoundError:
+        pass
+
+    source = index.find(md5, exclude=name)
+    if source is not None:
+        try:
+            source_client = container_client.get_blob_client(source)
+            blob_client.start_copy_from_url(source_client.url, requires_sync=True)
+            if content_settings is not None:
+                blob_client.set_http_headers(content_settings=_with_md5(content_settings, md5))
+            index.record(name, md5)
+            return ALIASED
+        except ResourceNotFoundError:
+            # The source was deleted since it was indexed
+            index.forget(source)
+
+    blob_client.upload_blob(data, overwrite=True, content_settings=_with_md5(content_settings, md5))
+    index.record(name, md5)
+    return UPLOADED
@@ -0,0 +1,70 @@
+"""Resized picture variants for profile images.
+
+Search result cards show pictures at 150px and the detail page at 200px, so
+serving the original upload (often several megapixels) to every card wastes
+most of the page's bytes. make_variants() turns one upload into a small card
+thumbnail, a detail-page image and the untouched original.
+"""
+import hashlib
+import io
+
+from PIL import Image, ImageOps
+
+# Longest edge in pixels for each resized variant (2x the CSS size for hi-dpi screens)
+VARIANT_SIZES = {
+    'thumb': 300,
+    'detail': 600,
+}
+JPEG_QUALITY = 85
+
+# Variant blob names contain a content hash, so browsers and CDNs may cache them forever
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'webp': 'image/webp',
+}
+
+
+def _resize(image, size):
+    variant = image.copy()
+    variant.thumbnail((size, size), Image.LANCZOS)
+    if variant.mode != 'RGB':
+        # JPEG has no alpha channel; flatten transparent images onto white
+        background = Image.new('RGB', variant.size, 'white')
+        rgba = variant.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        variant = background
+    output = io.BytesIO()
+    variant.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+def make_variants(data, base_name, extension):
+    """Return {variant: (blob_name, bytes, content_type)} for an uploaded image.
+
+    Raises ValueError if the data is not an image Pillow can read.
+    """
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Not a supported image: {e}")
+    # Phones record rotation in EXIF; bake it in since the resized JPEGs drop EXIF
+    image = ImageOps.exif_transpose(image)
+
+    extension = extension.lower()
+    version = hashlib.sha256(data).hexdigest()[:12]
+    variants = {
+        'original': (
+            f"{base_name}_{version}.{extension}",
+            data,
+            CONTENT_TYPES.get(extension, 'application/octet-stream'),
+        )
+    }
+    for variant, size in VARIANT_SIZES.items():
+        variants[variant] = (f"{base_name}_{version}_{variant}.jpg", _resize(image, size), 'image/jpeg')
+    return variants
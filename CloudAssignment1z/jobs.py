@@ -0,0 +1,267 @@
+"""Background jobs for long-running imports.
+
+A job is a directory under the job root holding the spooled upload files and
+job.json, its state. Handlers report progress through JobProgress. Each
+checkpoint saves job.json, so a job interrupted by a restart resumes from its
+last checkpoint instead of from the start.
+
+A worker claims a job by taking an exclusive flock on the job's lease file
+and holds it until the job stops. The kernel grants the lock to one open file
+at a time across all processes, and drops it when its holder dies. Several
+gunicorn workers can therefore share one job directory without running a job
+twice, and a job whose worker crashed can be claimed again at the next scan.
+
+Finished and failed jobs are deleted once they are older than the store's
+retention.
+"""
+import fcntl
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from telemetry import current_route
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+RECENT_ERRORS = 20  # Error messages kept on a job; the count covers all of them
+
+
+def _now():
+    return datetime.utcnow().isoformat() + 'Z'
+
+
+class JobStore:
+    """Jobs kept as directories on local disk"""
+
+    def __init__(self, root, retention_seconds=7 * 24 * 3600):
+        self.root = root
+        self.retention_seconds = retention_seconds
+        self._lock = threading.Lock()
+        self._leases = {}  # job ID -> descriptor of the lease file this process has locked
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, job_id, *parts):
+        # Job IDs come from URLs, so only accept what create() makes
+        if not job_id or not all(c in '0123456789abcdef' for c in job_id):
+            raise KeyError(job_id)
+        return os.path.join(self.root, job_id, *parts)
+
+    def create(self, kind, uploads, **params):
+        """Spool uploads ((filename, FileStorage) pairs) to disk and queue a job for them"""
+        job_id = uuid.uuid4().hex
+        os.makedirs(self._path(job_id, 'files'))
+        files = []
+        for number, (filename, upload) in enumerate(uploads):
+            upload.save(self._path(job_id, 'files', str(number)))
+            files.append(filename)
+        job = {
+            'id': job_id, 'kind': kind, 'status': QUEUED, 'files': files, 'params': params,
+            'created': _now(), 'started': None, 'finished': None,
+            'checkpoint': 0, 'rows_done': 0, 'rows_written': 0, 'errors': 0, 'recent_errors': [],
+            'seconds': 0.0, 'runs': 0,
+        }
+        self.save(job)
+        return job
+
+    def file_path(self, job, number):
+        return self._path(job['id'], 'files', str(number))
+
+    def load(self, job_id):
+        try:
+            with open(self._path(job_id, 'job.json'), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(job_id)
+
+    def save(self, job):
+        # Write then rename, so a crash never leaves a half-written job.json
+        path = self._path(job['id'], 'job.json')
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(job, f)
+        os.replace(path + '.tmp', path)
+
+    def list(self):
+        jobs = []
+        for job_id in os.listdir(self.root):
+            try:
+                jobs.append(self.load(job_id))
+            except (KeyError, ValueError):
+                continue
+        return sorted(jobs, key=lambda job: job['created'], reverse=True)
+
+    def unfinished(self):
+        return [job['id'] for job in self.list() if job['status'] in (QUEUED, RUNNING)]
+
+    def claim(self, job_id):
+        """Take the job's lease; False if a worker in any process holds it"""
+        # The lease file is never deleted on its own: a process that opened the old
+        # file and one that created a new one could then both hold "the" lock
+        try:
+            fd = os.open(self._path(job_id, 'lease'), os.O_CREAT | os.O_RDWR)
+        except FileNotFoundError:
+            return False  # The job was deleted
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            return False
+        with self._lock:
+            self._leases[job_id] = fd
+        return True
+
+    def release(self, job_id):
+        with self._lock:
+            fd = self._leases.pop(job_id, None)
+        if fd is not None:
+            os.close(fd)  # Closing the file drops the lock
+
+    def prune(self):
+        """Delete finished and failed jobs older than the retention; returns how many"""
+        cutoff = (datetime.utcnow() - timedelta(seconds=self.retention_seconds)).isoformat() + 'Z'
+        pruned = 0
+        for job in self.list():
+            if job['status'] not in (DONE, FAILED) or not job['finished'] or job['finished'] >= cutoff:
+                continue
+            # Holding the lease means no other worker is looking at the job while it goes
+            if not self.claim(job['id']):
+                continue
+            try:
+                shutil.rmtree(self._path(job['id']), ignore_errors=True)
+                pruned += 1
+            finally:
+                self.release(job['id'])
+        return pruned
+
+    def discard_files(self, job_id):
+        shutil.rmtree(self._path(job_id, 'files'), ignore_errors=True)
+
+
+class JobProgress:
+    """Handed to a job handler to read where to resume and to record progress"""
+
+    def __init__(self, store, job):
+        self._store = store
+        self.job = job
+        self._started = time.monotonic()
+        self._seconds_before = job['seconds']
+
+    @property
+    def checkpoint(self):
+        return self.job['checkpoint']
+
+    def file_path(self, number):
+        return self._store.file_path(self.job, number)
+
+    def error(self, message):
+        self.job['errors'] += 1
+        self.job['recent_errors'] = (self.job['recent_errors'] + [message])[-RECENT_ERRORS:]
+
+    def update_seconds(self):
+        self.job['seconds'] = self._seconds_before + time.monotonic() - self._started
+
+    def advance(self, rows, written, checkpoint):
+        """Record rows handled since the last call and save the new checkpoint"""
+        self.job['rows_done'] += rows
+        self.job['rows_written'] += written
+        self.job['checkpoint'] = checkpoint
+        self.update_seconds()
+        self._store.save(self.job)
+
+
+def describe(job):
+    """A job's state for the /jobs endpoints, with its throughput"""
+    described = {key: value for key, value in job.items() if key != 'params'}
+    described['rows_per_second'] = round(job['rows_done'] / job['seconds'], 1) if job['seconds'] else 0.0
+    return described
+
+
+class JobRunner:
+    """Runs queued jobs on a thread pool and picks up jobs abandoned by dead workers"""
+
+    def __init__(self, store, handlers, workers=2, retry_on=()):
+        self.store = store
+        self.handlers = handlers  # kind -> handler(progress)
+        self.retry_on = retry_on  # Exceptions that put a job back in the queue instead of failing it
+        self.workers = workers
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest-job')
+        self._active = 0
+        self._active_lock = threading.Lock()
+        self._watcher = None
+
+    def submit(self, job_id):
+        """Start the job if a worker is free and no one else holds it; otherwise it waits for a later scan"""
+        # A claimed job keeps its lease until it stops, so claim only what a free worker can start
+        with self._active_lock:
+            if self._active >= self.workers or not self.store.claim(job_id):
+                return False
+            self._active += 1
+        self._pool.submit(self._run_claimed, job_id)
+        return True
+
+    def _run_claimed(self, job_id):
+        try:
+            self._run(job_id)
+        finally:
+            self.store.release(job_id)
+            with self._active_lock:
+                self._active -= 1
+
+    def _run(self, job_id):
+        try:
+            job = self.store.load(job_id)
+        except KeyError:
+            return  # Pruned since it was listed
+        if job['status'] not in (QUEUED, RUNNING):
+            return  # Finished by another worker since it was listed
+        current_route.set(f"job:{job['kind']}")
+        job['status'] = RUNNING
+        job['started'] = job['started'] or _now()
+        job['runs'] += 1
+        self.store.save(job)
+        progress = JobProgress(self.store, job)
+        try:
+            self.handlers[job['kind']](progress)
+            job['status'] = DONE
+        except self.retry_on as e:
+            # Picked up again from the checkpoint on a later scan
+            print(f"Job {job_id} paused: {e}")
+            progress.error(str(e))
+            job['status'] = QUEUED
+        except Exception as e:
+            print(f"Job {job_id} failed: {e}")
+            progress.error(str(e))
+            job['status'] = FAILED
+        progress.update_seconds()
+        if job['status'] != QUEUED:
+            job['finished'] = _now()
+            self.store.discard_files(job_id)
+        self.store.save(job)
+
+    def resume_unfinished(self):
+        """Claim every queued or interrupted job that no live worker holds"""
+        for job_id in self.store.unfinished():
+            if self.submit(job_id):
+                print(f"Picked up ingest job {job_id}")
+
+    def start_watching(self, interval):
+        """Resume unfinished jobs (and prune old ones) now and every `interval` seconds, on a daemon thread"""
+        def watch():
+            while True:
+                try:
+                    self.resume_unfinished()
+                    self.store.prune()
+                except Exception as e:
+                    print(f"⚠️ Could not scan ingest jobs: {e}")
+                time.sleep(interval)
+
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=watch, name='ingest-watcher', daemon=True)
+            self._watcher.start()
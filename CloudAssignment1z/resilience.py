@@ -0,0 +1,582 @@
+"""Deadlines, bounded retries, hedged reads and a circuit breaker for storage calls.
+
+GuardedStorage wraps a storage backend (see storage.py) so every table and blob
+call made by the app goes through a CallPolicy (async_storage.GuardedAsyncStorage
+does the same for the asyncio backends, with CallPolicy.call_async):
+
+  * each call gets whatever is left of the request's time budget, capped per attempt
+  * transient failures are retried a bounded number of times with full-jitter backoff
+  * idempotent reads still running after the observed p95 latency get a second,
+    hedged attempt, and the first result to arrive wins
+  * after repeated transient failures a circuit breaker fails calls immediately
+    until a trial call succeeds
+
+Calls that can't complete raise StorageUnavailable. Given an observer (see
+telemetry.py), the policy reports every call with its latency, outcome and the
+transactions it cost.
+
+An attempt that runs past its timeout can't be stopped; it is abandoned on a
+daemon thread and its result ignored (a coroutine attempt is cancelled, but
+its request may already have been sent). A timed-out write that isn't retried
+(create, conditional update, ...) may therefore still be applied after the
+caller got StorageUnavailable.
+"""
+import asyncio
+import queue
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from azure.core.exceptions import HttpResponseError, ServiceRequestError, ServiceResponseError
+
+from telemetry import entity_bytes
+
+RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class StorageUnavailable(Exception):
+    """Storage could not answer within the request's budget, or is known to be down"""
+
+
+def is_transient(error):
+    """Whether an error says the service is unhealthy rather than the request is wrong"""
+    if isinstance(error, (ServiceRequestError, ServiceResponseError, FutureTimeoutError, TimeoutError)):
+        return True
+    if isinstance(error, HttpResponseError):
+        return error.status_code in RETRYABLE_STATUS
+    return False
+
+
+class CircuitBreaker:
+    """Opens after failure_threshold consecutive transient failures and
+    lets a single trial call through once reset_timeout has passed"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return 'closed'
+            if self._clock() - self._opened_at >= self.reset_timeout:
+                return 'half-open'
+            return 'open'
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if self._clock() - self._opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = self._clock()
+            self._trial_in_flight = False
+
+
+class DaemonExecutor:
+    """Thread pool whose workers are daemon threads.
+
+    ThreadPoolExecutor joins its workers at interpreter exit, so one abandoned
+    attempt stuck on the network would hold up shutdown. Workers are started
+    as needed, up to max_workers, and then reused.
+    """
+
+    def __init__(self, max_workers=64, thread_name_prefix='storage-call'):
+        self.max_workers = max_workers
+        self.thread_name_prefix = thread_name_prefix
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._threads = 0
+        self._idle = 0
+
+    def submit(self, fn, *args):
+        future = Future()
+        self._queue.put((future, fn, args))
+        with self._lock:
+            if self._idle == 0 and self._threads < self.max_workers:
+                self._threads += 1
+                threading.Thread(target=self._work, daemon=True,
+                                 name=f"{self.thread_name_prefix}_{self._threads}").start()
+        return future
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+            future, fn, args = self._queue.get()
+            with self._lock:
+                self._idle -= 1
+            if not future.set_running_or_notify_cancel():
+                continue  # Cancelled while it waited for a worker
+            try:
+                result = fn(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class LatencyTracker:
+    """Rolling window of successful call latencies"""
+
+    def __init__(self, window=500):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, default=None):
+        with self._lock:
+            samples = sorted(self._samples)
+        # Too few samples to say what "slow" means yet
+        if len(samples) < 20:
+            return default
+        return samples[min(len(samples) - 1, int(pct / 100.0 * len(samples)))]
+
+
+class CallPolicy:
+    """Runs storage calls with a time budget, retries, hedging and a circuit breaker"""
+
+    def __init__(self, breaker, deadline=lambda: None, max_attempts=3, attempt_timeout=5.0,
+                 base_backoff=0.05, max_backoff=1.0, hedge=True, executor=None, observer=None):
+        self.breaker = breaker
+        self.observer = observer
+        # Returns the absolute time.monotonic() deadline of the current request, or None
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.attempt_timeout = attempt_timeout
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.latency = LatencyTracker()
+        self._executor = executor or DaemonExecutor(max_workers=64, thread_name_prefix='storage-call')
+
+    def _remaining(self):
+        deadline = self.deadline()
+        if deadline is None:
+            return self.attempt_timeout
+        return min(self.attempt_timeout, deadline - time.monotonic())
+
+    def _timed(self, fn):
+        def run():
+            start = time.monotonic()
+            result = fn()
+            self.latency.record(time.monotonic() - start)
+            return result
+        return run
+
+    @staticmethod
+    def _result(future, timeout):
+        try:
+            return future.result(timeout=timeout)
+        except FutureTimeoutError:
+            future.cancel()  # Drops it if it never started; a running attempt is left to finish unheard
+            raise
+
+    def _attempt(self, fn, timeout, hedged, sent):
+        primary = self._executor.submit(self._timed(fn))
+        sent[0] += 1
+        if not hedged:
+            return self._result(primary, timeout)
+
+        start = time.monotonic()
+        hedge_after = self.latency.percentile(95)
+        if hedge_after is None or hedge_after >= timeout:
+            return self._result(primary, timeout)
+        done, _ = wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # The primary is slower than 95% of recent calls: race it against a second read
+        futures = [primary, self._executor.submit(self._timed(fn))]
+        sent[0] += 1
+        error = None
+        while futures:
+            left = timeout - (time.monotonic() - start)
+            if left <= 0:
+                break
+            done, pending = wait(futures, timeout=left, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    return future.result()
+                except Exception as e:
+                    error = e
+            futures = list(pending)
+        if error is not None and not futures:
+            raise error
+        for future in futures:
+            future.cancel()
+        raise FutureTimeoutError()
+
+    def call(self, fn, idempotent=True, hedge=False, operation='call', measure=None):
+        """Run fn() under the policy. Non-idempotent calls are never retried or hedged,
+        but one that times out may still complete after StorageUnavailable is raised.
+
+        operation names the call for the observer; measure(result) returns the
+        (entities, bytes) it moved.
+        """
+        start = time.monotonic()
+        sent = [0]
+        try:
+            result = self._call(fn, idempotent, hedge, sent)
+        except Exception as e:
+            self._observe(operation, start, type(e).__name__, sent[0])
+            raise
+        entities, nbytes = measure(result) if measure else (0, 0)
+        self._observe(operation, start, 'ok', sent[0], entities, nbytes)
+        return result
+
+    def _observe(self, operation, start, outcome, transactions, entities=0, nbytes=0):
+        if self.observer is not None:
+            self.observer.observe_call(self.breaker.name, operation, time.monotonic() - start,
+                                       outcome, entities, nbytes, transactions)
+
+    def _admit(self):
+        """Seconds the next attempt may take, or None once the budget is spent; raises if the circuit is open"""
+        # Checked before allow(): a half-open breaker's trial slot must end in a recorded outcome
+        timeout = self._remaining()
+        if timeout <= 0:
+            return None
+        if not self.breaker.allow():
+            raise StorageUnavailable(
+                f"Azure {self.breaker.name} storage is temporarily unavailable - please try again shortly"
+            )
+        return timeout
+
+    def _failed(self, error):
+        """Record a failed attempt; False when the error should go straight to the caller"""
+        if not is_transient(error):
+            # The service answered; the request itself was wrong (404, 412, ...)
+            self.breaker.record_success()
+            return False
+        self.breaker.record_failure()
+        return True
+
+    def _backoff(self, attempt, attempts):
+        """Seconds to wait before the next attempt (0 when there is none, or no time for it)"""
+        if attempt + 1 >= attempts:
+            return 0
+        # Full jitter keeps retrying workers from synchronizing
+        backoff = random.uniform(0, min(self.max_backoff, self.base_backoff * 2 ** attempt))
+        return backoff if self._remaining() > backoff else 0
+
+    def _gave_up(self, last_error):
+        return StorageUnavailable(
+            f"Azure {self.breaker.name} storage did not respond in time - please try again"
+            + (f" ({type(last_error).__name__})" if last_error else "")
+        )
+
+    def _call(self, fn, idempotent, hedge, sent):
+        attempts = self.max_attempts if idempotent else 1
+        last_error = None
+        for attempt in range(attempts):
+            timeout = self._admit()
+            if timeout is None:
+                break
+            try:
+                result = self._attempt(fn, timeout, hedge and idempotent and self.hedge, sent)
+            except Exception as e:
+                if not self._failed(e):
+                    raise
+                last_error = e
+                time.sleep(self._backoff(attempt, attempts))
+                continue
+            self.breaker.record_success()
+            return result
+        raise self._gave_up(last_error)
+
+    # --- The same policy for coroutines (see async_storage.GuardedAsyncStorage) ---
+
+    async def _timed_async(self, fn):
+        start = time.monotonic()
+        result = await fn()
+        self.latency.record(time.monotonic() - start)
+        return result
+
+    async def _attempt_async(self, fn, timeout, hedged, sent):
+        primary = asyncio.ensure_future(self._timed_async(fn))
+        sent[0] += 1
+        hedge_after = self.latency.percentile(95) if hedged else None
+        if hedge_after is None or hedge_after >= timeout:
+            return await asyncio.wait_for(primary, timeout)  # Cancels the attempt when it runs out of time
+
+        start = time.monotonic()
+        done, _ = await asyncio.wait([primary], timeout=hedge_after)
+        if done:
+            return primary.result()
+
+        # The primary is slower than 95% of recent calls: race it against a second read
+        tasks = [primary, asyncio.ensure_future(self._timed_async(fn))]
+        sent[0] += 1
+        error = None
+        try:
+            while tasks:
+                left = timeout - (time.monotonic() - start)
+                if left <= 0:
+                    break
+                done, pending = await asyncio.wait(tasks, timeout=left, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+                tasks = list(pending)
+        finally:
+            for task in tasks:
+                task.cancel()
+        if error is not None and not tasks:
+            raise error
+        raise TimeoutError()
+
+    async def call_async(self, fn, idempotent=True, hedge=False, operation='call', measure=None):
+        """call() for coroutines: fn() returns a new awaitable for each attempt.
+
+        Shares the breaker, latency window and observer with call(), so the
+        threaded and asyncio entry points of one process see the same health.
+        """
+        start = time.monotonic()
+        sent = [0]
+        try:
+            result = await self._call_async(fn, idempotent, hedge, sent)
+        except Exception as e:
+            self._observe(operation, start, type(e).__name__, sent[0])
+            raise
+        entities, nbytes = measure(result) if measure else (0, 0)
+        self._observe(operation, start, 'ok', sent[0], entities, nbytes)
+        return result
+
+    async def _call_async(self, fn, idempotent, hedge, sent):
+        attempts = self.max_attempts if idempotent else 1
+        last_error = None
+        for attempt in range(attempts):
+            timeout = self._admit()
+            if timeout is None:
+                break
+            try:
+                result = await self._attempt_async(fn, timeout, hedge and idempotent and self.hedge, sent)
+            except Exception as e:
+                if not self._failed(e):
+                    raise
+                last_error = e
+                await asyncio.sleep(self._backoff(attempt, attempts))
+                continue
+            self.breaker.record_success()
+            return result
+        raise self._gave_up(last_error)
+
+
+def _measure_entity(entity):
+    return 1, entity_bytes(entity)
+
+
+def _measure_page(result):
+    page, _ = result
+    return len(page), sum(entity_bytes(entity) for entity in page)
+
+
+def _measure_data(data):
+    return 0, len(data) if isinstance(data, (bytes, bytearray)) else 0
+
+
+class GuardedPageIterator:
+    """by_page() iterator that fetches each page as its own guarded call.
+
+    Every attempt restarts the query from the last continuation token, so pages
+    can be retried and hedged safely.
+    """
+
+    def __init__(self, paged, continuation_token):
+        self._paged = paged
+        self.continuation_token = continuation_token
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        token = self.continuation_token
+
+        def fetch():
+            pages = self._paged.make_query().by_page(continuation_token=token)
+            try:
+                page = list(next(pages))
+            except StopIteration:
+                page = []
+            return page, pages.continuation_token
+
+        page, self.continuation_token = self._paged.policy.call(
+            fetch, hedge=True, operation='query_page', measure=_measure_page
+        )
+        self._done = self.continuation_token is None
+        return iter(page)
+
+
+class GuardedPaged:
+    def __init__(self, policy, make_query):
+        self.policy = policy
+        self.make_query = make_query
+
+    def by_page(self, continuation_token=None):
+        return GuardedPageIterator(self, continuation_token)
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class GuardedTableClient:
+    """TableClient whose calls go through a CallPolicy"""
+
+    def __init__(self, inner, policy):
+        self._inner = inner
+        self._policy = policy
+
+    def query_entities(self, query_filter, **kwargs):
+        return GuardedPaged(self._policy, lambda: self._inner.query_entities(query_filter, **kwargs))
+
+    def list_entities(self, **kwargs):
+        return GuardedPaged(self._policy, lambda: self._inner.list_entities(**kwargs))
+
+    def get_entity(self, *args, **kwargs):
+        return self._policy.call(lambda: self._inner.get_entity(*args, **kwargs), hedge=True,
+                                 operation='get_entity', measure=_measure_entity)
+
+    def upsert_entity(self, entity, **kwargs):
+        return self._policy.call(lambda: self._inner.upsert_entity(entity, **kwargs),
+                                 operation='upsert_entity', measure=lambda _: _measure_entity(entity))
+
+    def delete_entity(self, *args, **kwargs):
+        return self._policy.call(lambda: self._inner.delete_entity(*args, **kwargs), operation='delete_entity')
+
+    # A retried create or conditional update could fail on its own earlier success
+
+    def create_entity(self, entity, **kwargs):
+        return self._policy.call(lambda: self._inner.create_entity(entity, **kwargs), idempotent=False,
+                                 operation='create_entity', measure=lambda _: _measure_entity(entity))
+
+    def update_entity(self, entity, **kwargs):
+        return self._policy.call(lambda: self._inner.update_entity(entity, **kwargs), idempotent=False,
+                                 operation='update_entity', measure=lambda _: _measure_entity(entity))
+
+    def submit_transaction(self, operations, **kwargs):
+        operations = list(operations)
+        # Replaying a batch of upserts leaves the same rows behind, so only those are retried
+        idempotent = all(operation[0] == 'upsert' for operation in operations)
+        return self._policy.call(
+            lambda: self._inner.submit_transaction(operations, **kwargs), idempotent=idempotent,
+            operation='submit_transaction',
+            measure=lambda _: (len(operations), sum(entity_bytes(operation[1]) for operation in operations))
+        )
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class GuardedBlobClient:
+    """BlobClient whose calls go through a CallPolicy"""
+
+    def __init__(self, inner, policy):
+        self._inner = inner
+        self._policy = policy
+
+    def exists(self, **kwargs):
+        return self._policy.call(lambda: self._inner.exists(**kwargs), hedge=True, operation='blob_exists')
+
+    def get_blob_properties(self, **kwargs):
+        return self._policy.call(lambda: self._inner.get_blob_properties(**kwargs), hedge=True,
+                                 operation='get_blob_properties')
+
+    def download_blob(self, **kwargs):
+        return self._policy.call(lambda: self._inner.download_blob(**kwargs), operation='download_blob',
+                                 measure=lambda downloader: (0, downloader.size or 0))
+
+    def upload_blob(self, data, **kwargs):
+        # Only an overwriting upload of in-memory bytes can safely be sent twice
+        idempotent = kwargs.get('overwrite', False) and isinstance(data, (bytes, bytearray))
+        return self._policy.call(lambda: self._inner.upload_blob(data, **kwargs), idempotent=idempotent,
+                                 operation='upload_blob', measure=lambda _: _measure_data(data))
+
+    def start_copy_from_url(self, source_url, **kwargs):
+        return self._policy.call(lambda: self._inner.start_copy_from_url(source_url, **kwargs),
+                                 operation='copy_blob')
+
+    def set_http_headers(self, **kwargs):
+        return self._policy.call(lambda: self._inner.set_http_headers(**kwargs), operation='set_http_headers')
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class GuardedContainerClient:
+    """ContainerClient whose calls go through a CallPolicy"""
+
+    def __init__(self, inner, policy):
+        self._inner = inner
+        self._policy = policy
+
+    def exists(self, **kwargs):
+        return self._policy.call(lambda: self._inner.exists(**kwargs), hedge=True, operation='container_exists')
+
+    def get_blob_client(self, blob):
+        return GuardedBlobClient(self._inner.get_blob_client(blob), self._policy)
+
+    def upload_blob(self, name, data, **kwargs):
+        idempotent = kwargs.get('overwrite', False) and isinstance(data, (bytes, bytearray))
+        return self._policy.call(lambda: self._inner.upload_blob(name, data, **kwargs), idempotent=idempotent,
+                                 operation='upload_blob', measure=lambda _: _measure_data(data))
+
+    def list_blobs(self, **kwargs):
+        return iter(self._policy.call(lambda: list(self._inner.list_blobs(**kwargs)), operation='list_blobs'))
+
+    def __getattr__(self, name):
+        return getattr(self._inner, name)
+
+
+class GuardedStorage:
+    """Storage backend wrapper with one policy (and circuit breaker) per service"""
+
+    def __init__(self, inner, table_policy, blob_policy):
+        self.inner = inner
+        self.table_policy = table_policy
+        self.blob_policy = blob_policy
+
+    def get_table_client(self, table_name):
+        return GuardedTableClient(self.inner.get_table_client(table_name), self.table_policy)
+
+    def get_container_client(self, container):
+        return GuardedContainerClient(self.inner.get_container_client(container), self.blob_policy)
+
+    def blob_url(self, container, blob_name):
+        return self.inner.blob_url(container, blob_name)
+
+    def probe(self):
+        return self.blob_policy.call(self.inner.probe, operation='probe')
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
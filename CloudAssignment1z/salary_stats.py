@@ -0,0 +1,219 @@
+"""Salary statistics by State and Grade, kept up to date without scanning the table.
+
+Each (State, Grade) group keeps a count, sum and sum of squares (for the
+mean and standard deviation), a fixed-width histogram and a QuantileSketch.
+All of them can add, remove and merge values, so:
+
+  * a write changes only the groups of the row it touched
+  * wider groupings (by State, by Grade, everything) are built by merging
+    the per-group aggregates when asked for
+
+SalaryStats remembers each row's current contribution by RowKey. Upserts and
+deletes therefore don't need to know a row's old values. A full recompute
+from the table (rebuild) corrects drift from writes this process didn't see,
+such as writes by other workers or rows that failed to import.
+"""
+import math
+import threading
+import time
+
+PERCENTILES = (50, 90, 99)
+
+
+def parse_salary(value):
+    """A stored salary ("$85,000", "85000", ...) as a float, or None if it isn't a number"""
+    try:
+        salary = float(str(value).replace('$', '').replace(',', '').strip())
+    except ValueError:
+        return None
+    return salary if math.isfinite(salary) else None
+
+
+class QuantileSketch:
+    """Log-bucketed sketch (DDSketch): any quantile to within relative_accuracy.
+
+    Bucket i counts values in (gamma**(i-1), gamma**i]. Counts can be
+    decremented and sketches with the same accuracy merge exactly.
+    """
+
+    def __init__(self, relative_accuracy=0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zero_count = 0  # Values <= 0
+        self.count = 0
+
+    def add(self, value, weight=1):
+        if value <= 0:
+            self.zero_count += weight
+        else:
+            index = math.ceil(math.log(value) / self._log_gamma)
+            count = self.buckets.get(index, 0) + weight
+            if count:
+                self.buckets[index] = count
+            else:
+                del self.buckets[index]
+        self.count += weight
+
+    def merge(self, other):
+        if other.gamma != self.gamma:
+            raise ValueError("Sketches must have the same relative accuracy to merge")
+        for index, count in other.buckets.items():
+            merged = self.buckets.get(index, 0) + count
+            if merged:
+                self.buckets[index] = merged
+            else:
+                self.buckets.pop(index, None)
+        self.zero_count += other.zero_count
+        self.count += other.count
+
+    def quantile(self, q):
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen > rank:
+                return 2 * self.gamma ** index / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class SalaryAggregate:
+    """Count, moments, histogram and quantile sketch of one group's salaries"""
+
+    def __init__(self, relative_accuracy, bin_width):
+        self.bin_width = bin_width
+        self.count = 0
+        self.total = 0.0
+        self.total_squares = 0.0
+        self.histogram = {}  # bin number -> count
+        self.sketch = QuantileSketch(relative_accuracy)
+
+    def add(self, salary, weight=1):
+        self.count += weight
+        self.total += weight * salary
+        self.total_squares += weight * salary * salary
+        bin_number = int(salary // self.bin_width)
+        count = self.histogram.get(bin_number, 0) + weight
+        if count:
+            self.histogram[bin_number] = count
+        else:
+            del self.histogram[bin_number]
+        self.sketch.add(salary, weight)
+
+    def merge(self, other):
+        self.count += other.count
+        self.total += other.total
+        self.total_squares += other.total_squares
+        for bin_number, count in other.histogram.items():
+            self.histogram[bin_number] = self.histogram.get(bin_number, 0) + count
+        self.sketch.merge(other.sketch)
+
+    def summary(self, percentiles=PERCENTILES):
+        mean = self.total / self.count
+        # Removals can leave a little float error behind; the next rebuild clears it
+        variance = max(self.total_squares / self.count - mean * mean, 0.0)
+        return {
+            'count': self.count,
+            'mean': round(mean, 2),
+            'stddev': round(math.sqrt(variance), 2),
+            'percentiles': {f'p{p:g}': round(self.sketch.quantile(p / 100), 2) for p in percentiles},
+            'histogram': [
+                {'from': bin_number * self.bin_width, 'to': (bin_number + 1) * self.bin_width, 'count': count}
+                for bin_number, count in sorted(self.histogram.items()) if count
+            ],
+        }
+
+
+class SalaryStats:
+    """Thread-safe per-(State, Grade) salary aggregates, updated one row at a time"""
+
+    def __init__(self, relative_accuracy=0.01, bin_width=10000):
+        self.relative_accuracy = relative_accuracy
+        self.bin_width = bin_width
+        self._lock = threading.Lock()
+        self._groups = {}  # (State, Grade) -> SalaryAggregate
+        self._rows = {}    # RowKey -> ((State, Grade), salary)
+        self._changes = None  # Changes made while a rebuild scans the table
+        self.rebuilt_at = None  # time.time() of the last full recompute
+
+    def _aggregate(self):
+        return SalaryAggregate(self.relative_accuracy, self.bin_width)
+
+    @staticmethod
+    def _apply(groups, rows, aggregate, row_key, state, grade, salary):
+        previous = rows.pop(row_key, None)
+        if previous is not None:
+            group, old_salary = previous
+            groups[group].add(old_salary, -1)
+            if not groups[group].count:
+                del groups[group]
+        if salary is not None:
+            group = (state or '', grade or '')
+            if group not in groups:
+                groups[group] = aggregate()
+            groups[group].add(salary)
+            rows[row_key] = (group, salary)
+
+    def set(self, row_key, state, grade, salary):
+        """Record a row's current State, Grade and Salary (replacing what it had before)"""
+        salary = parse_salary(salary)
+        with self._lock:
+            self._apply(self._groups, self._rows, self._aggregate, row_key, state, grade, salary)
+            if self._changes is not None:
+                self._changes.append((row_key, state, grade, salary))
+
+    def remove(self, row_key):
+        with self._lock:
+            self._apply(self._groups, self._rows, self._aggregate, row_key, None, None, None)
+            if self._changes is not None:
+                self._changes.append((row_key, None, None, None))
+
+    def rebuild(self, rows):
+        """Recompute everything from (RowKey, State, Grade, Salary) rows, e.g. a full table scan.
+
+        Writes made while the scan runs are replayed on the new aggregates, so
+        they aren't lost to a page the scan had already read.
+        """
+        with self._lock:
+            self._changes = []
+        try:
+            groups, by_row = {}, {}
+            for row_key, state, grade, salary in rows:
+                self._apply(groups, by_row, self._aggregate, row_key, state, grade, parse_salary(salary))
+            with self._lock:
+                for change in self._changes:
+                    self._apply(groups, by_row, self._aggregate, *change)
+                self._groups, self._rows = groups, by_row
+                self.rebuilt_at = time.time()
+        finally:
+            with self._lock:
+                self._changes = None
+
+    def summary(self, group_by=('State', 'Grade'), state=None, grade=None, percentiles=PERCENTILES):
+        """Statistics for every group, merging the stored groups into the requested grouping"""
+        merged = {}
+        overall = self._aggregate()
+        with self._lock:
+            for (group_state, group_grade), aggregate in self._groups.items():
+                if (state is not None and group_state != state) or (grade is not None and group_grade != grade):
+                    continue
+                values = {'State': group_state, 'Grade': group_grade}
+                key = tuple(values[field] for field in group_by)
+                if key not in merged:
+                    merged[key] = self._aggregate()
+                merged[key].merge(aggregate)
+                overall.merge(aggregate)
+        groups = []
+        for key, aggregate in sorted(merged.items()):
+            if aggregate.count:
+                groups.append({**dict(zip(group_by, key)), **aggregate.summary(percentiles)})
+        return {
+            'group_by': list(group_by),
+            'groups': groups,
+            'overall': overall.summary(percentiles) if overall.count else None,
+        }
@@ -0,0 +1,708 @@
+"""Storage backends for the Cloud Picture Storage System.
+
+The app only talks to storage through a backend object with the same surface
+as the Azure service clients it used to hold directly:
+
+    backend.get_table_client('people')    -> query/get/create/upsert/update/delete entities
+    backend.get_container_client('images') -> upload/read blobs
+    backend.blob_url('images', name)       -> URL the browser can load a blob from
+    backend.probe()                        -> one cheap request to check connectivity
+
+AzureStorage wraps the real SDK clients. LocalStorage keeps tables in SQLite and
+blobs in a directory, with optional latency injection, so the whole app can be
+run, profiled and load-tested without a storage account.
+"""
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from azure.core import MatchConditions
+from azure.core.exceptions import (
+    ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ServiceResponseError
+)
+from azure.core.pipeline.transport import RequestsTransport
+from azure.data.tables import TableEntity, TableServiceClient, TableTransactionError, UpdateMode
+from azure.storage.blob import BlobServiceClient, ContentSettings
+
+
+class AzureStorage:
+    """Azure Table and Blob storage accessed with DefaultAzureCredential"""
+
+    def __init__(self, account_name, credential, pool_size=20, **client_kwargs):
+        self.account_name = account_name
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('https://', adapter)
+        # Both clients share one keep-alive pool; closing either keeps the session open
+        transport = RequestsTransport(session=session, session_owner=False)
+        self.blob_service = BlobServiceClient(
+            account_url=f"https://{account_name}.blob.core.windows.net",
+            credential=credential,
+            transport=transport,
+            **client_kwargs
+        )
+        self.table_service = TableServiceClient(
+            endpoint=f"https://{account_name}.table.core.windows.net",
+            credential=credential,
+            transport=transport,
+            **client_kwargs
+        )
+
+    def get_table_client(self, table_name):
+        return self.table_service.get_table_client(table_name)
+
+    def get_container_client(self, container):
+        return self.blob_service.get_container_client(container)
+
+    def blob_url(self, container, blob_name):
+        return f"https://{self.account_name}.blob.core.windows.net/{container}/{blob_name}"
+
+    def probe(self):
+        # One properties request on our own container instead of listing every container
+        return self.get_container_client('images').exists()
+
+
+class LatencyModel:
+    """Log-normal per-call latency, which has the long tail real storage calls show,
+    plus an optional rate of transient failures"""
+
+    def __init__(self, median_ms=0.0, sigma=0.5, failure_rate=0.0):
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.failure_rate = failure_rate
+
+    def delay(self):
+        """Seconds the next call should take"""
+        if self.median_ms > 0:
+            return random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000.0
+        return 0.0
+
+    def maybe_fail(self):
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ServiceResponseError("Injected transient storage failure")
+
+    def simulate(self):
+        delay = self.delay()
+        if delay:
+            time.sleep(delay)
+        self.maybe_fail()
+
+
+class LocalStorage:
+    """Tables in a SQLite file and blobs in a directory tree, for offline runs"""
+
+    def __init__(self, root, latency_ms=0.0, latency_sigma=0.5, failure_rate=0.0, url_prefix='/local_blobs'):
+        self.root = root
+        self.blob_root = os.path.join(root, 'blobs')
+        self.url_prefix = url_prefix
+        self.latency = LatencyModel(latency_ms, latency_sigma, failure_rate)
+        os.makedirs(self.blob_root, exist_ok=True)
+        self._db_path = os.path.join(root, 'tables.sqlite3')
+        self._local = threading.local()
+        # Serializes read-check-write sequences (conditional updates, creates)
+        self._write_lock = threading.RLock()
+        with self._connect() as db:
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('''CREATE TABLE IF NOT EXISTS entities (
+                table_name TEXT, pk TEXT, rk TEXT, etag TEXT, ts TEXT, props TEXT,
+                PRIMARY KEY (table_name, pk, rk))''')
+            db.execute('''CREATE TABLE IF NOT EXISTS blobs (
+                container TEXT, name TEXT, etag TEXT, size INTEGER, last_modified TEXT,
+                content_type TEXT, cache_control TEXT, content_md5 BLOB, metadata TEXT,
+                PRIMARY KEY (container, name))''')
+
+    def _connect(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self._db_path, timeout=30, isolation_level=None)
+            self._local.db = db
+        return db
+
+    def get_table_client(self, table_name):
+        return LocalTableClient(self, table_name)
+
+    def get_container_client(self, container):
+        return LocalContainerClient(self, container)
+
+    def blob_url(self, container, blob_name):
+        return f"{self.url_prefix}/{container}/{blob_name}"
+
+    def blob_path(self, container, blob_name):
+        path = os.path.abspath(os.path.join(self.blob_root, container, blob_name))
+        if not path.startswith(os.path.abspath(self.blob_root) + os.sep):
+            raise ValueError(f"Invalid blob name: {blob_name}")
+        return path
+
+    def probe(self):
+        self.latency.simulate()
+        return True
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat()
+
+
+def _new_etag():
+    return f'W/"datetime\'{uuid.uuid4().hex}\'"'
+
+
+def _to_entity(pk, rk, etag, ts, props, select=None):
+    values = {'PartitionKey': pk, 'RowKey': rk}
+    values.update(json.loads(props))
+    if select:
+        values = {key: values[key] for key in select if key in values}
+    entity = TableEntity(values)
+    entity._metadata = {'etag': etag, 'timestamp': ts}
+    return entity
+
+
+def _check_etag(current_etag, etag, match_condition):
+    if match_condition == MatchConditions.IfNotModified and etag != current_etag:
+        raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+
+
+class LocalPage(list):
+    """One page of query results; continuation_token is None on the last page"""
+    continuation_token = None
+
+
+class LocalPageIterator:
+    """Mimics the iterator returned by ItemPaged.by_page(): continuation_token
+    is updated after each page and is None once the last page was returned"""
+
+    def __init__(self, paged, continuation_token):
+        self._paged = paged
+        self.continuation_token = continuation_token
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        page = self._paged._table._fetch_page(
+            self._paged._predicate, self._paged._partition, self._paged._select,
+            self._paged._page_size, self.continuation_token
+        )
+        self.continuation_token = page.continuation_token
+        self._done = page.continuation_token is None
+        return iter(page)
+
+
+class LocalPaged:
+    """Mimics azure.core.paging.ItemPaged: iterate entities, or by_page() for pages"""
+
+    def __init__(self, table_client, predicate, partition, select, results_per_page):
+        self._table = table_client
+        self._predicate = predicate
+        self._partition = partition
+        self._select = select
+        self._page_size = results_per_page or 1000
+
+    def by_page(self, continuation_token=None):
+        return LocalPageIterator(self, continuation_token)
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+
+class LocalTableClient:
+    """The subset of azure.data.tables.TableClient the app uses, on SQLite"""
+
+    def __init__(self, storage, table_name):
+        self._storage = storage
+        self.table_name = table_name
+
+    def _db(self):
+        return self._storage._connect()
+
+    def _row(self, partition_key, row_key):
+        return self._db().execute(
+            'SELECT etag, ts, props FROM entities WHERE table_name=? AND pk=? AND rk=?',
+            (self.table_name, partition_key, row_key)
+        ).fetchone()
+
+    def _write(self, pk, rk, props):
+        etag = _new_etag()
+        self._db().execute(
+            'INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?)',
+            (self.table_name, pk, rk, etag, _now(), json.dumps(props))
+        )
+        return {'etag': etag}
+
+    def _fetch_page(self, predicate, partition, select, page_size, token):
+        self._storage.latency.simulate()
+        sql = 'SELECT pk, rk, etag, ts, props FROM entities WHERE table_name=?'
+        args = [self.table_name]
+        if partition is not None:
+            sql += ' AND pk=?'
+            args.append(partition)
+        if token:
+            sql += ' AND (pk > ? OR (pk = ? AND rk >= ?))'
+            args += [token['PartitionKey'], token['PartitionKey'], token['RowKey']]
+        sql += ' ORDER BY pk, rk'
+        page = LocalPage()
+        for pk, rk, etag, ts, props in self._db().execute(sql, args):
+            entity = _to_entity(pk, rk, etag, ts, props)
+            if not predicate(entity):
+                continue
+            if len(page) == page_size:
+                page.continuation_token = {'PartitionKey': pk, 'RowKey': rk}
+                break
+            if select:
+                selected = TableEntity((key, entity[key]) for key in select if key in entity)
+                selected._metadata = entity._metadata
+                entity = selected
+            page.append(entity)
+        return page
+
+    def query_entities(self, query_filter, select=None, parameters=None, results_per_page=None, **kwargs):
+        if isinstance(select, str):
+            select = [name.strip() for name in select.split(',')]
+        tree = parse_filter(query_filter, parameters or {})
+        return LocalPaged(self, compile_filter(tree), pushdown_partition(tree), select, results_per_page)
+
+    def list_entities(self, select=None, results_per_page=None, **kwargs):
+        return self.query_entities('', select=select, results_per_page=results_per_page)
+
+    def get_entity(self, partition_key, row_key, select=None, **kwargs):
+        self._storage.latency.simulate()
+        row = self._row(partition_key, row_key)
+        if row is None:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        if isinstance(select, str):
+            select = [name.strip() for name in select.split(',')]
+        return _to_entity(partition_key, row_key, *row, select)
+
+    def create_entity(self, entity, **kwargs):
+        self._storage.latency.simulate()
+        with self._storage._write_lock:
+            return self._create(entity)
+
+    def upsert_entity(self, entity, mode=UpdateMode.MERGE, **kwargs):
+        self._storage.latency.simulate()
+        with self._storage._write_lock:
+            return self._upsert(entity, mode)
+
+    def update_entity(self, entity, mode=UpdateMode.MERGE, etag=None, match_condition=None, **kwargs):
+        self._storage.latency.simulate()
+        with self._storage._write_lock:
+            return self._update(entity, mode, etag, match_condition)
+
+    def delete_entity(self, *args, partition_key=None, row_key=None, etag=None, match_condition=None, **kwargs):
+        self._storage.latency.simulate()
+        if args and isinstance(args[0], dict):
+            partition_key, row_key = args[0]['PartitionKey'], args[0]['RowKey']
+        elif args:
+            partition_key, row_key = args
+        with self._storage._write_lock:
+            return self._delete(partition_key, row_key, etag, match_condition)
+
+    def submit_transaction(self, operations, **kwargs):
+        """Atomically apply (kind, entity[, options]) operations that share a partition"""
+        operations = list(operations)
+        if len(operations) > 100:
+            raise ValueError("A transaction may contain at most 100 operations")
+        if len({op[1]['PartitionKey'] for op in operations}) > 1:
+            raise ValueError("All operations in a transaction must share a PartitionKey")
+        self._storage.latency.simulate()
+        results = []
+        with self._storage._write_lock:
+            db = self._db()
+            db.execute('BEGIN IMMEDIATE')
+            try:
+                for index, op in enumerate(operations):
+                    kind, entity = op[0], op[1]
+                    options = dict(op[2]) if len(op) > 2 else {}
+                    mode = options.pop('mode', UpdateMode.MERGE)
+                    try:
+                        if kind == 'create':
+                            results.append(self._create(entity))
+                        elif kind == 'upsert':
+                            results.append(self._upsert(entity, mode))
+                        elif kind == 'update':
+                            results.append(self._update(
+                                entity, mode, options.get('etag'), options.get('match_condition')
+                            ))
+                        elif kind == 'delete':
+                            results.append(self._delete(
+                                entity['PartitionKey'], entity['RowKey'],
+                                options.get('etag'), options.get('match_condition')
+                            ))
+                        else:
+                            raise ValueError(f"Unknown transaction operation: {kind}")
+                    except (ResourceExistsError, ResourceNotFoundError, ResourceModifiedError) as e:
+                        raise TableTransactionError(message=f"{index}:{e.message}", index=index)
+            except Exception:
+                db.execute('ROLLBACK')
+                raise
+            db.execute('COMMIT')
+        return results
+
+    # The helpers below assume the caller holds the write lock
+
+    def _create(self, entity):
+        pk, rk, props = _split(entity)
+        if self._row(pk, rk) is not None:
+            raise ResourceExistsError("The specified entity already exists.")
+        return self._write(pk, rk, props)
+
+    def _upsert(self, entity, mode):
+        pk, rk, props = _split(entity)
+        row = self._row(pk, rk)
+        if row is not None and mode == UpdateMode.MERGE:
+            props = dict(json.loads(row[2]), **props)
+        return self._write(pk, rk, props)
+
+    def _update(self, entity, mode, etag, match_condition):
+        pk, rk, props = _split(entity)
+        if etag is None and isinstance(entity, TableEntity):
+            etag = entity.metadata.get('etag')
+        row = self._row(pk, rk)
+        if row is None:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        _check_etag(row[0], etag, match_condition)
+        if mode == UpdateMode.MERGE:
+            props = dict(json.loads(row[2]), **props)
+        return self._write(pk, rk, props)
+
+    def _delete(self, partition_key, row_key, etag, match_condition):
+        row = self._row(partition_key, row_key)
+        # Like the service client, deleting a missing entity is not an error
+        if row is None:
+            return None
+        _check_etag(row[0], etag, match_condition)
+        self._db().execute(
+            'DELETE FROM entities WHERE table_name=? AND pk=? AND rk=?',
+            (self.table_name, partition_key, row_key)
+        )
+        return None
+
+
+def _split(entity):
+    props = {key: value for key, value in entity.items() if key not in ('PartitionKey', 'RowKey')}
+    return entity['PartitionKey'], entity['RowKey'], props
+
+
+class LocalBlobProperties:
+    """The fields of azure.storage.blob.BlobProperties the app reads"""
+
+    def __init__(self, container, name, etag, size, last_modified, content_settings, metadata):
+        self.container = container
+        self.name = name
+        self.etag = etag
+        self.size = size
+        self.last_modified = last_modified
+        self.content_settings = content_settings
+        self.metadata = metadata
+
+
+class LocalDownloader:
+    def __init__(self, path, properties):
+        self._path = path
+        self.properties = properties
+        self.size = properties.size
+
+    def readall(self):
+        with open(self._path, 'rb') as f:
+            return f.read()
+
+    def chunks(self, chunk_size=4 * 1024 * 1024):
+        with open(self._path, 'rb') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+
+class LocalBlobClient:
+    """The subset of azure.storage.blob.BlobClient the app uses"""
+
+    def __init__(self, storage, container, blob_name):
+        self._storage = storage
+        self.container_name = container
+        self.blob_name = blob_name
+        self.url = storage.blob_url(container, blob_name)
+
+    def _row(self):
+        return self._storage._connect().execute(
+            '''SELECT etag, size, last_modified, content_type, cache_control, content_md5, metadata
+               FROM blobs WHERE container=? AND name=?''',
+            (self.container_name, self.blob_name)
+        ).fetchone()
+
+    def exists(self, **kwargs):
+        self._storage.latency.simulate()
+        return self._row() is not None
+
+    def get_blob_properties(self, **kwargs):
+        self._storage.latency.simulate()
+        row = self._row()
+        if row is None:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+        etag, size, last_modified, content_type, cache_control, content_md5, metadata = row
+        settings = ContentSettings(
+            content_type=content_type, cache_control=cache_control,
+            content_md5=bytearray(content_md5) if content_md5 else None
+        )
+        return LocalBlobProperties(
+            self.container_name, self.blob_name, etag, size,
+            datetime.fromisoformat(last_modified), settings, json.loads(metadata or '{}')
+        )
+
+    def download_blob(self, **kwargs):
+        properties = self.get_blob_properties()
+        return LocalDownloader(self._storage.blob_path(self.container_name, self.blob_name), properties)
+
+    def upload_blob(self, data, overwrite=False, content_settings=None, metadata=None, **kwargs):
+        self._storage.latency.simulate()
+        if hasattr(data, 'read'):
+            data = data.read()
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        path = self._storage.blob_path(self.container_name, self.blob_name)
+        content_settings = content_settings or ContentSettings()
+        etag = f'"0x{uuid.uuid4().hex[:16].upper()}"'
+        with self._storage._write_lock:
+            if not overwrite and self._row() is not None:
+                raise ResourceExistsError("The specified blob already exists.")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            self._storage._connect().execute(
+                'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.container_name, self.blob_name, etag, len(data), _now(),
+                 content_settings.content_type or 'application/octet-stream',
+                 content_settings.cache_control, hashlib.md5(data).digest(),
+                 json.dumps(metadata or {}))
+            )
+        return {'etag': etag, 'content_md5': bytearray(hashlib.md5(data).digest())}
+
+    def start_copy_from_url(self, source_url, requires_sync=True, **kwargs):
+        """Server-side copy from another blob in this store; completes immediately"""
+        self._storage.latency.simulate()
+        prefix = self._storage.url_prefix + '/'
+        if not source_url.startswith(prefix) or '/' not in source_url[len(prefix):]:
+            raise ResourceNotFoundError(f"Cannot copy from {source_url}")
+        container, name = source_url[len(prefix):].split('/', 1)
+        source = LocalBlobClient(self._storage, container, name)
+        etag = f'"0x{uuid.uuid4().hex[:16].upper()}"'
+        with self._storage._write_lock:
+            row = source._row()
+            if row is None:
+                raise ResourceNotFoundError("The specified blob does not exist.")
+            _, size, _, content_type, cache_control, content_md5, metadata = row
+            path = self._storage.blob_path(self.container_name, self.blob_name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(self._storage.blob_path(container, name), path)
+            self._storage._connect().execute(
+                'INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (self.container_name, self.blob_name, etag, size, _now(),
+                 content_type, cache_control, content_md5, metadata)
+            )
+        return {'etag': etag, 'copy_status': 'success'}
+
+    def set_http_headers(self, content_settings=None, **kwargs):
+        self._storage.latency.simulate()
+        content_settings = content_settings or ContentSettings()
+        with self._storage._write_lock:
+            if self._row() is None:
+                raise ResourceNotFoundError("The specified blob does not exist.")
+            self._storage._connect().execute(
+                'UPDATE blobs SET content_type=?, cache_control=? WHERE container=? AND name=?',
+                (content_settings.content_type or 'application/octet-stream', content_settings.cache_control,
+                 self.container_name, self.blob_name)
+            )
+        return {}
+
+    def delete_blob(self, **kwargs):
+        self._storage.latency.simulate()
+        with self._storage._write_lock:
+            if self._row() is None:
+                raise ResourceNotFoundError("The specified blob does not exist.")
+            self._storage._connect().execute(
+                'DELETE FROM blobs WHERE container=? AND name=?', (self.container_name, self.blob_name)
+            )
+            os.remove(self._storage.blob_path(self.container_name, self.blob_name))
+
+
+class LocalContainerClient:
+    """The subset of azure.storage.blob.ContainerClient the app uses"""
+
+    def __init__(self, storage, container):
+        self._storage = storage
+        self.container_name = container
+
+    def exists(self, **kwargs):
+        self._storage.latency.simulate()
+        return True
+
+    def get_blob_client(self, blob):
+        return LocalBlobClient(self._storage, self.container_name, blob)
+
+    def upload_blob(self, name, data, overwrite=False, **kwargs):
+        blob_client = self.get_blob_client(name)
+        blob_client.upload_blob(data, overwrite=overwrite, **kwargs)
+        return blob_client
+
+    def list_blobs(self, name_starts_with=None, **kwargs):
+        self._storage.latency.simulate()
+        rows = self._storage._connect().execute(
+            'SELECT name FROM blobs WHERE container=? ORDER BY name', (self.container_name,)
+        ).fetchall()
+        for (name,) in rows:
+            if name_starts_with is None or name.startswith(name_starts_with):
+                yield self.get_blob_client(name).get_blob_properties()
+
+
+# --- A small OData filter evaluator -------------------------------------------
+# Supports what the app sends: comparisons (eq ne gt ge lt le) between a property
+# and a literal or @parameter, combined with and/or/not and parentheses.
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<string>'(?:[^']|'')*')
+  | (?P<number>-?\d+(?:\.\d+)?L?)
+  | (?P<param>@\w+)
+  | (?P<lparen>\()
+  | (?P<rparen>\))
+  | (?P<word>[A-Za-z_][\w]*)
+)""", re.VERBOSE)
+
+_COMPARISONS = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'ge': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'le': lambda a, b: a <= b,
+}
+
+
+def _tokenize(text, parameters):
+    tokens = []
+    pos = 0
+    text = text.strip()
+    while pos < len(text):
+        match = _TOKEN.match(text, pos)
+        if not match or match.end() == pos:
+            raise ValueError(f"Unsupported filter near: {text[pos:pos + 20]!r}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group(kind)
+        if kind == 'string':
+            tokens.append(('literal', value[1:-1].replace("''", "'")))
+        elif kind == 'number':
+            value = value.rstrip('L')
+            tokens.append(('literal', float(value) if '.' in value else int(value)))
+        elif kind == 'param':
+            tokens.append(('literal', parameters[value[1:]]))
+        elif kind == 'word' and value in ('true', 'false'):
+            tokens.append(('literal', value == 'true'))
+        else:
+            tokens.append((kind, value))
+    return tokens
+
+
+def parse_filter(text, parameters=None):
+    """Parse a filter string into a tree of ('and'|'or'|'not'|'cmp', ...) tuples"""
+    tokens = _tokenize(text or '', parameters or {})
+    if not tokens:
+        return None
+    pos = [0]
+
+    def peek():
+        return tokens[pos[0]] if pos[0] < len(tokens) else (None, None)
+
+    def take():
+        token = peek()
+        pos[0] += 1
+        return token
+
+    def parse_or():
+        node = parse_and()
+        while peek() == ('word', 'or'):
+            take()
+            node = ('or', node, parse_and())
+        return node
+
+    def parse_and():
+        node = parse_unary()
+        while peek() == ('word', 'and'):
+            take()
+            node = ('and', node, parse_unary())
+        return node
+
+    def parse_unary():
+        if peek() == ('word', 'not'):
+            take()
+            return ('not', parse_unary())
+        if peek()[0] == 'lparen':
+            take()
+            node = parse_or()
+            if take()[0] != 'rparen':
+                raise ValueError("Unbalanced parentheses in filter")
+            return node
+        kind, prop = take()
+        op_kind, op = take()
+        value_kind, value = take()
+        if kind != 'word' or op_kind != 'word' or op not in _COMPARISONS or value_kind != 'literal':
+            raise ValueError(f"Unsupported filter expression: {text!r}")
+        return ('cmp', prop, op, value)
+
+    tree = parse_or()
+    if pos[0] != len(tokens):
+        raise ValueError(f"Unsupported filter expression: {text!r}")
+    return tree
+
+
+def compile_filter(tree):
+    """Turn a parsed filter into a predicate over entities"""
+    if tree is None:
+        return lambda entity: True
+    kind = tree[0]
+    if kind == 'and':
+        left, right = compile_filter(tree[1]), compile_filter(tree[2])
+        return lambda entity: left(entity) and right(entity)
+    if kind == 'or':
+        left, right = compile_filter(tree[1]), compile_filter(tree[2])
+        return lambda entity: left(entity) or right(entity)
+    if kind == 'not':
+        inner = compile_filter(tree[1])
+        return lambda entity: not inner(entity)
+    _, prop, op, value = tree
+    compare = _COMPARISONS[op]
+
+    def predicate(entity):
+        actual = entity.get(prop)
+        # The service never matches a missing property or a value of another type
+        if actual is None or isinstance(actual, bool) != isinstance(value, bool):
+            return False
+        if isinstance(actual, str) != isinstance(value, str):
+            return False
+        return compare(actual, value)
+    return predicate
+
+
+def pushdown_partition(tree):
+    """Return the PartitionKey a filter is restricted to, if it is a simple AND chain"""
+    if tree is None:
+        return None
+    if tree[0] == 'cmp' and tree[1] == 'PartitionKey' and tree[2] == 'eq':
+        return tree[3]
+    if tree[0] == 'and':
+        return pushdown_partition(tree[1]) or pushdown_partition(tree[2])
+    return None
@@ -0,0 +1,130 @@
+"""Per-route telemetry for storage calls, exposed in the Prometheus text format.
+
+Every Table and Blob call is recorded with the route that made it, its
+operation, outcome, latency, the number of storage transactions it cost
+(retries and hedged reads included), entities returned or written, and
+payload bytes. Table payload bytes are estimated from the entities' JSON,
+which is what the service sends over the wire.
+
+The route is read from a context variable that the web layer sets for each
+request, so calls made on helper threads are attributed correctly when they
+run in a copy of the request's context. If a request sets current_trace to
+a list, every call it makes is also appended there for the trace log.
+"""
+import contextvars
+import json
+import threading
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+current_route = contextvars.ContextVar('current_route', default='background')
+current_trace = contextvars.ContextVar('current_trace', default=None)
+
+
+def entity_bytes(entity):
+    """Approximate wire size of a table entity"""
+    return len(json.dumps(entity, default=str, separators=(',', ':')))
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+
+    def cumulative(self):
+        total = 0
+        for bound, count in zip(self.buckets, self.counts):
+            total += count
+            yield bound, total
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+
+class Telemetry:
+    """Thread-safe counters and histograms for storage calls and requests"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._calls = {}          # (route, service, operation, outcome) -> count
+        self._durations = {}      # (route, service, operation) -> Histogram
+        self._transactions = {}   # (route, service, operation) -> count
+        self._entities = {}       # (route, service, operation) -> count
+        self._bytes = {}          # (route, service, operation) -> count
+        self._requests = {}       # (route, status) -> count
+        self._request_durations = {}  # route -> Histogram
+
+    def observe_call(self, service, operation, seconds, outcome='ok', entities=0, nbytes=0, transactions=1):
+        route = current_route.get()
+        key = (route, service, operation)
+        with self._lock:
+            self._calls[key + (outcome,)] = self._calls.get(key + (outcome,), 0) + 1
+            self._durations.setdefault(key, Histogram(self.buckets)).observe(seconds)
+            self._transactions[key] = self._transactions.get(key, 0) + transactions
+            self._entities[key] = self._entities.get(key, 0) + entities
+            self._bytes[key] = self._bytes.get(key, 0) + nbytes
+        trace = current_trace.get()
+        if trace is not None:
+            trace.append({
+                'service': service, 'operation': operation, 'seconds': round(seconds, 6), 'outcome': outcome,
+                'entities': entities, 'bytes': nbytes, 'transactions': transactions,
+            })
+
+    def observe_request(self, route, status, seconds):
+        with self._lock:
+            self._requests[(route, status)] = self._requests.get((route, status), 0) + 1
+            self._request_durations.setdefault(route, Histogram(self.buckets)).observe(seconds)
+
+    def render(self):
+        """Everything recorded so far in the Prometheus text exposition format"""
+        lines = []
+
+        def counter(name, help_text, values, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} counter")
+            for key, value in sorted(values.items()):
+                lines.append(f"{name}{_labels(**dict(zip(label_names, key)))} {value}")
+
+        def histogram(name, help_text, values, label_names):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} histogram")
+            for key, hist in sorted(values.items()):
+                labels = dict(zip(label_names, key if isinstance(key, tuple) else (key,)))
+                for bound, count in hist.cumulative():
+                    lines.append(f"{name}_bucket{_labels(**labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{_labels(**labels, le='+Inf')} {hist.count}")
+                lines.append(f"{name}_sum{_labels(**labels)} {hist.sum:.6f}")
+                lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+
+        with self._lock:
+            call_labels = ('route', 'service', 'operation')
+            counter('storage_calls_total', 'Storage calls by outcome (after retries).',
+                    self._calls, call_labels + ('outcome',))
+            counter('storage_transactions_total', 'Billable storage transactions, including retries and hedged reads.',
+                    self._transactions, call_labels)
+            counter('storage_entities_total', 'Table entities returned or written.', self._entities, call_labels)
+            counter('storage_bytes_total', 'Payload bytes sent or received (estimated for tables).',
+                    self._bytes, call_labels)
+            histogram('storage_call_duration_seconds', 'Storage call latency, retries included.',
+                      self._durations, call_labels)
+            counter('http_requests_total', 'Requests handled.', self._requests, ('route', 'status'))
+            histogram('http_request_duration_seconds', 'Request latency up to the first response byte.',
+                      self._request_durations, ('route',))
+        return '\n'.join(lines) + '\n'
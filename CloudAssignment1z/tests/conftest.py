@@ -0,0 +1,32 @@
+"""Shared fixtures: the app runs on the offline backend in a throwaway directory.
+
+The modules live at the top of CloudAssignment1z, so that directory goes on
+sys.path, and the environment is set before app.py is first imported.
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['STORAGE_BACKEND'] = 'local'
+os.environ['LOCAL_STORAGE_DIR'] = tempfile.mkdtemp(prefix='ca-tests-storage-')
+os.environ['LOCAL_STORAGE_LATENCY_MS'] = '0'
+os.environ['INGEST_JOB_DIR'] = tempfile.mkdtemp(prefix='ca-tests-jobs-')
+
+
+@pytest.fixture
+def app_module():
+    """app.py with an empty people table and search cache"""
+    import app
+    table_client = app.get_storage().get_table_client('people')
+    for entity in list(table_client.query_entities("PartitionKey eq 'person' or PartitionKey eq 'name_index'")):
+        table_client.delete_entity(partition_key=entity['PartitionKey'], row_key=entity['RowKey'])
+    app.search_cache.clear()
+    return app
+
+
+@pytest.fixture
+def people(app_module):
+    return app_module.get_storage().get_table_client('people')
@@ -0,0 +1,109 @@
+from cache import ResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class Loader:
+    """loader() for get_or_load returning (value, row_keys); counts its calls"""
+
+    def __init__(self, value, row_keys):
+        self.value = value
+        self.row_keys = row_keys
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value, self.row_keys
+
+
+def test_hits_are_served_without_loading():
+    cache = ResultCache()
+    loader = Loader(['ada'], ['ada'])
+    assert cache.get_or_load('state=CT', loader) == ['ada']
+    assert cache.get_or_load('state=CT', loader) == ['ada']
+    assert loader.calls == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 1
+
+
+def test_invalidate_rows_drops_only_entries_containing_the_row():
+    cache = ResultCache()
+    connecticut, new_york = Loader(['ada', 'bob'], ['ada', 'bob']), Loader(['cy'], ['cy'])
+    cache.get_or_load('state=CT', connecticut)
+    cache.get_or_load('state=NY', new_york)
+    cache.invalidate_rows(['bob'])
+    cache.get_or_load('state=CT', connecticut)
+    cache.get_or_load('state=NY', new_york)
+    assert (connecticut.calls, new_york.calls) == (2, 1)
+    assert cache.stats()['invalidations'] == 1
+
+
+def test_load_that_raced_with_a_write_is_not_stored():
+    cache = ResultCache()
+
+    def loader():
+        cache.invalidate_rows(['ada'])  # A write lands while the search is running
+        return ['ada'], ['ada']
+    assert cache.get_or_load('state=CT', loader) == ['ada']
+    assert cache.stats()['size'] == 0
+
+
+def test_entries_expire_after_ttl():
+    clock = FakeClock()
+    cache = ResultCache(ttl=10, clock=clock)
+    loader = Loader('value', [])
+    cache.get_or_load('key', loader)
+    clock.now = 9.9
+    cache.get_or_load('key', loader)
+    assert loader.calls == 1
+    clock.now = 10
+    cache.get_or_load('key', loader)
+    assert loader.calls == 2
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResultCache(maxsize=2)
+    loaders = {key: Loader(key, [row_key]) for key, row_key in (('a', 'x'), ('b', 'y'), ('c', 'z'))}
+    cache.get_or_load('a', loaders['a'])
+    cache.get_or_load('b', loaders['b'])
+    cache.get_or_load('a', loaders['a'])
+    cache.get_or_load('c', loaders['c'])
+    assert cache.stats()['evictions'] == 1
+    # The evicted entry no longer answers to its rows
+    cache.invalidate_rows(['y'])
+    assert cache.stats()['invalidations'] == 0
+    cache.get_or_load('a', loaders['a'])
+    cache.get_or_load('b', loaders['b'])
+    assert (loaders['a'].calls, loaders['b'].calls) == (1, 2)
+
+
+def test_invalidate_where_and_clear():
+    cache = ResultCache()
+    by_name, by_state = Loader('ada', ['ada']), Loader(['ada'], ['ada'])
+    cache.get_or_load(('name', 'ada'), by_name)
+    cache.get_or_load(('state', 'CT'), by_state)
+    cache.invalidate_where(lambda key: key[0] == 'name')
+    cache.get_or_load(('name', 'ada'), by_name)
+    cache.get_or_load(('state', 'CT'), by_state)
+    assert (by_name.calls, by_state.calls) == (2, 1)
+    cache.clear()
+    assert cache.stats()['size'] == 0
+
+
+def test_store_after_lookup_skips_a_stale_generation():
+    cache = ResultCache()
+    hit, _, generation = cache.lookup('state=CT')
+    assert not hit
+    cache.invalidate_rows(['ada'])  # A write lands while the page is being read
+    cache.store('state=CT', ['ada'], ['ada'], generation)
+    assert cache.lookup('state=CT')[0] is False
+
+    _, _, generation = cache.lookup('state=CT')
+    cache.store('state=CT', ['ada'], ['ada'], generation)
+    assert cache.lookup('state=CT')[:2] == (True, ['ada'])
@@ -0,0 +1,34 @@
+import hashlib
+import io
+
+from dedupe import ALIASED, SKIPPED, UPLOADED, BlobHashIndex, read_and_hash, upload_deduplicated
+from storage import LocalStorage
+
+
+def test_read_and_hash_reads_in_chunks():
+    data, md5 = read_and_hash(io.BytesIO(b'x' * 10), chunk_size=3)
+    assert data == b'x' * 10
+    assert md5 == hashlib.md5(b'x' * 10).digest()
+
+
+def test_unchanged_content_is_skipped_and_copies_are_server_side(tmp_path):
+    container = LocalStorage(str(tmp_path)).get_container_client('images')
+    index = BlobHashIndex()
+    data, md5 = read_and_hash(io.BytesIO(b'picture'))
+    assert upload_deduplicated(container, index, 'a.jpg', data, md5) == UPLOADED
+    assert upload_deduplicated(container, index, 'a.jpg', data, md5) == SKIPPED
+    assert upload_deduplicated(container, index, 'b.jpg', data, md5) == ALIASED
+    assert container.get_blob_client('b.jpg').download_blob().readall() == b'picture'
+
+
+def test_warm_indexes_the_container_once(tmp_path):
+    storage = LocalStorage(str(tmp_path))
+    container = storage.get_container_client('images')
+    data, md5 = read_and_hash(io.BytesIO(b'picture'))
+    upload_deduplicated(container, BlobHashIndex(), 'a.jpg', data, md5)
+
+    index = BlobHashIndex()
+    index.warm(container)
+    assert index.warmed
+    assert index.find(md5) == 'a.jpg'
+    assert index.find(md5, exclude='a.jpg') is None
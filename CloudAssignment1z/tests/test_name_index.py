@@ -0,0 +1,87 @@
+import io
+import time
+from urllib.parse import unquote
+
+CSV_HEADER = 'Name,State,Salary,Grade,Room,Phone,Picture,Keywords\n'
+
+
+def upload_csv(app_module, text):
+    """Post a people CSV and wait for its background import"""
+    client = app_module.app.test_client()
+    response = client.post('/upload_csv', data={'csv_file': (io.BytesIO(text.encode()), 'people.csv')})
+    assert response.status_code == 302
+    deadline = time.monotonic() + 10
+    while app_module.ingest_jobs.unfinished():
+        assert time.monotonic() < deadline, "CSV import did not finish"
+        time.sleep(0.05)
+
+
+def people_rows(table_client):
+    return {entity['RowKey']: entity for entity in table_client.query_entities("PartitionKey eq 'person'")}
+
+
+def add_legacy(table_client, row_key, name, **fields):
+    table_client.create_entity({'PartitionKey': 'person', 'RowKey': row_key, 'Name': name, **fields})
+
+
+def test_person_row_key_normalizes_names():
+    import app
+    assert app.person_row_key('  Ada   Lovelace ') == 'ada lovelace'
+    assert app.person_row_key('a/b#c?d\\e') == 'abcde'
+
+
+def test_person_entity_from_csv_keeps_a_legacy_row_key():
+    import app
+    row = {'Name': 'Ada', 'State': 'CT'}
+    assert app.person_entity_from_csv(row, 1)['RowKey'] == 'ada'
+    assert app.person_entity_from_csv(row, 1, {'ada': 'Ada'})['RowKey'] == 'Ada'
+    assert app.person_entity_from_csv({'Name': ''}, 7)['RowKey'] == 'person_7'
+
+
+def test_csv_upload_creates_normalized_rows(app_module, people):
+    upload_csv(app_module, CSV_HEADER + 'Ada Lovelace,CT,100,A,1,555,,math\n')
+    rows = people_rows(people)
+    assert list(rows) == ['ada lovelace']
+    assert rows['ada lovelace']['Salary'] == '100'
+
+
+def test_csv_reupload_updates_an_indexed_legacy_row(app_module, people):
+    add_legacy(people, 'Ada', 'Ada', State='NY', Salary='50')
+    result = app_module.app.test_cli_runner().invoke(args=['build-name-index'])
+    assert 'Indexed 1' in result.output
+
+    upload_csv(app_module, CSV_HEADER + 'Ada,CT,100,A,1,555,,math\n')
+    rows = people_rows(people)
+    assert list(rows) == ['Ada']
+    assert rows['Ada']['State'] == 'CT'
+    assert rows['Ada']['Salary'] == '100'
+
+
+def test_build_name_index_merges_duplicates_into_the_normalized_row(app_module, people):
+    add_legacy(people, 'Ada', 'Ada', State='NY', PictureThumb='thumb.jpg')
+    people.create_entity({'PartitionKey': 'person', 'RowKey': 'ada', 'Name': 'Ada', 'State': 'CT'})
+    add_legacy(people, 'Bob', 'Bob', State='TX')
+
+    result = app_module.app.test_cli_runner().invoke(args=['build-name-index'])
+    assert 'Indexed 1' in result.output
+    assert 'merged 1' in result.output
+
+    rows = people_rows(people)
+    assert sorted(rows) == ['Bob', 'ada']
+    assert rows['ada']['State'] == 'CT'
+    assert rows['ada']['PictureThumb'] == 'thumb.jpg'
+    assert app_module.load_name_index(people) == {'bob': 'Bob'}
+
+
+def test_update_person_changes_any_field_but_the_identity(app_module, people):
+    upload_csv(app_module, CSV_HEADER + 'Ada,CT,100,A,1,555,,math\n')
+    client = app_module.app.test_client()
+
+    response = client.post('/update_person', data={'name': 'ADA', 'field': 'Team', 'value': 'blue'})
+    assert 'Updated Team for ADA' in unquote(response.headers['Location'])
+    assert people.get_entity('person', 'ada')['Team'] == 'blue'
+
+    for field in ('Name', 'RowKey', 'PartitionKey'):
+        response = client.post('/update_person', data={'name': 'Ada', 'field': field, 'value': 'Bob'})
+        assert f'{field} cannot be updated' in unquote(response.headers['Location'])
+    assert people_rows(people)['ada']['Name'] == 'Ada'
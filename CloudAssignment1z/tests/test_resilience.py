@@ -0,0 +1,176 @@
+import asyncio
+import time
+
+import pytest
+from azure.core.exceptions import ResourceNotFoundError, ServiceRequestError
+
+from resilience import CallPolicy, CircuitBreaker, StorageUnavailable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_policy(breaker=None, **kwargs):
+    kwargs.setdefault('base_backoff', 0)
+    kwargs.setdefault('hedge', False)
+    return CallPolicy(breaker or CircuitBreaker('table', failure_threshold=3, reset_timeout=10), **kwargs)
+
+
+def failing(times, error=ServiceRequestError):
+    """A call that fails `times` times with error, then returns 'ok'; calls[0] counts attempts"""
+    calls = [0]
+
+    def fn():
+        calls[0] += 1
+        if calls[0] <= times:
+            raise error("boom")
+        return 'ok'
+    return fn, calls
+
+
+def test_breaker_opens_after_threshold_and_lets_one_trial_through():
+    clock = FakeClock()
+    breaker = CircuitBreaker('table', failure_threshold=2, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    assert not breaker.allow()
+
+    clock.now = 10
+    assert breaker.state == 'half-open'
+    assert breaker.allow()
+    assert not breaker.allow()  # Only one trial at a time
+    breaker.record_success()
+    assert breaker.state == 'closed'
+    assert breaker.allow()
+
+
+def test_failed_trial_reopens_the_breaker():
+    clock = FakeClock()
+    breaker = CircuitBreaker('table', failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+    assert breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    clock.now = 19
+    assert not breaker.allow()
+    clock.now = 20
+    assert breaker.allow()
+
+
+def test_transient_errors_are_retried():
+    fn, calls = failing(2)
+    assert make_policy(max_attempts=3).call(fn) == 'ok'
+    assert calls[0] == 3
+
+
+def test_gives_up_after_max_attempts():
+    fn, calls = failing(5)
+    with pytest.raises(StorageUnavailable):
+        make_policy(max_attempts=3).call(fn)
+    assert calls[0] == 3
+
+
+def test_request_errors_are_not_retried_and_do_not_trip_the_breaker():
+    breaker = CircuitBreaker('table', failure_threshold=1)
+    fn, calls = failing(1, ResourceNotFoundError)
+    with pytest.raises(ResourceNotFoundError):
+        make_policy(breaker).call(fn)
+    assert calls[0] == 1
+    assert breaker.state == 'closed'
+
+
+def test_non_idempotent_calls_are_not_retried():
+    fn, calls = failing(1)
+    with pytest.raises(StorageUnavailable):
+        make_policy(max_attempts=3).call(fn, idempotent=False)
+    assert calls[0] == 1
+
+
+def test_open_breaker_fails_fast():
+    breaker = CircuitBreaker('table', failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    fn, calls = failing(0)
+    with pytest.raises(StorageUnavailable, match='temporarily unavailable'):
+        make_policy(breaker).call(fn)
+    assert calls[0] == 0
+
+
+def test_call_without_time_left_keeps_the_half_open_trial_slot():
+    clock = FakeClock()
+    breaker = CircuitBreaker('table', failure_threshold=1, reset_timeout=10, clock=clock)
+    breaker.record_failure()
+    clock.now = 10
+
+    expired = make_policy(breaker, deadline=lambda: time.monotonic() - 1)
+    fn, calls = failing(0)
+    with pytest.raises(StorageUnavailable, match='did not respond in time'):
+        expired.call(fn)
+    assert calls[0] == 0
+
+    # The trial is still available to a request that has time for it
+    assert make_policy(breaker).call(fn) == 'ok'
+    assert breaker.state == 'closed'
+
+
+def test_slow_attempt_times_out_and_is_retried():
+    calls = [0]
+
+    def fn():
+        calls[0] += 1
+        if calls[0] == 1:
+            time.sleep(0.5)
+        return 'ok'
+    assert make_policy(attempt_timeout=0.05).call(fn) == 'ok'
+    assert calls[0] == 2
+
+
+def failing_async(times):
+    """The coroutine version of failing()"""
+    calls = [0]
+
+    async def fn():
+        calls[0] += 1
+        if calls[0] <= times:
+            raise ServiceRequestError("boom")
+        return 'ok'
+    return fn, calls
+
+
+def test_call_async_retries_transient_errors():
+    fn, calls = failing_async(2)
+    assert asyncio.run(make_policy(max_attempts=3).call_async(fn)) == 'ok'
+    assert calls[0] == 3
+
+
+def test_call_async_failures_open_the_breaker_for_threaded_calls():
+    breaker = CircuitBreaker('table', failure_threshold=2, reset_timeout=60)
+    policy = make_policy(breaker, max_attempts=2)
+    fn, calls = failing_async(5)
+    with pytest.raises(StorageUnavailable):
+        asyncio.run(policy.call_async(fn))
+    assert breaker.state == 'open'
+    with pytest.raises(StorageUnavailable, match='temporarily unavailable'):
+        policy.call(lambda: 'ok')
+
+
+def test_call_async_cancels_a_timed_out_attempt():
+    cancelled = []
+
+    async def slow():
+        try:
+            await asyncio.sleep(1)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    with pytest.raises(StorageUnavailable):
+        asyncio.run(make_policy(max_attempts=1, attempt_timeout=0.05).call_async(slow))
+    assert cancelled == [True]
@@ -0,0 +1,78 @@
+import random
+
+import pytest
+
+from salary_stats import QuantileSketch, SalaryStats, parse_salary
+
+
+def exact_quantile(values, q):
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+def test_parse_salary():
+    assert parse_salary('$85,000') == 85000
+    assert parse_salary(' 72000.5 ') == 72000.5
+    assert parse_salary('') is None
+    assert parse_salary('n/a') is None
+    assert parse_salary('inf') is None
+
+
+def test_sketch_quantiles_are_within_relative_accuracy():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(11, 0.6) for _ in range(5000)]
+    sketch = QuantileSketch(0.01)
+    for value in values:
+        sketch.add(value)
+    for q in (0.01, 0.5, 0.9, 0.99):
+        expected = exact_quantile(values, q)
+        assert abs(sketch.quantile(q) - expected) <= 0.01 * expected
+
+
+def test_sketch_merge_and_removal():
+    first, second, both = QuantileSketch(), QuantileSketch(), QuantileSketch()
+    for value in range(1, 101):
+        (first if value % 2 else second).add(value)
+        both.add(value)
+    first.merge(second)
+    assert first.buckets == both.buckets
+    assert first.count == 100
+
+    for value in range(51, 101):
+        first.add(value, -1)
+    assert first.count == 50
+    assert first.quantile(1.0) == pytest.approx(50, rel=0.01)
+    assert QuantileSketch().quantile(0.5) is None
+
+    with pytest.raises(ValueError):
+        first.merge(QuantileSketch(0.05))
+
+
+def test_salary_stats_tracks_each_rows_current_value():
+    stats = SalaryStats()
+    stats.set('ada', 'CT', 'A', '$100,000')
+    stats.set('bob', 'CT', 'B', '50000')
+    stats.set('ada', 'NY', 'A', '80000')  # Moves ada to another group
+    stats.set('cy', 'NY', 'A', 'unknown')
+
+    summary = stats.summary(group_by=('State',))
+    assert [(group['State'], group['count'], group['mean']) for group in summary['groups']] == [('CT', 1, 50000), ('NY', 1, 80000)]
+    assert summary['overall']['count'] == 2
+
+    stats.remove('bob')
+    assert stats.summary(state='CT')['groups'] == []
+    assert stats.summary()['overall']['mean'] == 80000
+
+
+def test_rebuild_replays_writes_made_during_the_scan():
+    stats = SalaryStats()
+
+    def rows():
+        yield ('ada', 'CT', 'A', '10000')
+        stats.set('bob', 'CT', 'A', '30000')  # Written after the scan passed bob
+        stats.remove('ada')                    # Deleted after the scan read ada
+        yield ('cy', 'CT', 'A', '20000')
+
+    stats.rebuild(rows())
+    overall = stats.summary()['overall']
+    assert overall['count'] == 2
+    assert overall['mean'] == 25000
@@ -0,0 +1,61 @@
+import pytest
+
+from storage import compile_filter, parse_filter, pushdown_partition
+
+
+def matches(text, entity, parameters=None):
+    return compile_filter(parse_filter(text, parameters))(entity)
+
+
+def test_parse_filter_precedence():
+    tree = parse_filter("PartitionKey eq 'person' and Salary gt 10 or not (State eq 'CT')")
+    assert tree == (
+        'or',
+        ('and', ('cmp', 'PartitionKey', 'eq', 'person'), ('cmp', 'Salary', 'gt', 10)),
+        ('not', ('cmp', 'State', 'eq', 'CT')),
+    )
+
+
+def test_parse_filter_literals_and_parameters():
+    assert parse_filter("Name eq 'O''Brien'") == ('cmp', 'Name', 'eq', "O'Brien")
+    assert parse_filter("Age ge 30L and Score lt 1.5") == ('and', ('cmp', 'Age', 'ge', 30), ('cmp', 'Score', 'lt', 1.5))
+    assert parse_filter("Active eq true") == ('cmp', 'Active', 'eq', True)
+    assert parse_filter("State eq @state", {'state': 'NY'}) == ('cmp', 'State', 'eq', 'NY')
+    assert parse_filter('') is None
+
+
+@pytest.mark.parametrize('text', [
+    "State eq",
+    "State like 'CT'",
+    "(State eq 'CT'",
+    "State eq 'CT' State eq 'NY'",
+    "State eq 'CT' & Grade eq 'A'",
+])
+def test_parse_filter_rejects_unsupported_filters(text):
+    with pytest.raises(ValueError):
+        parse_filter(text)
+
+
+def test_compile_filter_evaluates_boolean_logic():
+    entity = {'PartitionKey': 'person', 'State': 'CT', 'Salary': 50}
+    assert matches("State eq 'CT' and Salary ge 50", entity)
+    assert not matches("State eq 'CT' and Salary gt 50", entity)
+    assert matches("State eq 'NY' or Salary lt 60", entity)
+    assert matches("not State eq 'NY'", entity)
+    assert matches(None, entity)
+
+
+def test_compile_filter_never_matches_missing_or_mistyped_properties():
+    entity = {'Salary': '50', 'Active': True}
+    assert not matches("Grade ne 'A'", entity)
+    assert not matches("Salary eq 50", entity)
+    assert not matches("Active eq 1", entity)
+    assert matches("Salary eq '50'", entity)
+
+
+def test_pushdown_partition():
+    assert pushdown_partition(parse_filter("PartitionKey eq 'person' and State eq 'CT'")) == 'person'
+    assert pushdown_partition(parse_filter("State eq 'CT' and PartitionKey eq 'person'")) == 'person'
+    assert pushdown_partition(parse_filter("PartitionKey eq 'person' or State eq 'CT'")) is None
+    assert pushdown_partition(parse_filter("PartitionKey ge 'person'")) is None
+    assert pushdown_partition(None) is None
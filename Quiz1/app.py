@@ -1,34 +1,136 @@
-from flask import Flask, request, redirect, url_for, flash, render_template_string
+from flask import Flask, Response, request, redirect, url_for, flash, render_template_string, jsonify
 import csv
 import os
-from azure.data.tables import TableServiceClient, TableEntity
+import json
+import base64
+import urllib.parse
+from markupsafe import escape
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from azure.data.tables import TableServiceClient, TableEntity, UpdateMode, TableTransactionError
+from azure.core import MatchConditions
 from azure.storage.blob import BlobServiceClient
-from azure.core.exceptions import ResourceExistsError
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError, ClientAuthenticationError
 from azure.core.credentials import AzureNamedKeyCredential
+from azure.core.pipeline.transport import RequestsTransport
+from snapshot import UserSnapshot
+from search_index import CommentIndex
+from image_cache import ImageCache
+from memory_storage import memory_clients
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
 # Azure Storage connection strings
 AZURE_STORAGE_CONNECTION_STRING = os.environ.get('AZURE_STORAGE_CONNECTION_STRING', '')
+# 'memory' swaps Azure for the in-process stand-ins in memory_storage.py (offline runs and load tests),
+# with each storage call taking about MEMORY_STORAGE_LATENCY_MS
+STORAGE_BACKEND = os.environ.get('STORAGE_BACKEND', 'azure')
+MEMORY_STORAGE_LATENCY_MS = float(os.environ.get('MEMORY_STORAGE_LATENCY_MS', 0))
 BLOB_CONTAINER_NAME = 'images'
+TABLE_NAME = 'quiz1'
+# Keep-alive connections shared by the table and blob clients
+AZURE_POOL_SIZE = int(os.environ.get('AZURE_POOL_SIZE', 10))
+# Most operations Table Storage accepts in one transaction, and how many transactions a sync sends at once
+BATCH_SIZE = 100
+SYNC_CONCURRENCY = int(os.environ.get('SYNC_CONCURRENCY', 4))
+# Resized pictures are kept on local disk, up to IMAGE_CACHE_MB, and sent from there
+IMAGE_CACHE_DIR = os.environ.get('IMAGE_CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'image_cache'))
+IMAGE_CACHE_MB = int(os.environ.get('IMAGE_CACHE_MB', 100))
+# Seconds a picture is served before its blob's ETag is checked again (browsers keep it as long)
+IMAGE_REVALIDATE_SECONDS = int(os.environ.get('IMAGE_REVALIDATE_SECONDS', 60))
+# Widths /img serves (2x the CSS size for hi-dpi screens: table pictures are 100px, the profile 200px)
+IMAGE_WIDTHS = (200, 400)
+TABLE_IMAGE_WIDTH = 200
+PROFILE_IMAGE_WIDTH = 400
+# Seconds the read routes trust their copy of the partition before reloading it
+SNAPSHOT_TTL = float(os.environ.get('SNAPSHOT_TTL', 30))
 
-def get_table_service():
-    if not AZURE_STORAGE_CONNECTION_STRING:
-        return None
-    
+# Clients are built once per process and reused by every request, so the connection
+# string is parsed and the TLS connection opened once instead of on every request
+_clients = None
+_clients_lock = threading.Lock()
+
+def make_transport():
+    session = requests.Session()
+    session.mount('https://', HTTPAdapter(pool_connections=AZURE_POOL_SIZE, pool_maxsize=AZURE_POOL_SIZE))
+    # Shared by both services; closing one client leaves the session open for the other
+    return RequestsTransport(session=session, session_owner=False)
+
+def check_table_service(table_service):
+    """One cheap request to make sure the credentials are accepted"""
+    next(iter(table_service.query_tables(f"TableName eq '{TABLE_NAME}'")), None)
+
+def build_table_service(transport):
     try:
-        return TableServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+        table_service = TableServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING, transport=transport)
+        check_table_service(table_service)
+        return table_service
     except Exception as e:
         print(f"Connection string method failed: {e}")
         # Try alternative method by parsing connection string manually
         try:
-            return get_table_service_alternative()
-        except Exception as e2:
+            table_service = get_table_service_alternative(transport)
+            if table_service:
+                check_table_service(table_service)
+            return table_service
+        except ClientAuthenticationError as e2:
             print(f"Alternative method also failed: {e2}")
             return None
+        except Exception as e2:
+            # Not a credential problem (e.g. the network); the client is still usable
+            print(f"Could not check the table service: {e2}")
+            return table_service
 
-def get_table_service_alternative():
+def get_clients():
+    """The process-wide (table service, table client, blob service), built on first use"""
+    global _clients
+    if STORAGE_BACKEND == 'memory':
+        if _clients is None:
+            with _clients_lock:
+                if _clients is None:
+                    _clients = memory_clients(TABLE_NAME, latency_ms=MEMORY_STORAGE_LATENCY_MS)
+        return _clients
+    if not AZURE_STORAGE_CONNECTION_STRING:
+        return None
+    if _clients is None:
+        with _clients_lock:
+            if _clients is None:
+                transport = make_transport()
+                table_service = build_table_service(transport)
+                if not table_service:
+                    return None
+                _clients = (
+                    table_service,
+                    table_service.get_table_client(TABLE_NAME),
+                    BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING, transport=transport),
+                )
+    return _clients
+
+def reset_clients():
+    """Drop the cached clients so the next request rebuilds (and re-checks) them"""
+    global _clients
+    with _clients_lock:
+        _clients = None
+
+def get_table_service():
+    clients = get_clients()
+    return clients[0] if clients else None
+
+def get_table_client():
+    clients = get_clients()
+    return clients[1] if clients else None
+
+def error_page(error):
+    """Status page for an unexpected error; rejected credentials also force a client rebuild"""
+    if isinstance(error, ClientAuthenticationError):
+        reset_clients()
+    return status_page(f"Error: {str(error)}")
+
+def get_table_service_alternative(transport=None):
     """Alternative connection method by parsing connection string components"""
     if not AZURE_STORAGE_CONNECTION_STRING:
         return None
@@ -46,27 +148,229 @@ def get_table_service_alternative():
     if account_name and account_key:
         account_url = f"https://{account_name}.table.core.windows.net"
         credential = AzureNamedKeyCredential(account_name, account_key)
-        return TableServiceClient(endpoint=account_url, credential=credential)
+        return TableServiceClient(endpoint=account_url, credential=credential, transport=transport)
     
     return None
 
 def get_blob_service():
-    if not AZURE_STORAGE_CONNECTION_STRING:
-        return None
-    return BlobServiceClient.from_connection_string(AZURE_STORAGE_CONNECTION_STRING)
+    clients = get_clients()
+    return clients[2] if clients else None
+
+def parse_age(value):
+    """An age as an int (stored as Edm.Int32 so the service can range-filter it), or None"""
+    value = str(value).strip()
+    return int(value) if value.isdigit() else None
+
+def migrate_ages(table_client):
+    """Rewrite ages stored as strings as Int32; returns (converted, skipped)"""
+    converted, skipped = 0, 0
+    for entity in table_client.query_entities(f"PartitionKey eq '{TABLE_NAME}'", select=["RowKey", "age"]):
+        if not isinstance(entity.get('age'), str):
+            continue
+        age = parse_age(entity['age'])
+        if age is None:
+            skipped += 1  # Blank or not a number; search_by_age never matched these
+            continue
+        try:
+            # Only the age changes, and only if nobody edited the row since it was read
+            table_client.update_entity(
+                {'PartitionKey': TABLE_NAME, 'RowKey': entity['RowKey'], 'age': age},
+                mode=UpdateMode.MERGE,
+                etag=entity.metadata['etag'],
+                match_condition=MatchConditions.IfNotModified
+            )
+            converted += 1
+        except ResourceModifiedError:
+            skipped += 1
+    return converted, skipped
+
+@app.cli.command('migrate-ages')
+def migrate_ages_command():
+    """Convert ages stored as strings to Int32: flask --app app migrate-ages"""
+    table_client = get_table_client()
+    if not table_client:
+        print("Error: Azure Storage connection not configured")
+        return
+    converted, skipped = migrate_ages(table_client)
+    print(f"Converted {converted} ages to Int32 ({skipped} left as they were)")
+
+def user_entity_from_csv(row):
+    """Table entity for one row of data.csv, with a content_hash of its fields"""
+    entity = {
+        "PartitionKey": TABLE_NAME,
+        "RowKey": row['name'],
+        "class": row['class'] if row['class'] else "",
+        "picture": row['picture'] if row['picture'] else "",
+        "comments": row['comments'] if row['comments'] else ""
+    }
+    # Ages are stored as Int32; a blank age is left out rather than stored as ""
+    age = parse_age(row['age'])
+    if age is not None:
+        entity["age"] = age
+    entity["content_hash"] = hashlib.sha256(json.dumps(entity, sort_keys=True).encode('utf-8')).hexdigest()[:32]
+    return entity
+
+def plan_sync(table_client, csv_entities, prune=False):
+    """Compare data.csv with the partition using one query of RowKeys and content hashes.
+
+    Returns (operations, unchanged): the upserts for new and changed users,
+    plus deletes for users missing from the CSV when prune is set.
+    """
+    stored = {
+        entity['RowKey']: entity.get('content_hash')
+        for entity in table_client.query_entities(f"PartitionKey eq '{TABLE_NAME}'", select=["RowKey", "content_hash"])
+    }
+    operations, unchanged = [], 0
+    for row_key, entity in csv_entities.items():
+        if stored.get(row_key) == entity['content_hash']:
+            unchanged += 1
+        else:
+            # REPLACE, so properties the CSV no longer has (like an old string age) don't survive
+            operations.append(('upsert', entity, {'mode': UpdateMode.REPLACE}))
+    if prune:
+        operations.extend(
+            ('delete', {'PartitionKey': TABLE_NAME, 'RowKey': row_key})
+            for row_key in stored if row_key not in csv_entities
+        )
+    return operations, unchanged
+
+def submit_in_batches(table_client, operations):
+    """Send operations as transactions of up to BATCH_SIZE, SYNC_CONCURRENCY at a time; returns the errors"""
+    batches = [operations[i:i + BATCH_SIZE] for i in range(0, len(operations), BATCH_SIZE)]
+    if not batches:
+        return []
+    
+    def submit(batch):
+        try:
+            table_client.submit_transaction(batch)
+            return None
+        except Exception as e:
+            return f"{len(batch)} changes starting at {batch[0][1]['RowKey']}: {e}"
+    
+    with ThreadPoolExecutor(max_workers=min(SYNC_CONCURRENCY, len(batches))) as pool:
+        return [error for error in pool.map(submit, batches) if error]
+
+def image_blob(blob_name):
+    blob_service = get_blob_service()
+    if not blob_service:
+        raise ResourceNotFoundError("Azure Storage connection not configured")
+    return blob_service.get_blob_client(BLOB_CONTAINER_NAME, blob_name)
 
-def get_blob_url(blob_name):
-    """Generate a public URL for a blob in the images container"""
+def fetch_image(blob_name):
+    """The original picture from the images container; raises ResourceNotFoundError if it's missing"""
+    return image_blob(blob_name).download_blob().readall()
+
+def image_version(blob_name):
+    """The picture's blob ETag, which changes whenever it is replaced; raises ResourceNotFoundError if it's missing"""
+    return image_blob(blob_name).get_blob_properties().etag
+
+image_cache = ImageCache(IMAGE_CACHE_DIR, fetch_image, image_version, max_bytes=IMAGE_CACHE_MB * 1024 * 1024,
+                         revalidate_seconds=IMAGE_REVALIDATE_SECONDS)
+
+def image_url(blob_name, width=None):
+    """URL of a picture through /img, which resizes and caches it (instead of linking the blob itself)"""
     if not blob_name:
         return None
-    
-    # Always use the known storage account name
-    return f"https://storagebtn1609.blob.core.windows.net/{BLOB_CONTAINER_NAME}/{blob_name}"
+    url = f"/img/{urllib.parse.quote(blob_name)}"
+    return f"{url}?w={width}" if width else url
+
+# Fields shown for each user, and the page sizes view_users allows
+# (the service returns at most 1000 entities per page)
+USER_FIELDS = ["RowKey", "age", "class", "picture", "comments"]
+VIEW_PAGE_SIZE = 50
+MAX_VIEW_PAGE_SIZE = 1000
+
+# Compiled once; rendering a row is then a function call instead of string concatenation
+USER_ROW_TEMPLATE = app.jinja_env.from_string('''
+                <tr>
+                    <td>{{ user.RowKey }}</td>
+                    <td>{{ user.age }}</td>
+                    <td>{{ user['class'] }}</td>
+                    <td>{% if picture_url %}<img src="{{ picture_url }}" alt="{{ user.picture }}" style="max-width:100px; max-height:100px;">{% else %}{{ user.picture }}{% endif %}</td>
+                    <td>{{ user.comments }}</td>
+                </tr>''')
+
+VIEW_USERS_HEADER = '''
+        <!DOCTYPE html>
+        <html>
+        <head>
+            <title>Quiz1 Users</title>
+            <style>
+                body { font-family: Arial, sans-serif; margin: 40px; }
+                table { border-collapse: collapse; width: 100%; }
+                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
+                th { background-color: #f2f2f2; }
+                .back-btn { margin-bottom: 20px; }
+                .pages { margin-top: 20px; }
+            </style>
+        </head>
+        <body>
+            <div class="back-btn">
+                <a href="/">← Back to Home</a>
+            </div>
+            <h1>Quiz1 Users</h1>
+            <table>
+                <tr>
+                    <th>Name</th>
+                    <th>Age</th>
+                    <th>Class</th>
+                    <th>Picture</th>
+                    <th>Comments</th>
+                </tr>'''
+
+VIEW_USERS_FOOTER = app.jinja_env.from_string('''
+            </table>
+            <div class="pages">
+                {% if first_url %}<a href="{{ first_url }}">« First page</a>{% endif %}
+                {% if next_url %}<a href="{{ next_url }}">Next page →</a>{% endif %}
+            </div>
+        </body>
+        </html>
+        ''')
+
+def load_users():
+    return get_table_client().query_entities(f"PartitionKey eq '{TABLE_NAME}'", select=USER_FIELDS)
+
+# view_users, search_by_age and edit_user read this instead of querying the table each time;
+# this process's writes patch it, and it is reloaded every SNAPSHOT_TTL seconds for everyone else's
+users_snapshot = UserSnapshot(load_users, ttl=SNAPSHOT_TTL)
+# Kept current by the snapshot: each user it adds, changes or drops is re-indexed on its own
+comment_index = CommentIndex()
+users_snapshot.subscribe(comment_index.set)
+SEARCH_RESULTS = 10
+MAX_SEARCH_RESULTS = 100
+
+def user_row(entity):
+    """The displayed fields of a user entity, as strings"""
+    return {field: str(entity.get(field, '')) for field in USER_FIELDS}
+
+def render_user_rows(entities):
+    """Yield one rendered table row per user, skipping entities that can't be shown"""
+    for entity in entities:
+        try:
+            user = user_row(entity)
+            picture_url = image_url(user['picture'], TABLE_IMAGE_WIDTH) if user['picture'] else None
+            yield USER_ROW_TEMPLATE.render(user=user, picture_url=picture_url)
+        except Exception as entity_error:
+            print(f"Skipping problematic entity: {entity_error}")
+
+def encode_cursor(continuation_token):
+    return base64.urlsafe_b64encode(json.dumps(continuation_token).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """The position in a view_users cursor; raises ValueError if it was tampered with"""
+    try:
+        token = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError("invalid cursor")
+    if not isinstance(token, dict) or not isinstance(token.get('after'), str):
+        raise ValueError("invalid cursor")
+    return token
 
 @app.route('/')
 def home():
-	# Get the profile image URL from blob storage (now always returns correct URL)
-	profile_image_src = get_blob_url('m.jpg')
+	# The profile image, resized and cached by /img
+	profile_image_src = image_url('m.jpg', PROFILE_IMAGE_WIDTH)
 	
 	return f'''
 	<!DOCTYPE html>
@@ -100,6 +404,9 @@ def home():
 			
 			<form action="/upload_users" method="post">
 				<button type="submit">Upload Users from data.csv</button>
+				<div>
+					<label><input type="checkbox" name="prune"> Also remove users not in data.csv</label>
+				</div>
 			</form>
 			
 			<form action="/view_users" method="get">
@@ -149,6 +456,17 @@ def home():
 				<button type="submit">Add New User</button>
 			</form>
 			
+			<h3>Add Many Users</h3>
+			<p>One user per line: name,age,class,comments</p>
+			
+			<form action="/bulk_add_users" method="post" style="margin: 20px 0;">
+				<textarea name="users" rows="6" required
+						  style="padding: 8px; border: 1px solid #ccc; border-radius: 4px; width: 320px;"></textarea>
+				<div>
+					<button type="submit">Add Users</button>
+				</div>
+			</form>
+			
 			<hr style="margin: 40px 0; border: 1px solid #ddd;">
 			
 			<h2>Search Students by Age Range</h2>
@@ -167,116 +485,179 @@ def home():
 				</div>
 				<button type="submit">Search Students</button>
 			</form>
+			
+			<hr style="margin: 40px 0; border: 1px solid #ddd;">
+			
+			<h2>Search Comments</h2>
+			<p>Find students by words in their name or comments, best matches first</p>
+			
+			<form action="/search_comments" method="post" style="margin: 20px 0;">
+				<div style="margin-bottom: 15px;">
+					<label for="q" style="display: inline-block; width: 100px; text-align: left;">Words:</label>
+					<input type="text" id="q" name="q" required 
+						   style="padding: 8px; border: 1px solid #ccc; border-radius: 4px; width: 200px;">
+				</div>
+				<button type="submit">Search Comments</button>
+			</form>
 		</div>
 	</body>
 	</html>
 	'''
 
+@app.route('/img/<path:name>')
+def image(name):
+    """A picture from the images container, resized to w pixels (one of IMAGE_WIDTHS) or as uploaded"""
+    width = request.args.get('w', type=int)
+    if width is not None and width not in IMAGE_WIDTHS:
+        return Response(f"w must be one of {', '.join(map(str, IMAGE_WIDTHS))}", status=400, mimetype='text/plain')
+    try:
+        cached = image_cache.get(name, width)
+        if cached.etag in request.if_none_match:
+            data = b''  # The 304 below sends no body, so the file isn't read
+        else:
+            try:
+                data = cached.read()
+            except FileNotFoundError:
+                cached = image_cache.get(name, width)  # Evicted since the lookup
+                data = cached.read()
+    except ResourceNotFoundError:
+        return Response("Picture not found", status=404, mimetype='text/plain')
+    except ValueError as e:
+        return Response(str(e), status=415, mimetype='text/plain')
+    except Exception as e:
+        if isinstance(e, ClientAuthenticationError):
+            reset_clients()
+        return Response(f"Could not load picture: {e}", status=502, mimetype='text/plain')
+    
+    response = Response(data, mimetype=cached.content_type)
+    response.set_etag(cached.etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = IMAGE_REVALIDATE_SECONDS
+    return response.make_conditional(request)
+
 @app.route('/upload_users', methods=['POST'])
 def upload_users():
     try:
         table_service = get_table_service()
         if not table_service:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
+            return status_page("Error: Azure Storage connection not configured")
         
         # Create or get table
-        table_name = "quiz1"
         try:
-            table_service.create_table(table_name)
+            table_service.create_table(TABLE_NAME)
         except ResourceExistsError:
             pass  # Table already exists
         
-        table_client = table_service.get_table_client(table_name)
+        table_client = get_table_client()
+        prune = request.form.get('prune') == 'on'
         
-        # Read CSV and upload to table
+        # Read CSV; a name listed twice keeps its last row
         csv_path = os.path.join(os.path.dirname(__file__), 'data.csv')
-        users_added = 0
-        
         with open(csv_path, 'r', newline='', encoding='utf-8') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                # Create entity with PartitionKey and RowKey
-                entity = {
-                    "PartitionKey": "quiz1",
-                    "RowKey": row['name'],
-                    "age": row['age'] if row['age'] else "",
-                    "class": row['class'] if row['class'] else "",
-                    "picture": row['picture'] if row['picture'] else "",
-                    "comments": row['comments'] if row['comments'] else ""
-                }
-                
-                # Upsert entity (insert or update)
-                table_client.upsert_entity(entity)
-                users_added += 1
-        
-        return render_template_string(status_template(f"Success: {users_added} users uploaded to Azure Table Storage"))
+            csv_entities = {row['name']: user_entity_from_csv(row) for row in csv.DictReader(csvfile)}
+        
+        # Only users that are new, changed (or, with prune, gone from the CSV) are written
+        operations, unchanged = plan_sync(table_client, csv_entities, prune)
+        errors = submit_in_batches(table_client, operations)
+        if operations:
+            users_snapshot.invalidate()
+        
+        upserts = sum(1 for operation in operations if operation[0] == 'upsert')
+        deletes = len(operations) - upserts
+        summary = f"{upserts} users added or updated, {deletes} removed, {unchanged} unchanged"
+        if errors:
+            return status_page(f"Error: synced data.csv with failures ({summary}): {'; '.join(errors)}")
+        return status_page(f"Success: Synced data.csv to Azure Table Storage ({summary})")
         
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
 @app.route('/view_users')
 def view_users():
+    """One page of users (page_size, default 50) in name order, streamed as it is rendered, with a cursor to the next page"""
     try:
-        # Check if connection string is set
-        if not AZURE_STORAGE_CONNECTION_STRING:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
+        table_client = get_table_client()
+        if not table_client:
+            return status_page("Error: Azure Storage connection not configured")
         
-        table_service = get_table_service()
-        if not table_service:
-            return render_template_string(status_template("Error: Could not create table service"))
-        
-        # Try to get table client
-        table_client = table_service.get_table_client("quiz1")
+        try:
+            page_size = min(max(int(request.args.get('page_size', VIEW_PAGE_SIZE)), 1), MAX_VIEW_PAGE_SIZE)
+            cursor = request.args.get('cursor', '')
+            after = decode_cursor(cursor)['after'] if cursor else None
+        except ValueError:
+            return status_page("Error: Invalid page - please start again from the first page")
         
-        # Try to list entities with more robust error handling
+        # Served from the partition snapshot; only this page is copied out and rendered
         try:
-            # Try to get entities one by one to isolate problematic records
-            entities = []
-            entity_count = 0
-            
-            # Use query with select to limit data and avoid corruption issues
-            query_results = table_client.query_entities(
-                query_filter="PartitionKey eq 'quiz1'",
-                select=["RowKey", "age", "class", "picture", "comments"]
-            )
-            
-            for entity in query_results:
-                try:
-                    # Validate each entity before adding
-                    clean_entity = {
-                        'RowKey': str(entity.get('RowKey', '')),
-                        'age': str(entity.get('age', '')),
-                        'class': str(entity.get('class', '')),
-                        'picture': str(entity.get('picture', '')),
-                        'comments': str(entity.get('comments', ''))
-                    }
-                    entities.append(clean_entity)
-                    entity_count += 1
-                except Exception as entity_error:
-                    print(f"Skipping problematic entity: {entity_error}")
-                    continue
-                    
+            page, last_name = users_snapshot.page(after, page_size)
         except Exception as list_error:
-            return render_template_string(status_template(f"Error listing entities: {str(list_error)}"))
+            return status_page(f"Error listing entities: {str(list_error)}")
         
-        html = '''
+        next_url = None
+        if last_name is not None:
+            next_url = '/view_users?' + urllib.parse.urlencode(
+                {'page_size': page_size, 'cursor': encode_cursor({'after': last_name})}
+            )
+        first_url = f'/view_users?page_size={page_size}' if cursor else None
+        
+        def generate():
+            yield VIEW_USERS_HEADER
+            yield from render_user_rows(page)
+            yield VIEW_USERS_FOOTER.render(first_url=first_url, next_url=next_url)
+        
+        return Response(generate(), mimetype='text/html')
+        
+    except Exception as e:
+        return error_page(e)
+
+@app.route('/search_by_age', methods=['POST'])
+def search_by_age():
+    try:
+        low_age = int(request.form.get('low_age', 0))
+        high_age = int(request.form.get('high_age', 150))
+        
+        # Validate age range
+        if low_age > high_age:
+            return status_page("Error: Low age cannot be greater than high age")
+        
+        table_client = get_table_client()
+        if not table_client:
+            return status_page("Error: Azure Storage connection not configured")
+        
+        # Two binary searches in the snapshot's age index; users without an Int32 age never match
+        try:
+            filtered_entities = users_snapshot.age_range(low_age, high_age)
+        except Exception as query_error:
+            return status_page(f"Error querying entities: {str(query_error)}")
+        
+        # Generate HTML response
+        html = f'''
         <!DOCTYPE html>
         <html>
         <head>
-            <title>Quiz1 Users</title>
+            <title>Age Search Results</title>
             <style>
-                body { font-family: Arial, sans-serif; margin: 40px; }
-                table { border-collapse: collapse; width: 100%; }
-                th, td { border: 1px solid #ddd; padding: 8px; text-align: left; }
-                th { background-color: #f2f2f2; }
-                .back-btn { margin-bottom: 20px; }
+                body {{ font-family: Arial, sans-serif; margin: 40px; }}
+                table {{ border-collapse: collapse; width: 100%; margin-top: 20px; }}
+                th, td {{ border: 1px solid #ddd; padding: 8px; text-align: left; }}
+                th {{ background-color: #f2f2f2; }}
+                .back-btn {{ margin-bottom: 20px; }}
+                .search-info {{ background-color: #e7f3ff; padding: 10px; border-radius: 5px; margin-bottom: 20px; }}
             </style>
         </head>
         <body>
             <div class="back-btn">
                 <a href="/">← Back to Home</a>
             </div>
-            <h1>Quiz1 Users</h1>
+            <h1>Students Age Search Results</h1>
+            <div class="search-info">
+                <strong>Search Parameters:</strong> Ages {low_age} to {high_age} (inclusive)<br>
+                <strong>Results Found:</strong> {len(filtered_entities)} student(s)
+            </div>
+        '''
+        
+        if filtered_entities:
+            html += '''
             <table>
                 <tr>
                     <th>Name</th>
@@ -285,90 +666,52 @@ def view_users():
                     <th>Picture</th>
                     <th>Comments</th>
                 </tr>
-        '''
-        
-        for entity in entities:
-            picture_name = entity.get('picture', '')
-            picture_url = get_blob_url(picture_name) if picture_name else None
-            picture_display = f'<img src="{picture_url}" alt="{picture_name}" style="max-width:100px; max-height:100px;">' if picture_url else picture_name
-            
-            html += f'''
-                <tr>
-                    <td>{entity.get('RowKey', '')}</td>
-                    <td>{entity.get('age', '')}</td>
-                    <td>{entity.get('class', '')}</td>
-                    <td>{picture_display}</td>
-                    <td>{entity.get('comments', '')}</td>
-                </tr>
             '''
+            
+            html += ''.join(render_user_rows(filtered_entities))
+            html += '</table>'
+        else:
+            html += '<p>No students found in the specified age range.</p>'
         
         html += '''
-            </table>
         </body>
         </html>
         '''
         
         return html
         
+    except ValueError:
+        return status_page("Error: Please enter valid numbers for ages")
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
-@app.route('/search_by_age', methods=['POST'])
-def search_by_age():
+@app.route('/search_comments', methods=['GET', 'POST'])
+def search_comments():
+    """Students whose name or comments match the words in q, ranked by BM25 (top `limit`, default 10)"""
     try:
-        low_age = int(request.form.get('low_age', 0))
-        high_age = int(request.form.get('high_age', 150))
-        
-        # Validate age range
-        if low_age > high_age:
-            return render_template_string(status_template("Error: Low age cannot be greater than high age"))
-        
-        table_service = get_table_service()
-        if not table_service:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
+        query = request.values.get('q', '').strip()
+        if not query:
+            return status_page("Error: Please enter words to search for")
+        limit = min(max(int(request.values.get('limit', SEARCH_RESULTS)), 1), MAX_SEARCH_RESULTS)
         
-        table_client = table_service.get_table_client("quiz1")
+        if not get_table_client():
+            return status_page("Error: Azure Storage connection not configured")
         
-        # Get all entities and filter by age range using robust method
         try:
-            query_results = table_client.query_entities(
-                query_filter="PartitionKey eq 'quiz1'",
-                select=["RowKey", "age", "class", "picture", "comments"]
-            )
-            
-            all_entities = []
-            for entity in query_results:
-                try:
-                    # Validate each entity before adding
-                    clean_entity = {
-                        'RowKey': str(entity.get('RowKey', '')),
-                        'age': str(entity.get('age', '')),
-                        'class': str(entity.get('class', '')),
-                        'picture': str(entity.get('picture', '')),
-                        'comments': str(entity.get('comments', ''))
-                    }
-                    all_entities.append(clean_entity)
-                except Exception as entity_error:
-                    print(f"Skipping problematic entity in search: {entity_error}")
-                    continue
+            users_snapshot.refresh()  # Brings the index up to date with the partition too
+            matches = []
+            for row_key, score in comment_index.search(query, limit):
+                user = users_snapshot.get(row_key)
+                if user is not None:
+                    matches.append(user)
         except Exception as query_error:
-            return render_template_string(status_template(f"Error querying entities: {str(query_error)}"))
-            
-        filtered_entities = []
+            return status_page(f"Error searching comments: {str(query_error)}")
         
-        for entity in all_entities:
-            age_str = entity.get('age', '')
-            if age_str and age_str.isdigit():
-                age = int(age_str)
-                if low_age <= age <= high_age:
-                    filtered_entities.append(entity)
-        
-        # Generate HTML response
         html = f'''
         <!DOCTYPE html>
         <html>
         <head>
-            <title>Age Search Results</title>
+            <title>Comment Search Results</title>
             <style>
                 body {{ font-family: Arial, sans-serif; margin: 40px; }}
                 table {{ border-collapse: collapse; width: 100%; margin-top: 20px; }}
@@ -382,14 +725,14 @@ def search_by_age():
             <div class="back-btn">
                 <a href="/">← Back to Home</a>
             </div>
-            <h1>Students Age Search Results</h1>
+            <h1>Comment Search Results</h1>
             <div class="search-info">
-                <strong>Search Parameters:</strong> Ages {low_age} to {high_age} (inclusive)<br>
-                <strong>Results Found:</strong> {len(filtered_entities)} student(s)
+                <strong>Search Words:</strong> {escape(query)}<br>
+                <strong>Results Found:</strong> {len(matches)} student(s), best match first
             </div>
         '''
         
-        if filtered_entities:
+        if matches:
             html += '''
             <table>
                 <tr>
@@ -400,25 +743,10 @@ def search_by_age():
                     <th>Comments</th>
                 </tr>
             '''
-            
-            for entity in filtered_entities:
-                picture_name = entity.get('picture', '')
-                picture_url = get_blob_url(picture_name) if picture_name else None
-                picture_display = f'<img src="{picture_url}" alt="{picture_name}" style="max-width:100px; max-height:100px;">' if picture_url else picture_name
-                
-                html += f'''
-                    <tr>
-                        <td>{entity.get('RowKey', '')}</td>
-                        <td>{entity.get('age', '')}</td>
-                        <td>{entity.get('class', '')}</td>
-                        <td>{picture_display}</td>
-                        <td>{entity.get('comments', '')}</td>
-                    </tr>
-                '''
-            
+            html += ''.join(render_user_rows(matches))
             html += '</table>'
         else:
-            html += '<p>No students found in the specified age range.</p>'
+            html += '<p>No students found with those words.</p>'
         
         html += '''
         </body>
@@ -428,28 +756,36 @@ def search_by_age():
         return html
         
     except ValueError:
-        return render_template_string(status_template("Error: Please enter valid numbers for ages"))
+        return status_page("Error: Please enter a valid number of results")
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
 @app.route('/edit_user', methods=['POST'])
 def edit_user():
     try:
         name = request.form.get('edit_name', '').strip()
         if not name:
-            return render_template_string(status_template("Error: Please enter a name"))
+            return status_page("Error: Please enter a name")
         
-        table_service = get_table_service()
-        if not table_service:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
+        table_client = get_table_client()
+        if not table_client:
+            return status_page("Error: Azure Storage connection not configured")
         
-        table_client = table_service.get_table_client("quiz1")
+        # Found in the snapshot; a user added elsewhere since it was loaded is read from the table
+        entity = users_snapshot.get(name)
+        if entity is None:
+            try:
+                found = table_client.get_entity(partition_key=TABLE_NAME, row_key=name, select=USER_FIELDS)
+            except Exception:
+                return status_page(f"Error: User '{name}' not found")
+            users_snapshot.put(found)
+            entity = users_snapshot.get(name)
         
-        # Try to find the user
-        try:
-            entity = table_client.get_entity(partition_key="quiz1", row_key=name)
-        except Exception:
-            return render_template_string(status_template(f"Error: User '{name}' not found"))
+        # The form carries the values and ETag it was built from, so update_user can send
+        # only what changed, and only if nobody else has changed the user in the meantime
+        current_class = escape(entity.get('class', ''))
+        current_comments = escape(entity.get('comments', ''))
+        name = escape(name)
         
         # Show edit form with current values
         html = f'''
@@ -472,19 +808,22 @@ def edit_user():
             </div>
             <h1>Edit User: {name}</h1>
             <p><strong>Current Values:</strong></p>
-            <p>Age: {entity.get('age', 'Not set')}</p>
-            <p>Class: {entity.get('class', 'Not set')}</p>
-            <p>Comments: {entity.get('comments', 'Not set')}</p>
+            <p>Age: {escape(entity.get('age', 'Not set'))}</p>
+            <p>Class: {escape(entity.get('class', 'Not set'))}</p>
+            <p>Comments: {escape(entity.get('comments', 'Not set'))}</p>
             
             <form action="/update_user" method="post">
                 <input type="hidden" name="user_name" value="{name}">
+                <input type="hidden" name="etag" value="{escape(entity['_etag'])}">
+                <input type="hidden" name="original_class" value="{current_class}">
+                <input type="hidden" name="original_comments" value="{current_comments}">
                 <div class="form-group">
                     <label for="class">New Class:</label>
-                    <input type="text" id="class" name="class" value="{entity.get('class', '')}">
+                    <input type="text" id="class" name="class" value="{current_class}">
                 </div>
                 <div class="form-group">
                     <label for="comments">New Comments:</label>
-                    <input type="text" id="comments" name="comments" value="{entity.get('comments', '')}">
+                    <input type="text" id="comments" name="comments" value="{current_comments}">
                 </div>
                 <button type="submit">Update User</button>
             </form>
@@ -494,35 +833,53 @@ def edit_user():
         return html
         
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
 @app.route('/update_user', methods=['POST'])
 def update_user():
     try:
         name = request.form.get('user_name', '').strip()
-        new_class = request.form.get('class', '').strip()
-        new_comments = request.form.get('comments', '').strip()
+        etag = request.form.get('etag', '')
+        if not name or not etag:
+            return status_page("Error: Please find the user to edit first")
         
-        table_service = get_table_service()
-        if not table_service:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
-        
-        table_client = table_service.get_table_client("quiz1")
-        
-        # Get the existing entity
-        entity = table_client.get_entity(partition_key="quiz1", row_key=name)
+        # Only fields that differ from what the edit form showed are sent
+        patch = {}
+        for field in ('class', 'comments'):
+            value = request.form.get(field, '').strip()
+            if value != request.form.get(f'original_{field}', '').strip():
+                patch[field] = value
+        if not patch:
+            return status_page(f"Success: No changes to save for user '{name}'")
         
-        # Update the fields
-        entity['class'] = new_class
-        entity['comments'] = new_comments
+        table_client = get_table_client()
+        if not table_client:
+            return status_page("Error: Azure Storage connection not configured")
         
-        # Update the entity
-        table_client.update_entity(entity)
+        # One merge of just the changed fields, applied only if the user is unchanged since
+        # the form was built; the row no longer matches data.csv, so the next sync rewrites it
+        patch.update({'PartitionKey': TABLE_NAME, 'RowKey': name, 'content_hash': ''})
+        result = table_client.update_entity(
+            patch,
+            mode=UpdateMode.MERGE,
+            etag=etag,
+            match_condition=MatchConditions.IfNotModified
+        )
+        users_snapshot.merge(patch, etag=result.get('etag'))
         
-        return render_template_string(status_template(f"Success: Updated user '{name}' successfully"))
+        return status_page(f"Success: Updated user '{name}' successfully")
         
+    except ResourceModifiedError:
+        # The snapshot may be the copy that was out of date, so finding the user again reloads it
+        users_snapshot.invalidate()
+        return status_page(
+            f"Error: User '{name}' was changed by someone else after you opened it - find the user again to see their changes"
+        )
+    except ResourceNotFoundError:
+        users_snapshot.remove(name)
+        return status_page(f"Error: User '{name}' not found - they may have been removed")
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
 @app.route('/add_user', methods=['POST'])
 def add_user():
@@ -533,57 +890,160 @@ def add_user():
         comments = request.form.get('new_comments', '').strip()
         
         if not name or not age:
-            return render_template_string(status_template("Error: Name and age are required"))
-        
-        table_service = get_table_service()
-        if not table_service:
-            return render_template_string(status_template("Error: Azure Storage connection not configured"))
+            return status_page("Error: Name and age are required")
+        age = parse_age(age)
+        if age is None:
+            return status_page("Error: Age must be a whole number")
         
-        table_client = table_service.get_table_client("quiz1")
+        table_client = get_table_client()
+        if not table_client:
+            return status_page("Error: Azure Storage connection not configured")
         
-        # Check if user already exists
+        # Insert straight away; the service rejects a name that's already taken, so there's
+        # no separate lookup and no window for someone else to add the same name in between
+        entity = new_user_entity(name, age, user_class, comments)
         try:
-            existing = table_client.get_entity(partition_key="quiz1", row_key=name)
-            return render_template_string(status_template(f"Error: User '{name}' already exists. Names must be unique."))
-        except:
-            pass  # User doesn't exist, which is what we want
-        
-        # Create new entity
-        entity = {
-            "PartitionKey": "quiz1",
-            "RowKey": name,
-            "age": age,
-            "class": user_class,
-            "picture": "",  # Empty picture field
-            "comments": comments
-        }
-        
-        # Insert the entity
-        table_client.create_entity(entity)
-        
-        return render_template_string(status_template(f"Success: Added new user '{name}' successfully"))
+            result = table_client.create_entity(entity)
+        except ResourceExistsError:
+            return status_page(f"Error: User '{name}' already exists. Names must be unique.")
+        
+        users_snapshot.put(entity, etag=result.get('etag'))
+        
+        return status_page(f"Success: Added new user '{name}' successfully")
+        
+    except Exception as e:
+        return error_page(e)
+
+def new_user_entity(name, age, user_class, comments):
+    return {
+        "PartitionKey": TABLE_NAME,
+        "RowKey": name,
+        "age": age,
+        "class": user_class,
+        "picture": "",  # Empty picture field
+        "comments": comments
+    }
+
+def add_bulk_user(entities, problems, where, name, age, user_class, comments):
+    """Check one user for bulk_add_users: add its entity to entities, or say why not in problems"""
+    if not name:
+        problems[where] = "name is required"
+    elif parse_age(age) is None:
+        problems[name] = "age must be a whole number"
+    elif name in entities:
+        problems[name] = "listed more than once"
+    else:
+        entities[name] = new_user_entity(name, parse_age(age), user_class, comments)
+
+def parse_bulk_users(text):
+    """Users from name,age,class,comments lines; returns (entities, problems by name)"""
+    entities, problems = {}, {}
+    for line_number, row in enumerate(csv.reader(text.splitlines()), 1):
+        fields = [field.strip() for field in row] + [''] * 4
+        name, age, user_class, comments = fields[:4]
+        if not any(row) or (line_number == 1 and name.lower() == 'name'):
+            continue  # Blank line or a header
+        add_bulk_user(entities, problems, f'line {line_number}', name, age, user_class, comments)
+    return list(entities.values()), problems
+
+def parse_bulk_users_json(users):
+    """Users from a JSON list of {name, age, class, comments}; returns (entities, problems by name)"""
+    def text(value):
+        return '' if value is None else str(value).strip()
+    entities, problems = {}, {}
+    for number, user in enumerate(users, 1):
+        if not isinstance(user, dict):
+            problems[f'user {number}'] = "expected an object"
+            continue
+        add_bulk_user(entities, problems, f'user {number}', text(user.get('name')), user.get('age'),
+                      text(user.get('class')), text(user.get('comments')))
+    return list(entities.values()), problems
+
+def create_in_batches(table_client, entities):
+    """Create users in transactions of up to BATCH_SIZE, SYNC_CONCURRENCY at a time.
+
+    A transaction fails as a whole, so the row it names is taken out (as a
+    conflict if the name already exists) and the rest is sent again.
+    Returns (created names, problems by name).
+    """
+    def create_batch(batch):
+        created, problems = [], {}
+        while batch:
+            try:
+                table_client.submit_transaction([('create', entity) for entity in batch])
+                created.extend(entity['RowKey'] for entity in batch)
+                break
+            except TableTransactionError as e:
+                failed = batch[e.index if 0 <= e.index < len(batch) else 0]
+                problems[failed['RowKey']] = "already exists" if getattr(e, 'error_code', None) == 'EntityAlreadyExists' else str(e.message)
+                batch = [entity for entity in batch if entity is not failed]
+            except ResourceExistsError:
+                # A single-operation transaction reports its conflict like a plain insert
+                problems[batch[0]['RowKey']] = "already exists"
+                batch = batch[1:]
+        return created, problems
+    
+    batches = [entities[i:i + BATCH_SIZE] for i in range(0, len(entities), BATCH_SIZE)]
+    created, problems = [], {}
+    if batches:
+        with ThreadPoolExecutor(max_workers=min(SYNC_CONCURRENCY, len(batches))) as pool:
+            for batch_created, batch_problems in pool.map(create_batch, batches):
+                created.extend(batch_created)
+                problems.update(batch_problems)
+    return created, problems
+
+@app.route('/bulk_add_users', methods=['POST'])
+def bulk_add_users():
+    """Add many users at once from name,age,class,comments lines (form field 'users'),
+    or from a JSON list of {name, age, class, comments}; JSON requests get a JSON report"""
+    try:
+        as_json = request.is_json
+        if as_json:
+            users = request.get_json(silent=True)
+            if not isinstance(users, list):
+                return jsonify({'error': 'expected a JSON list of users'}), 400
+            entities, problems = parse_bulk_users_json(users)
+        else:
+            entities, problems = parse_bulk_users(request.form.get('users', ''))
+        
+        table_client = get_table_client()
+        if not table_client:
+            if as_json:
+                return jsonify({'error': 'Azure Storage connection not configured'}), 503
+            return status_page("Error: Azure Storage connection not configured")
+        
+        created, write_problems = create_in_batches(table_client, entities)
+        problems.update(write_problems)
+        if created:
+            users_snapshot.invalidate()  # Reloaded once rather than patched row by row
+        
+        if as_json:
+            return jsonify({'created': created, 'problems': problems})
+        summary = f"Added {len(created)} users"
+        if problems:
+            details = '; '.join(f"{name}: {problem}" for name, problem in problems.items())
+            return status_page(f"Error: {summary}, {len(problems)} not added ({details})")
+        return status_page(f"Success: {summary}")
         
     except Exception as e:
-        return render_template_string(status_template(f"Error: {str(e)}"))
+        return error_page(e)
 
-def status_template(message):
-    css_class = "success" if "Success" in message else "error"
-    return f'''
+STATUS_TEMPLATE = '''
     <!DOCTYPE html>
     <html>
     <head>
         <title>Status</title>
         <style>
-            body {{ font-family: Arial, sans-serif; margin: 40px; }}
-            .status {{ margin: 20px 0; padding: 10px; border-radius: 5px; }}
-            .success {{ background-color: #d4edda; color: #155724; }}
-            .error {{ background-color: #f8d7da; color: #721c24; }}
-            .back-btn {{ margin-top: 20px; }}
+            body { font-family: Arial, sans-serif; margin: 40px; }
+            .status { margin: 20px 0; padding: 10px; border-radius: 5px; }
+            .success { background-color: #d4edda; color: #155724; }
+            .error { background-color: #f8d7da; color: #721c24; }
+            .back-btn { margin-top: 20px; }
         </style>
     </head>
     <body>
-        <div class="status {css_class}">
-            {message}
+        <div class="status {{ 'success' if 'Success' in message else 'error' }}">
+            {{ message }}
         </div>
         <div class="back-btn">
             <a href="/">← Back to Home</a>
@@ -592,5 +1052,9 @@ def status_template(message):
     </html>
     '''
 
+def status_page(message):
+    """Render a status message; it goes in as a template variable, so names in it are escaped, never evaluated"""
+    return render_template_string(STATUS_TEMPLATE, message=message)
+
 if __name__ == '__main__':
 	app.run(host='0.0.0.0', port=5000)
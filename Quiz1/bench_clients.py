@@ -0,0 +1,86 @@
+"""Per-request cost of building a TableServiceClient vs reusing the process-wide one.
+
+Offline (the default), this times only the client work every route used to
+repeat: parsing the connection string and building the service client, its
+HTTP pipeline and the table client. It uses a made-up account and sends no
+requests.
+
+With --live and AZURE_STORAGE_CONNECTION_STRING set, each iteration also
+reads one entity. Per-request clients then pay for a new connection and TLS
+handshake every time, and the shared client reuses its keep-alive
+connection.
+
+    python bench_clients.py --requests 2000
+    AZURE_STORAGE_CONNECTION_STRING=... python bench_clients.py --live --requests 50
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+OFFLINE_CONNECTION_STRING = (
+    "DefaultEndpointsProtocol=https;AccountName=benchaccount;"
+    "AccountKey=YmVuY2gtYWNjb3VudC1rZXktbm90LXJlYWwtYnV0LWxvbmctZW5vdWdoLXRvLWRlY29kZQ==;"
+    "EndpointSuffix=core.windows.net"
+)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))]
+
+
+def measure(label, request, requests):
+    timings = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        request()
+        timings.append(time.perf_counter() - start)
+    print(f"{label:<22}{statistics.mean(timings) * 1e6:>12.1f}{percentile(timings, 50) * 1e6:>12.1f}"
+          f"{percentile(timings, 99) * 1e6:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--live', action='store_true', help='also read an entity per request (needs a real account)')
+    args = parser.parse_args()
+
+    if args.live and not os.environ.get('AZURE_STORAGE_CONNECTION_STRING'):
+        sys.exit("--live needs AZURE_STORAGE_CONNECTION_STRING")
+    os.environ.setdefault('AZURE_STORAGE_CONNECTION_STRING', OFFLINE_CONNECTION_STRING)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+    from azure.core.exceptions import ResourceNotFoundError
+    from azure.data.tables import TableServiceClient
+
+    if not args.live:
+        # The made-up account can't answer the startup credential check
+        app_module.check_table_service = lambda table_service: None
+    connection_string = app_module.AZURE_STORAGE_CONNECTION_STRING
+
+    def use(table_client):
+        if args.live:
+            try:
+                table_client.get_entity(partition_key=app_module.TABLE_NAME, row_key='ann')
+            except ResourceNotFoundError:
+                pass
+
+    def per_request():
+        # What every route did before: a new service client, pipeline and connection
+        table_service = TableServiceClient.from_connection_string(connection_string)
+        use(table_service.get_table_client(app_module.TABLE_NAME))
+
+    def shared():
+        use(app_module.get_table_client())
+
+    shared()  # Build the process-wide client outside the timing
+    print(f"{args.requests} requests{' with one entity read each' if args.live else ', client work only'}")
+    print(f"{'mode':<22}{'mean us':>12}{'p50 us':>12}{'p99 us':>12}")
+    measure('per-request client', per_request, args.requests)
+    measure('shared client', shared, args.requests)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+"""Load test for every Quiz1 route, offline, on the in-memory storage stand-in.
+
+Loads data.csv and --users synthetic users into memory_storage (with
+STORAGE_BACKEND=memory), plus a generated picture for each picture data.csv
+names. It then sends a weighted mix of requests to every route from
+--threads threads through Flask's test client. Storage calls take about
+--latency-ms each, log-normally spread. The report gives overall
+requests/second and latency percentiles per route.
+
+A request counts as failed on an HTTP status of 500 or more, or on a status
+page with an error the mix didn't expect (update conflicts between threads
+and duplicate names are expected).
+
+    python bench_load.py --users 2000 --threads 8 --requests 200 --latency-ms 10
+"""
+import argparse
+import html
+import io
+import os
+import random
+import re
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+WORDS = ['smart', 'tall', 'kind', 'funny', 'quiet', 'curious', 'plays', 'chess', 'tuba', 'reads', 'runs', 'very']
+EXPECTED_ERRORS = ('already exists', 'changed by someone else')
+
+
+def percentile(values, pct):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100.0 * (len(values) - 1))))]
+
+
+def status_error(body):
+    match = re.search(r'class="status error">\s*(.*?)\s*</div>', body, re.S)
+    return match.group(1) if match else None
+
+
+def seed(app_module, client, users):
+    """data.csv, users synthetic users and the pictures data.csv uses; returns every name"""
+    from PIL import Image
+    client.post('/upload_users')
+    for start in range(0, users, 500):
+        client.post('/bulk_add_users', json=[
+            {'name': f'student{i:06d}', 'age': random.randint(5, 80), 'class': str(random.randint(1, 9)),
+             'comments': ' '.join(random.choices(WORDS, k=6))}
+            for i in range(start, min(start + 500, users))
+        ])
+    blob_service = app_module.get_blob_service()
+    for picture in {user['picture'] for user in app_module.users_snapshot.all()[0] if user.get('picture', '').strip()} | {'m.jpg'}:
+        data = io.BytesIO()
+        Image.effect_noise((1200, 900), 60).convert('RGB').save(data, 'JPEG')
+        blob_service.get_blob_client(app_module.BLOB_CONTAINER_NAME, picture).upload_blob(data.getvalue(), overwrite=True)
+    return [user['RowKey'] for user in app_module.users_snapshot.all()[0]]
+
+
+class Session:
+    """One simulated user: picks requests from the mix and keeps what later requests need"""
+
+    def __init__(self, app_module, number, names, pictures):
+        self.client = app_module.app.test_client()
+        self.number = number
+        self.names = names
+        self.pictures = pictures
+        self.added = 0
+
+    def edit_form(self, name):
+        body = self.client.post('/edit_user', data={'edit_name': name}).get_data(as_text=True)
+        return {field: html.unescape(value) for field, value in re.findall(r'name="(\w+)" value="([^"]*)"', body)}
+
+    def next_request(self):
+        """(label, method, path, kwargs) for the test client"""
+        roll = random.random()
+        name = random.choice(self.names)
+        if roll < 0.05:
+            return ('home', 'get', '/', {})
+        if roll < 0.20:
+            return ('view_users', 'get', f'/view_users?page_size={random.choice((20, 50, 100))}', {})
+        if roll < 0.35:
+            low = random.randint(5, 70)
+            return ('search_by_age', 'post', '/search_by_age', {'data': {'low_age': low, 'high_age': low + random.randint(0, 10)}})
+        if roll < 0.50:
+            return ('search_comments', 'get', f'/search_comments?q={"+".join(random.sample(WORDS, 2))}', {})
+        if roll < 0.60:
+            return ('edit_user', 'post', '/edit_user', {'data': {'edit_name': name}})
+        if roll < 0.70:
+            form = self.edit_form(name)
+            form['comments'] = ' '.join(random.choices(WORDS, k=5))
+            return ('update_user', 'post', '/update_user', {'data': form})
+        if roll < 0.75:
+            self.added += 1
+            data = {'new_name': f'added{self.number:02d}x{self.added:06d}', 'new_age': random.randint(5, 80),
+                    'new_class': '1', 'new_comments': 'added during the load test'}
+            return ('add_user', 'post', '/add_user', {'data': data})
+        if roll < 0.77:
+            self.added += 10
+            lines = '\n'.join(f'bulk{self.number:02d}x{self.added - i:06d},{random.randint(5, 80)},2,bulk' for i in range(10))
+            return ('bulk_add_users', 'post', '/bulk_add_users', {'data': {'users': lines}})
+        if roll < 0.78:
+            return ('upload_users', 'post', '/upload_users', {})
+        return ('img', 'get', f'/img/{random.choice(self.pictures)}?w={random.choice((200, 400))}', {})
+
+
+def worker(session, count, latencies, failures, lock):
+    for _ in range(count):
+        label, method, path, kwargs = session.next_request()
+        start = time.perf_counter()
+        response = getattr(session.client, method)(path, **kwargs)
+        body = response.get_data(as_text=True) if response.mimetype == 'text/html' else ''
+        elapsed = time.perf_counter() - start
+        error = f"HTTP {response.status_code}" if response.status_code >= 500 else status_error(body)
+        with lock:
+            latencies[label].append(elapsed)
+            if error and not any(expected in error for expected in EXPECTED_ERRORS):
+                failures[label] += 1
+                if failures[label] <= 3:
+                    print(f"{label}: {error[:200]}", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=2000, help='synthetic users added to data.csv')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=100, help='requests per thread')
+    parser.add_argument('--latency-ms', type=float, default=0.0, help='median injected latency per storage call')
+    args = parser.parse_args()
+
+    os.environ['STORAGE_BACKEND'] = 'memory'
+    os.environ['MEMORY_STORAGE_LATENCY_MS'] = '0'
+    os.environ['IMAGE_CACHE_DIR'] = tempfile.mkdtemp(prefix='bench-images-')
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import app as app_module
+
+    names = seed(app_module, app_module.app.test_client(), args.users)
+    pictures = sorted({user['picture'] for user in app_module.users_snapshot.all()[0] if user.get('picture', '').strip()})
+    app_module.get_clients()[0].latency.median_ms = args.latency_ms
+
+    latencies = defaultdict(list)
+    failures = defaultdict(int)
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=worker, args=(Session(app_module, number, names, pictures), args.requests, latencies, failures, lock))
+        for number in range(args.threads)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total = sum(len(values) for values in latencies.values())
+    print(f"{len(names)} users, {args.threads} threads, {args.latency_ms:g} ms injected latency")
+    print(f"{total} requests in {elapsed:.2f}s = {total / elapsed:.1f} req/s, {sum(failures.values())} failed")
+    print(f"{'route':<18}{'count':>7}{'failed':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}{'mean ms':>10}")
+    for label in sorted(latencies):
+        values = latencies[label]
+        print(f"{label:<18}{len(values):>7}{failures[label]:>8}"
+              f"{percentile(values, 50) * 1000:>10.1f}{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}{max(values) * 1000:>10.1f}{statistics.mean(values) * 1000:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Pictures from blob storage, resized and kept in a size-bounded cache on local disk.
+
+The user tables show pictures at 100px, so sending each page's originals
+from blob storage is slow and wastes most of the bytes. ImageCache fetches
+an original once, makes the resized variants from it and keeps all of them
+as files under one directory:
+
+  * The file name is a hash of (picture, width, blob ETag) plus the
+    content's ETag, so the cache survives a restart without any index file.
+  * A picture's blob ETag is checked again once it is revalidate_seconds
+    old. A picture replaced in blob storage gets a new key, and its old
+    variants age out of the cache.
+  * Once the files add up to more than max_bytes, the least recently used
+    ones are deleted. Reads touch a file's mtime, so the order survives a
+    restart too.
+  * A picture bigger than a tenth of max_bytes (usually an original) is
+    served without being kept, so one upload can't flush everything else.
+  * Concurrent requests for the same variant (or the same ETag check) wait
+    for one request to blob storage and share its result, kept or not.
+"""
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from PIL import Image, ImageOps
+
+JPEG_QUALITY = 85
+
+
+def resize(data, width):
+    """A JPEG no wider or taller than width pixels; raises ValueError if data isn't an image"""
+    try:
+        image = Image.open(io.BytesIO(data))
+        image.load()
+    except Exception as e:
+        raise ValueError(f"Not a supported image: {e}")
+    # Phones record rotation in EXIF; bake it in since the resized JPEG drops EXIF
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail((width, width), Image.LANCZOS)
+    if image.mode != 'RGB':
+        # JPEG has no alpha channel; flatten transparent images onto white
+        background = Image.new('RGB', image.size, 'white')
+        rgba = image.convert('RGBA')
+        background.paste(rgba, mask=rgba.getchannel('A'))
+        image = background
+    output = io.BytesIO()
+    image.save(output, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    return output.getvalue()
+
+
+class CachedImage:
+    def __init__(self, path, size, etag, content_type, data=None):
+        self.path = path  # None when the picture was too big to keep
+        self.size = size
+        self.etag = etag
+        self.content_type = content_type
+        self.data = data
+
+    def read(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+
+class _Fetch:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class ImageCache:
+    """On-disk LRU of original and resized pictures, filled by fetch(name) -> bytes
+    and kept current by version(name) -> the blob's ETag"""
+
+    def __init__(self, root, fetch, version, max_bytes=100 * 1024 * 1024, revalidate_seconds=60):
+        self.root = root
+        self.fetch = fetch  # Both raise if the picture doesn't exist
+        self.version = version
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_bytes // 10
+        self.revalidate_seconds = revalidate_seconds
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> CachedImage, least recently used first
+        self._in_flight = {}  # key -> _Fetch, while one request fetches it for everyone
+        self._versions = {}  # name -> (blob ETag, time.monotonic() it was checked)
+        self._total = 0
+        self._scanned = False
+
+    @staticmethod
+    def _key(name, width, version):
+        return hashlib.sha256(f"{name}\0{width or 'original'}\0{version}".encode('utf-8')).hexdigest()[:32]
+
+    @staticmethod
+    def _content_type(name, width):
+        if width:
+            return 'image/jpeg'
+        return mimetypes.guess_type(name)[0] or 'application/octet-stream'
+
+    def _scan(self):
+        """Pick up the files a previous process left, oldest use first (called under the lock)"""
+        self._scanned = True
+        os.makedirs(self.root, exist_ok=True)
+        found = []
+        for file_name in os.listdir(self.root):
+            key, _, etag = file_name.partition('-')
+            if not etag or etag.endswith('.tmp'):
+                continue
+            path = os.path.join(self.root, file_name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            found.append((stat.st_mtime, key, path, stat.st_size, etag))
+        for _, key, path, size, etag in sorted(found):
+            # The content type comes back with the first lookup that knows the name
+            self._entries[key] = CachedImage(path, size, etag, None)
+            self._total += size
+
+    def _lookup(self, key, content_type):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if not os.path.exists(entry.path):
+            del self._entries[key]  # Removed from outside the cache
+            self._total -= entry.size
+            return None
+        self._entries.move_to_end(key)
+        entry.content_type = content_type
+        try:
+            os.utime(entry.path)
+        except OSError:
+            pass
+        return entry
+
+    def _store(self, key, data, content_type):
+        etag = hashlib.sha256(data).hexdigest()[:16]
+        if len(data) > self.max_entry_bytes:
+            return CachedImage(None, len(data), etag, content_type, data)
+        path = os.path.join(self.root, f"{key}-{etag}")
+        # Write then rename, so a reader never sees half a file
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total -= previous.size
+                if previous.path != path:
+                    self._remove_file(previous.path)
+            entry = CachedImage(path, len(data), etag, content_type)
+            self._entries[key] = entry
+            self._total += entry.size
+            while self._total > self.max_bytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= evicted.size
+                self._remove_file(evicted.path)
+        return entry
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def _single_flight(self, key, check, compute):
+        """check() under the lock, or else compute() once for every caller asking for key meanwhile"""
+        with self._lock:
+            found = check()
+            if found is not None:
+                return found
+            flight = self._in_flight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._in_flight[key] = _Fetch()
+        if not leader:
+            # Someone else is fetching it: share their result (kept or not) or their error
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        try:
+            flight.result = compute()
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+            flight.done.set()
+
+    def _current_version(self, name):
+        """The blob's ETag, asking blob storage again once the last answer is revalidate_seconds old"""
+        def known():
+            checked = self._versions.get(name)
+            if checked is not None and time.monotonic() - checked[1] < self.revalidate_seconds:
+                return checked[0]
+            return None
+
+        def check():
+            version = self.version(name)
+            with self._lock:
+                self._versions[name] = (version, time.monotonic())
+            return version
+        return self._single_flight(('version', name), known, check)
+
+    def get(self, name, width=None):
+        """The cached picture, resized to width pixels if given, fetching it on a miss"""
+        key = self._key(name, width, self._current_version(name))
+        content_type = self._content_type(name, width)
+
+        def cached():
+            if not self._scanned:
+                self._scan()
+            return self._lookup(key, content_type)
+
+        def load():
+            if width:
+                try:
+                    original = self.get(name).read()
+                except FileNotFoundError:
+                    original = self.fetch(name)  # Evicted between the lookup and the read
+                data = resize(original, width)
+            else:
+                data = self.fetch(name)
+            return self._store(key, data, content_type)
+        return self._single_flight(key, cached, load)
+
+    def stats(self):
+        with self._lock:
+            return {'files': len(self._entries), 'bytes': self._total, 'max_bytes': self.max_bytes}
@@ -0,0 +1,330 @@
+"""In-memory stand-ins for the table and blob clients, for running Quiz1 without Azure.
+
+They implement just the calls app.py makes, with the same results and
+errors as the Azure SDK:
+
+  * TableServiceClient: create_table, get_table_client, query_tables
+  * TableClient: query_entities (filter, parameters, select, paging),
+    get_entity, create_entity, upsert_entity, update_entity (MERGE/REPLACE
+    and ETag conditions), delete_entity and submit_transaction
+  * BlobServiceClient: get_blob_client(...).download_blob().readall(),
+    get_blob_properties() (name, size and a new ETag per upload) and
+    upload_blob
+
+Every call first waits for a delay drawn from a LatencyModel, so load tests
+see something like a real storage account's latency and its long tail.
+Set STORAGE_BACKEND=memory to make app.py use them.
+"""
+import math
+import random
+import re
+import threading
+import time
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.data.tables import TableEntity, TableTransactionError, UpdateMode
+from azure.storage.blob import BlobProperties
+
+# One comparison of a $filter: property, operator, then a quoted string, number or @parameter
+CLAUSE = re.compile(r"^\s*(\w+)\s+(eq|ne|gt|ge|lt|le)\s+('(?:[^']|'')*'|-?\d+(?:\.\d+)?|@\w+|true|false)\s*$")
+OPERATORS = {
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'gt': lambda a, b: a > b,
+    'ge': lambda a, b: a >= b,
+    'lt': lambda a, b: a < b,
+    'le': lambda a, b: a <= b,
+}
+
+
+class LatencyModel:
+    """Log-normal per-call latency: mostly near the median, with a long tail"""
+
+    def __init__(self, median_ms=0.0, sigma=0.5):
+        self.median_ms = median_ms
+        self.sigma = sigma
+
+    def simulate(self):
+        if self.median_ms > 0:
+            time.sleep(random.lognormvariate(math.log(self.median_ms), self.sigma) / 1000.0)
+
+
+def _literal(text, parameters):
+    if text.startswith('@'):
+        return parameters[text[1:]]
+    if text.startswith("'"):
+        return text[1:-1].replace("''", "'")
+    if text in ('true', 'false'):
+        return text == 'true'
+    return float(text) if '.' in text else int(text)
+
+
+def compile_filter(query_filter, parameters=None):
+    """A predicate for an OData filter made of comparisons joined by 'and' (all Quiz1 sends)"""
+    clauses = []
+    for clause in re.split(r"\s+and\s+", query_filter.strip()) if query_filter else []:
+        match = CLAUSE.match(clause)
+        if not match:
+            raise ValueError(f"Unsupported filter: {clause!r}")
+        name, operator, value = match.groups()
+        clauses.append((name, OPERATORS[operator], _literal(value, parameters or {})))
+
+    def matches(entity):
+        for name, compare, value in clauses:
+            current = entity.get(name)
+            # Like the service, a missing property or one of another type never matches
+            if current is None or isinstance(current, str) != isinstance(value, str):
+                return False
+            if not compare(current, value):
+                return False
+        return True
+    return matches
+
+
+class _Pages:
+    """What ItemPaged.by_page returns: an iterator of pages with a continuation_token"""
+
+    def __init__(self, entities, page_size, continuation_token):
+        self._entities = entities
+        self._page_size = page_size
+        self._next = int(continuation_token['NextRowIndex']) if continuation_token else 0
+        self.continuation_token = continuation_token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._next is None or (self._next >= len(self._entities) and self._next > 0):
+            raise StopIteration
+        page = self._entities[self._next:self._next + self._page_size]
+        following = self._next + self._page_size
+        self._next = following if following < len(self._entities) else None
+        self.continuation_token = {'NextRowIndex': str(following)} if self._next is not None else None
+        return iter(page)
+
+
+class _Paged:
+    """What query_entities returns: iterable as a whole or page by page"""
+
+    def __init__(self, entities, page_size):
+        self._entities = entities
+        self._page_size = page_size or 1000
+
+    def __iter__(self):
+        return iter(self._entities)
+
+    def by_page(self, continuation_token=None):
+        return _Pages(self._entities, self._page_size, continuation_token)
+
+
+class MemoryTableClient:
+    """One table as a dict of (PartitionKey, RowKey) -> (properties, etag)"""
+
+    def __init__(self, table_name, latency):
+        self.table_name = table_name
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._version = 0
+
+    def _etag(self):
+        self._version += 1
+        return f'W/"datetime\'{self._version}\'"'
+
+    @staticmethod
+    def _entity(properties, etag, select=None):
+        if select:
+            properties = {name: properties[name] for name in select if name in properties}
+        entity = TableEntity(properties)
+        entity._metadata = {'etag': etag}
+        return entity
+
+    def query_entities(self, query_filter, select=None, parameters=None, results_per_page=None, **kwargs):
+        self.latency.simulate()
+        matches = compile_filter(query_filter, parameters)
+        with self._lock:
+            entities = [self._entity(properties, etag, select)
+                        for _, (properties, etag) in sorted(self._rows.items()) if matches(properties)]
+        return _Paged(entities, results_per_page)
+
+    def list_entities(self, select=None, results_per_page=None, **kwargs):
+        return self.query_entities('', select=select, results_per_page=results_per_page)
+
+    def get_entity(self, partition_key, row_key, select=None, **kwargs):
+        self.latency.simulate()
+        with self._lock:
+            try:
+                properties, etag = self._rows[(partition_key, row_key)]
+            except KeyError:
+                raise ResourceNotFoundError("The specified resource does not exist.")
+            return self._entity(properties, etag, select)
+
+    def _create(self, entity):
+        key = (entity['PartitionKey'], entity['RowKey'])
+        if key in self._rows:
+            raise ResourceExistsError("The specified entity already exists.")
+        self._rows[key] = (dict(entity), self._etag())
+        return {'etag': self._rows[key][1]}
+
+    def _upsert(self, entity, mode=UpdateMode.MERGE):
+        key = (entity['PartitionKey'], entity['RowKey'])
+        current = self._rows.get(key, ({}, None))[0]
+        properties = {**current, **entity} if mode == UpdateMode.MERGE else dict(entity)
+        self._rows[key] = (properties, self._etag())
+        return {'etag': self._rows[key][1]}
+
+    def _update(self, entity, mode=UpdateMode.MERGE, etag=None, match_condition=None):
+        key = (entity['PartitionKey'], entity['RowKey'])
+        if key not in self._rows:
+            raise ResourceNotFoundError("The specified resource does not exist.")
+        if match_condition == MatchConditions.IfNotModified and etag != self._rows[key][1]:
+            raise ResourceModifiedError("The update condition specified in the request was not satisfied.")
+        return self._upsert(entity, mode)
+
+    def _delete(self, entity):
+        self._rows.pop((entity['PartitionKey'], entity['RowKey']), None)
+        return {}
+
+    def create_entity(self, entity, **kwargs):
+        self.latency.simulate()
+        with self._lock:
+            return self._create(entity)
+
+    def upsert_entity(self, entity, mode=UpdateMode.MERGE, **kwargs):
+        self.latency.simulate()
+        with self._lock:
+            return self._upsert(entity, mode)
+
+    def update_entity(self, entity, mode=UpdateMode.MERGE, etag=None, match_condition=None, **kwargs):
+        self.latency.simulate()
+        with self._lock:
+            return self._update(entity, mode, etag, match_condition)
+
+    def delete_entity(self, partition_key, row_key=None, **kwargs):
+        self.latency.simulate()
+        with self._lock:
+            self._delete({'PartitionKey': partition_key, 'RowKey': row_key})
+
+    def submit_transaction(self, operations, **kwargs):
+        """All operations or none; a failure names the operation's index like the service does"""
+        self.latency.simulate()
+        with self._lock:
+            saved = dict(self._rows)
+            results = []
+            for index, operation in enumerate(operations):
+                kind, entity = operation[0], operation[1]
+                options = operation[2] if len(operation) > 2 else {}
+                try:
+                    if kind == 'create':
+                        results.append(self._create(entity))
+                    elif kind == 'upsert':
+                        results.append(self._upsert(entity, options.get('mode', UpdateMode.MERGE)))
+                    elif kind == 'update':
+                        results.append(self._update(entity, **options))
+                    elif kind == 'delete':
+                        results.append(self._delete(entity))
+                    else:
+                        raise ValueError(f"Unknown transaction operation {kind!r}")
+                except (ResourceExistsError, ResourceNotFoundError, ResourceModifiedError) as e:
+                    self._rows = saved
+                    if len(operations) == 1:
+                        raise  # The service reports a one-operation transaction like the single call
+                    error = TableTransactionError(message=f"{index}:{e.message}")
+                    error.error_code = {
+                        ResourceExistsError: 'EntityAlreadyExists',
+                        ResourceNotFoundError: 'ResourceNotFound',
+                        ResourceModifiedError: 'UpdateConditionNotSatisfied',
+                    }[type(e)]
+                    raise error
+            return results
+
+
+class MemoryTableService:
+    def __init__(self, latency):
+        self.latency = latency
+        self._tables = {}
+        self._lock = threading.Lock()
+
+    def create_table(self, table_name):
+        self.latency.simulate()
+        with self._lock:
+            if table_name in self._tables:
+                raise ResourceExistsError("The table specified already exists.")
+            self._tables[table_name] = MemoryTableClient(table_name, self.latency)
+            return self._tables[table_name]
+
+    def get_table_client(self, table_name):
+        # Tables are created on first use, so a client is never left pointing at nothing
+        with self._lock:
+            if table_name not in self._tables:
+                self._tables[table_name] = MemoryTableClient(table_name, self.latency)
+            return self._tables[table_name]
+
+    def query_tables(self, query_filter, parameters=None, **kwargs):
+        self.latency.simulate()
+        matches = compile_filter(query_filter, parameters)
+        with self._lock:
+            return [{'name': name} for name in sorted(self._tables) if matches({'TableName': name})]
+
+
+class _Download:
+    def __init__(self, data):
+        self._data = data
+
+    def readall(self):
+        return self._data
+
+
+class MemoryBlobClient:
+    def __init__(self, service, container, name):
+        self._service = service
+        self._key = (container, name)
+
+    def download_blob(self, **kwargs):
+        self._service.latency.simulate()
+        try:
+            return _Download(self._service.blobs[self._key])
+        except KeyError:
+            raise ResourceNotFoundError("The specified blob does not exist.")
+
+    def get_blob_properties(self, **kwargs):
+        self._service.latency.simulate()
+        with self._service.lock:
+            try:
+                data, etag = self._service.blobs[self._key], self._service.etags[self._key]
+            except KeyError:
+                raise ResourceNotFoundError("The specified blob does not exist.")
+        # BlobProperties takes the response headers it is normally built from
+        properties = BlobProperties(name=self._key[1], **{'ETag': etag, 'Content-Length': len(data)})
+        properties.container = self._key[0]
+        return properties
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        self._service.latency.simulate()
+        data = data if isinstance(data, bytes) else data.read()
+        with self._service.lock:
+            if not overwrite and self._key in self._service.blobs:
+                raise ResourceExistsError("The specified blob already exists.")
+            self._service.version += 1
+            self._service.blobs[self._key] = data
+            self._service.etags[self._key] = f'"0x{self._service.version:X}"'
+
+
+class MemoryBlobService:
+    def __init__(self, latency):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.blobs = {}  # (container, name) -> bytes
+        self.etags = {}  # (container, name) -> ETag of its last upload
+        self.version = 0
+
+    def get_blob_client(self, container, blob):
+        return MemoryBlobClient(self, container, blob)
+
+
+def memory_clients(table_name, latency_ms=0.0, latency_sigma=0.5):
+    """(table service, table client, blob service) sharing one LatencyModel, the shape get_clients returns"""
+    latency = LatencyModel(latency_ms, latency_sigma)
+    table_service = MemoryTableService(latency)
+    return table_service, table_service.get_table_client(table_name), MemoryBlobService(latency)
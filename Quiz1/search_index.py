@@ -0,0 +1,83 @@
+"""Ranked full-text search over users' names and comments.
+
+An inverted index (term -> {RowKey: term count}) plus each user's length in
+terms is enough for BM25 ranking. A query only touches the postings of its
+own terms. Users are indexed one at a time, so keeping the index current
+after a write costs one user's worth of work, not a rebuild.
+"""
+import heapq
+import math
+import re
+import threading
+
+TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    return TOKEN.findall(str(text or '').lower())
+
+
+class CommentIndex:
+    """Thread-safe BM25 index of each user's name and comments"""
+
+    def __init__(self, k1=1.2, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings = {}  # term -> {RowKey: count}
+        self._terms = {}     # RowKey -> {term: count}, to undo a user's postings
+        self._lengths = {}   # RowKey -> number of terms
+        self._texts = {}     # RowKey -> the text it was indexed from
+        self._total_length = 0
+
+    @staticmethod
+    def text_of(user):
+        return f"{user.get('RowKey', '')} {user.get('comments', '')}"
+
+    def _remove(self, row_key):
+        for term, count in self._terms.pop(row_key, {}).items():
+            postings = self._postings[term]
+            del postings[row_key]
+            if not postings:
+                del self._postings[term]
+            self._total_length -= count
+        self._texts.pop(row_key, None)
+        self._lengths.pop(row_key, None)
+
+    def set(self, row_key, user):
+        """Index a user's current name and comments; None removes them"""
+        text = self.text_of(user) if user is not None else None
+        with self._lock:
+            if text == self._texts.get(row_key):
+                return  # Nothing searchable changed
+            self._remove(row_key)
+            if text is None:
+                return
+            terms = {}
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0) + 1
+            for term, count in terms.items():
+                self._postings.setdefault(term, {})[row_key] = count
+                self._total_length += count
+            self._terms[row_key] = terms
+            self._lengths[row_key] = sum(terms.values())
+            self._texts[row_key] = text
+
+    def search(self, query, limit=10):
+        """Up to limit (RowKey, score) pairs, best match first"""
+        scores = {}
+        with self._lock:
+            documents = len(self._terms)
+            if not documents:
+                return []
+            average_length = self._total_length / documents or 1
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (documents - len(postings) + 0.5) / (len(postings) + 0.5))
+                for row_key, count in postings.items():
+                    norm = self.k1 * (1 - self.b + self.b * self._lengths[row_key] / average_length)
+                    scores[row_key] = scores.get(row_key, 0.0) + idf * count * (self.k1 + 1) / (count + norm)
+        # Equal scores come back in name order
+        return heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,168 @@
+"""An in-memory copy of the quiz1 partition for the read routes.
+
+The partition is small and mostly read, so it is loaded with one query and
+kept sorted two ways:
+
+  * by name (RowKey), for paging through users
+  * by (age, name), so an age range is two binary searches
+
+Writes made by this process patch the copy in place (put/remove), or mark
+it stale (invalidate) when patching isn't worth it. Writes made elsewhere
+show up at the next reload, which happens once the copy is older than ttl
+seconds. Every change bumps version, so callers can tell whether what they
+derived from the snapshot is still current.
+
+Listeners (subscribe) are told about every user that changes, whether by a
+patch or because a reload found it different, so indexes built on the
+snapshot can be kept current one user at a time.
+"""
+import bisect
+import threading
+import time
+
+
+class UserSnapshot:
+    """Thread-safe, versioned copy of one partition, reloaded by load() on a TTL"""
+
+    def __init__(self, load, ttl=30.0):
+        self._load = load  # Returns the partition's entities, each with metadata['etag']
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._load_lock = threading.Lock()  # One reload at a time; other readers wait for it
+        self._users = {}  # RowKey -> user dict, with its '_etag'
+        self._names = []  # Sorted RowKeys
+        self._ages = []   # Sorted (age, RowKey) of users with an integer age
+        self._changes = None  # Changes made while a reload queries the table
+        self._listeners = []  # Called with (RowKey, user or None) under the lock
+        self.version = 0
+        self.loaded_at = None  # time.monotonic() of the last load, None when stale
+
+    @staticmethod
+    def _user(entity, etag=None):
+        user = dict(entity)
+        metadata = getattr(entity, 'metadata', None) or {}
+        user['_etag'] = etag or metadata.get('etag') or user.get('_etag')
+        return user
+
+    @staticmethod
+    def _age_key(user):
+        age = user.get('age')
+        return (age, user['RowKey']) if isinstance(age, int) else None
+
+    def _apply(self, row_key, user):
+        previous = self._users.pop(row_key, None)
+        if previous is not None:
+            age_key = self._age_key(previous)
+            if age_key is not None:
+                del self._ages[bisect.bisect_left(self._ages, age_key)]
+            if user is None:
+                del self._names[bisect.bisect_left(self._names, row_key)]
+        elif user is not None:
+            bisect.insort(self._names, row_key)
+        if user is not None:
+            self._users[row_key] = user
+            age_key = self._age_key(user)
+            if age_key is not None:
+                bisect.insort(self._ages, age_key)
+        self.version += 1
+        if self._changes is not None:
+            self._changes.append((row_key, user))
+        self._notify(row_key, user)
+
+    def _notify(self, row_key, user):
+        for listener in self._listeners:
+            listener(row_key, user)
+
+    def subscribe(self, listener):
+        """Call listener(RowKey, user) for every user now in the snapshot and for every later change (None when removed)"""
+        with self._lock:
+            self._listeners.append(listener)
+            for row_key, user in self._users.items():
+                listener(row_key, user)
+
+    def refresh(self):
+        """Load the partition now if the copy is stale"""
+        if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+            return
+        with self._load_lock:
+            if self.loaded_at is not None and time.monotonic() - self.loaded_at < self.ttl:
+                return  # Another thread reloaded it while this one waited
+            with self._lock:
+                self._changes = []
+            try:
+                users = {entity['RowKey']: self._user(entity) for entity in self._load()}
+                with self._lock:
+                    # Writes made while the query ran are replayed, so an older page can't undo them
+                    for row_key, user in self._changes:
+                        if user is None:
+                            users.pop(row_key, None)
+                        else:
+                            users[row_key] = user
+                    for row_key in self._users.keys() - users.keys():
+                        self._notify(row_key, None)
+                    for row_key, user in users.items():
+                        previous = self._users.get(row_key)
+                        if previous is None or previous != user:
+                            self._notify(row_key, user)
+                    self._users = users
+                    self._names = sorted(users)
+                    self._ages = sorted(filter(None, map(self._age_key, users.values())))
+                    self.version += 1
+                    self.loaded_at = time.monotonic()
+            finally:
+                with self._lock:
+                    self._changes = None
+
+    def put(self, entity, etag=None):
+        """Record a user as written by this process, replacing what the snapshot had"""
+        with self._lock:
+            self._apply(entity['RowKey'], self._user(entity, etag))
+
+    def merge(self, patch, etag=None):
+        """Apply a MERGE of some fields to a user the snapshot already has"""
+        with self._lock:
+            current = self._users.get(patch['RowKey'])
+            if current is not None:
+                self._apply(patch['RowKey'], self._user({**current, **patch}, etag))
+
+    def remove(self, row_key):
+        with self._lock:
+            if row_key in self._users:
+                self._apply(row_key, None)
+
+    def invalidate(self):
+        """Reload on the next read; for bulk writes and after a write found the copy out of date"""
+        with self._lock:
+            self.loaded_at = None
+            self.version += 1
+
+    def get(self, row_key):
+        """A copy of one user (with '_etag'), or None"""
+        self.refresh()
+        with self._lock:
+            user = self._users.get(row_key)
+            return dict(user) if user is not None else None
+
+    def page(self, after=None, size=50):
+        """Up to size users in name order, starting after the name `after`; returns (users, last name or None)"""
+        self.refresh()
+        with self._lock:
+            start = bisect.bisect_right(self._names, after) if after is not None else 0
+            names = self._names[start:start + size]
+            users = [dict(self._users[name]) for name in names]
+            more = start + size < len(self._names)
+        return users, (names[-1] if more and names else None)
+
+    def age_range(self, low, high):
+        """Users aged low to high inclusive, youngest first"""
+        self.refresh()
+        with self._lock:
+            start = bisect.bisect_left(self._ages, (low,))
+            end = bisect.bisect_left(self._ages, (high + 1,))
+            return [dict(self._users[name]) for _, name in self._ages[start:end]]
+
+    def all(self):
+        """Every user in name order, and the version they were read at"""
+        self.refresh()
+        with self._lock:
+            return [dict(self._users[name]) for name in self._names], self.version
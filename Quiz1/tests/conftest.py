@@ -0,0 +1,12 @@
+"""The modules live at the top of Quiz1, so that directory goes on sys.path.
+
+app.py runs on the in-memory storage stand-in, set up before it is first imported.
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ['STORAGE_BACKEND'] = 'memory'
+os.environ['MEMORY_STORAGE_LATENCY_MS'] = '0'
+os.environ['IMAGE_CACHE_DIR'] = tempfile.mkdtemp(prefix='q1-tests-images-')
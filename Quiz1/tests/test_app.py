@@ -0,0 +1,33 @@
+import re
+
+import pytest
+
+
+@pytest.fixture
+def client():
+    import app
+    return app.app.test_client()
+
+
+def status(response):
+    """(css class, message) of a status page"""
+    return re.search(r'class="status (\w+)">\s*(.*?)\s*</div>', response.get_data(as_text=True), re.S).groups()
+
+
+def test_update_user_shows_the_name_as_text(client):
+    unchanged = client.post('/update_user', data={'user_name': '{{7*8}}', 'etag': 'x', 'class': 'a', 'original_class': 'a'})
+    assert status(unchanged) == ('success', "Success: No changes to save for user &#39;{{7*8}}&#39;")
+
+    missing = client.post('/update_user', data={'user_name': '<b>{{7*8}}</b>', 'etag': 'W/"x"', 'class': 'b'})
+    assert status(missing) == ('error', "Error: User &#39;&lt;b&gt;{{7*8}}&lt;/b&gt;&#39; not found - they may have been removed")
+
+
+def test_bulk_add_users_shows_rejected_names_as_text(client):
+    response = client.post('/bulk_add_users', data={'users': '{{7*7}},x'})
+    assert status(response) == ('error', "Error: Added 0 users, 1 not added ({{7*7}}: age must be a whole number)")
+
+
+def test_add_user_shows_the_name_as_text(client):
+    form = {'new_name': '{{7*6}}', 'new_age': '20', 'new_class': '1', 'new_comments': ''}
+    assert status(client.post('/add_user', data=form)) == ('success', "Success: Added new user &#39;{{7*6}}&#39; successfully")
+    assert status(client.post('/add_user', data=form))[1].startswith("Error: User &#39;{{7*6}}&#39; already exists")
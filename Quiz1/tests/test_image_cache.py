@@ -0,0 +1,112 @@
+import io
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from image_cache import ImageCache
+
+
+def jpeg(width, height):
+    data = io.BytesIO()
+    Image.new('RGB', (width, height), 'red').save(data, 'JPEG')
+    return data.getvalue()
+
+
+class Blobs:
+    """fetch and version callables over a dict of pictures; each call is counted"""
+
+    def __init__(self, **pictures):
+        self.pictures = pictures
+        self.etags = {name: 1 for name in pictures}
+        self.fetches = 0
+        self.version_checks = 0
+
+    def fetch(self, name):
+        self.fetches += 1
+        return self.pictures[name]
+
+    def version(self, name):
+        self.version_checks += 1
+        if name not in self.pictures:
+            raise FileNotFoundError(name)
+        return self.etags[name]
+
+    def replace(self, name, data):
+        self.pictures[name] = data
+        self.etags[name] += 1
+
+
+def test_resized_variants_are_cached_and_survive_a_restart(tmp_path):
+    blobs = Blobs(**{'a.jpg': jpeg(800, 600)})
+    cache = ImageCache(str(tmp_path), blobs.fetch, blobs.version)
+    small = cache.get('a.jpg', 100)
+    assert Image.open(io.BytesIO(small.read())).size == (100, 75)
+    assert cache.get('a.jpg', 100).etag == small.etag
+    assert blobs.fetches == 1
+
+    restarted = ImageCache(str(tmp_path), blobs.fetch, blobs.version)
+    assert restarted.get('a.jpg', 100).etag == small.etag
+    assert blobs.fetches == 1
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    blobs = Blobs(**{f'{n}.jpg': bytes([n]) * 1000 for n in range(11)})
+    cache = ImageCache(str(tmp_path), blobs.fetch, blobs.version, max_bytes=10000)
+    cache.get('0.jpg')
+    for n in range(1, 11):
+        cache.get(f'{n}.jpg')
+        cache.get('0.jpg')  # Kept in use, so 1.jpg is the oldest when the cache fills
+    assert cache.stats() == {'files': 10, 'bytes': 10000, 'max_bytes': 10000}
+    fetches = blobs.fetches
+    cache.get('0.jpg')
+    cache.get('10.jpg')
+    assert blobs.fetches == fetches
+    cache.get('1.jpg')
+    assert blobs.fetches == fetches + 1
+
+
+def test_replaced_blob_is_fetched_again_after_revalidation(tmp_path):
+    blobs = Blobs(**{'a.jpg': jpeg(800, 600)})
+    cache = ImageCache(str(tmp_path), blobs.fetch, blobs.version, revalidate_seconds=0)
+    first = cache.get('a.jpg')
+    blobs.replace('a.jpg', jpeg(400, 300))
+    second = cache.get('a.jpg')
+    assert second.etag != first.etag
+    assert second.read() == blobs.pictures['a.jpg']
+
+    within = ImageCache(str(tmp_path), blobs.fetch, blobs.version, revalidate_seconds=3600)
+    within.get('a.jpg')
+    within.get('a.jpg')
+    assert blobs.version_checks == 3
+
+
+def test_concurrent_requests_share_one_fetch_even_when_not_kept(tmp_path):
+    original = jpeg(1600, 1200)
+    blobs = Blobs(**{'big.jpg': original})
+    release = threading.Event()
+    fetch = blobs.fetch
+    # Too big to keep, so only the shared in-flight result can save a second fetch
+    cache = ImageCache(str(tmp_path), lambda name: (release.wait(5), fetch(name))[1], blobs.version,
+                       max_bytes=len(original) * 5)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('big.jpg'))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.2)  # Let every thread reach the cache and wait on the first fetch
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(results) == 4
+    assert all(result.path is None and result.read() == original for result in results)
+    assert blobs.fetches == 1
+    assert cache.stats()['files'] == 0
+
+
+def test_missing_picture_raises(tmp_path):
+    blobs = Blobs()
+    cache = ImageCache(str(tmp_path), blobs.fetch, blobs.version)
+    with pytest.raises(FileNotFoundError):
+        cache.get('missing.jpg', 100)
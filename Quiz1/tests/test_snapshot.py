@@ -0,0 +1,85 @@
+from snapshot import UserSnapshot
+
+
+def user(name, age, **fields):
+    return {'PartitionKey': 'quiz1', 'RowKey': name, 'name': name, 'age': age, **fields}
+
+
+class Table:
+    """A load() for UserSnapshot; during() runs while the query is in flight"""
+
+    def __init__(self, *users):
+        self.users = {entry['RowKey']: entry for entry in users}
+        self.during = None
+        self.loads = 0
+
+    def __call__(self):
+        self.loads += 1
+        rows = [dict(entry) for entry in self.users.values()]
+        if self.during:
+            during, self.during = self.during, None
+            during()
+        return rows
+
+
+def test_reads_come_from_one_load_until_invalidated():
+    table = Table(user('bob', 30), user('ada', 20), user('cy', 40))
+    snapshot = UserSnapshot(table, ttl=60)
+    assert [entry['RowKey'] for entry in snapshot.page(size=2)[0]] == ['ada', 'bob']
+    assert snapshot.page(after='bob', size=2) == ([snapshot.get('cy')], None)
+    assert [entry['RowKey'] for entry in snapshot.age_range(25, 40)] == ['bob', 'cy']
+    assert table.loads == 1
+
+    table.users['dee'] = user('dee', 25)
+    snapshot.invalidate()
+    assert snapshot.get('dee') is not None
+    assert table.loads == 2
+
+
+def test_put_merge_and_remove_patch_the_copy():
+    snapshot = UserSnapshot(Table(user('ada', 20)), ttl=60)
+    snapshot.refresh()
+    snapshot.put(user('bob', 50), etag='e1')
+    snapshot.merge({'RowKey': 'ada', 'age': 60})
+    snapshot.merge({'RowKey': 'nobody', 'age': 1})
+    assert snapshot.get('bob')['_etag'] == 'e1'
+    assert [entry['RowKey'] for entry in snapshot.age_range(50, 60)] == ['bob', 'ada']
+    assert snapshot.get('nobody') is None
+
+    snapshot.remove('ada')
+    assert snapshot.all()[0] == [snapshot.get('bob')]
+    assert snapshot.age_range(0, 100) == [snapshot.get('bob')]
+
+
+def test_writes_made_during_a_reload_are_replayed():
+    table = Table(user('ada', 20), user('bob', 30))
+    snapshot = UserSnapshot(table, ttl=60)
+    snapshot.refresh()
+    snapshot.invalidate()
+
+    def concurrent_writes():
+        # The query has already read the old rows when these land
+        snapshot.put(user('cy', 40))
+        snapshot.merge({'RowKey': 'ada', 'age': 21})
+        snapshot.remove('bob')
+    table.during = concurrent_writes
+
+    users, _ = snapshot.all()
+    assert [(entry['RowKey'], entry['age']) for entry in users] == [('ada', 21), ('cy', 40)]
+
+
+def test_listeners_see_every_change():
+    table = Table(user('ada', 20))
+    snapshot = UserSnapshot(table, ttl=60)
+    snapshot.refresh()
+    seen = []
+    snapshot.subscribe(lambda row_key, entry: seen.append((row_key, entry and entry['age'])))
+    assert seen == [('ada', 20)]
+
+    snapshot.put(user('bob', 30))
+    snapshot.remove('bob')
+    del table.users['ada']
+    table.users['cy'] = user('cy', 40)
+    snapshot.invalidate()
+    snapshot.refresh()
+    assert seen[1:] == [('bob', 30), ('bob', None), ('ada', None), ('cy', 40)]